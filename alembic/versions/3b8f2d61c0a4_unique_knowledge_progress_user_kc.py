@@ -0,0 +1,50 @@
+"""unique knowledge_progress per user and KC
+
+Revision ID: 3b8f2d61c0a4
+Revises: fcfcbda4b7c3
+Create Date: 2026-10-18 10:12:31.406218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b8f2d61c0a4'
+down_revision: Union[str, Sequence[str], None] = 'fcfcbda4b7c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema: one knowledge_progress row per (user_id, kc_id)."""
+
+    # 1. Drop duplicates left by concurrent first submits, keeping the most-attempted row
+    op.execute(
+        """
+        DELETE FROM knowledge_progress kp
+        USING (
+            SELECT id,
+                   row_number() OVER (
+                       PARTITION BY user_id, kc_id
+                       ORDER BY attempts DESC NULLS LAST, id DESC
+                   ) AS rn
+            FROM knowledge_progress
+        ) ranked
+        WHERE kp.id = ranked.id AND ranked.rn > 1
+        """
+    )
+
+    # 2. Then enforce uniqueness (the submit path upserts on it)
+    op.create_unique_constraint(
+        "uq_knowledge_progress_user_kc",
+        "knowledge_progress",
+        ["user_id", "kc_id"],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint("uq_knowledge_progress_user_kc", "knowledge_progress", type_="unique")
@@ -0,0 +1,29 @@
+"""submissions.is_correct nullable for ungraded answers
+
+Revision ID: 5e0a7c3f9b12
+Revises: d41f6b9e2a37
+Create Date: 2026-10-18 21:47:09.316582
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e0a7c3f9b12'
+down_revision: Union[str, Sequence[str], None] = 'd41f6b9e2a37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema: NULL is_correct marks an answer that could not be graded."""
+    op.alter_column("submissions", "is_correct", existing_type=sa.Integer(), nullable=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema (ungraded rows are dropped: they have no verdict to restore)."""
+    op.execute("DELETE FROM submissions WHERE is_correct IS NULL")
+    op.alter_column("submissions", "is_correct", existing_type=sa.Integer(), nullable=False)
@@ -0,0 +1,35 @@
+"""idempotency key for write-behind submissions
+
+Revision ID: 7c2e9a4d5b1f
+Revises: 3b8f2d61c0a4
+Create Date: 2026-10-18 16:40:12.118304
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e9a4d5b1f'
+down_revision: Union[str, Sequence[str], None] = '3b8f2d61c0a4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema: submissions.idempotency_key, unique when set."""
+    # Nullable, so existing rows and the synchronous insert path need no value
+    op.add_column("submissions", sa.Column("idempotency_key", sa.String(length=32), nullable=True))
+    op.create_unique_constraint(
+        "uq_submissions_idempotency_key",
+        "submissions",
+        ["idempotency_key"],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint("uq_submissions_idempotency_key", "submissions", type_="unique")
+    op.drop_column("submissions", "idempotency_key")
@@ -0,0 +1,36 @@
+"""add kc_params table for fitted BKT parameters
+
+Revision ID: d41f6b9e2a37
+Revises: 7c2e9a4d5b1f
+Create Date: 2026-10-18 18:05:47.530921
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41f6b9e2a37'
+down_revision: Union[str, Sequence[str], None] = '7c2e9a4d5b1f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema: one row of fitted slip/guess/transit per KC."""
+    op.create_table(
+        "kc_params",
+        sa.Column("kc_id", sa.Integer(), nullable=False),
+        sa.Column("slip", sa.Float(), nullable=False),
+        sa.Column("guess", sa.Float(), nullable=False),
+        sa.Column("transit", sa.Float(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+        sa.PrimaryKeyConstraint("kc_id"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("kc_params")
@@ -7,6 +7,111 @@ class Settings(BaseSettings):
     SAPLING_API_KEY: str | None = None
     DEBUG: bool = False
 
+    # Firebase token verification
+    FIREBASE_VERIFY_WORKERS: int = 4
+    TOKEN_CACHE_MAX_ENTRIES: int = 10000
+    TOKEN_CACHE_LEEWAY_SECONDS: int = 30
+    FIREBASE_LOCAL_VERIFY: bool = True
+    FIREBASE_PROJECT_ID: str | None = None
+    FIREBASE_KEYS_FILE: str | None = None   # local kid -> PEM JSON instead of Google's endpoint
+    FIREBASE_KEYS_MIN_REFRESH_SECONDS: int = 60
+    FIREBASE_CLOCK_SKEW_SECONDS: int = 0
+
+    # Server-issued session tokens (/auth/session)
+    SESSION_SECRET: str | None = None
+    SESSION_TTL_SECONDS: int = 3600
+
+    # Identity cache for get_current_user (per-worker LRU + Redis)
+    USER_CACHE_LOCAL_MAX_ENTRIES: int = 2048
+    USER_CACHE_LOCAL_TTL_SECONDS: int = 30
+    USER_CACHE_TTL_SECONDS: int = 3600
+
+    # Sapling HTTP client (one pooled client per worker)
+    SAPLING_MAX_CONNECTIONS: int = 20
+    SAPLING_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    SAPLING_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    SAPLING_HTTP2: bool = False
+    SAPLING_CONNECT_TIMEOUT: float = 3.0
+    SAPLING_READ_TIMEOUT: float = 15.0
+    SAPLING_WRITE_TIMEOUT: float = 5.0
+    SAPLING_POOL_TIMEOUT: float = 5.0
+    SAPLING_CALL_TIMEOUT: float = 8.0               # overall budget per request, whatever phase it stalls in
+
+    # Circuit breaker around Sapling
+    SAPLING_BREAKER_WINDOW: int = 50                # most recent calls considered
+    SAPLING_BREAKER_MIN_CALLS: int = 10
+    SAPLING_BREAKER_ERROR_RATE: float = 0.5
+    SAPLING_BREAKER_SLOW_CALL_SECONDS: float = 4.0
+    SAPLING_BREAKER_SLOW_RATE: float = 0.5
+    SAPLING_BREAKER_OPEN_SECONDS: float = 30.0
+    SENTENCE_NEGATIVE_TTL_SECONDS: int = 30         # how long a failed check is remembered
+
+    # Sapling request scheduler (priority queue per worker, limits shared through Redis)
+    SAPLING_WORKER_CONCURRENCY: int = 10
+    SAPLING_SHARED_LIMITS: bool = True
+    SAPLING_GLOBAL_CONCURRENCY: int = 20
+    SAPLING_GLOBAL_RPS: int = 20
+    SAPLING_BACKGROUND_SHARE: float = 0.5           # fraction of the global limits batch/prewarm may use
+    SAPLING_SLOT_LEASE_MS: int = 30000              # shared slot expiry if a worker dies holding it
+    SAPLING_SCHEDULER_POLL_MS: int = 25
+    SAPLING_QUEUE_TIMEOUT_LIVE_MS: int = 2000
+    SAPLING_QUEUE_TIMEOUT_BATCH_MS: int = 10000
+    SAPLING_QUEUE_TIMEOUT_PREWARM_MS: int = 30000
+
+    # Sentence cache prewarming from submission history
+    PREWARM_ON_STARTUP: bool = False
+    PREWARM_ON_CACHE_FORMAT_CHANGE: bool = True     # run once per sentence cache key format, even with the above off
+    PREWARM_STARTUP_DELAY_SECONDS: float = 30.0
+    PREWARM_MAX_KEYS: int = 5000
+    PREWARM_UPSTREAM_BUDGET: int = 200              # max sentences sent to Sapling per run
+    PREWARM_LOOKBACK_DAYS: int = 30
+    PREWARM_CONCURRENCY: int = 4
+
+    # Grading budget for /gameplay/submit (clients may ask for less or more via X-Request-Deadline-Ms)
+    SUBMIT_DEADLINE_MS: int = 3000
+    SUBMIT_DEADLINE_MAX_MS: int = 10000
+    BATCH_CHECK_MAX_ITEMS: int = 50                 # sentences per /gameplay/check-batch call
+
+    # Write-behind submission inserts (per-worker buffer, bulk INSERT off the request path)
+    SUBMISSION_WRITE_BEHIND: bool = True
+    SUBMISSION_FLUSH_SIZE: int = 200                # flush as soon as this many rows are buffered
+    SUBMISSION_FLUSH_INTERVAL_MS: int = 500
+    SUBMISSION_QUEUE_MAX: int = 10000               # rows buffered per worker before new ones are dropped
+    SUBMISSION_SPOOL_ENABLED: bool = False          # also XADD each row to a Redis stream until flushed
+    SUBMISSION_SPOOL_RECOVER_AGE_SECONDS: int = 120 # spooled rows older than this are presumed orphaned
+
+    # Knowledge state: "postgres" upserts per answer, "redis" keeps hashes and flushes them in batches
+    KNOWLEDGE_STATE_BACKEND: str = "postgres"
+    KNOWLEDGE_STATE_TTL_SECONDS: int = 86400        # idle state hashes expire (always flushed well before)
+    KNOWLEDGE_STATE_FLUSH_INTERVAL_SECONDS: float = 30.0
+    KNOWLEDGE_STATE_FLUSH_BATCH_USERS: int = 200    # users per batched upsert
+
+    # Micro-batching of concurrent Sapling misses
+    SAPLING_BATCH_ENABLED: bool = True
+    SAPLING_BATCH_WINDOW_MS: float = 5.0
+    SAPLING_BATCH_MAX_SENTENCES: int = 20
+    SAPLING_BATCH_MAX_CHARS: int = 4000
+
+    # Local rule-based grammar engine (runs before Sapling)
+    LOCAL_GRAMMAR_ENABLED: bool = True
+    LOCAL_GRAMMAR_LEXICON_PATH: str | None = None   # defaults to app/data/pos_lexicon.json
+    LOCAL_GRAMMAR_RULES_PATH: str | None = None     # defaults to app/data/kc_rules.json
+    ANSWER_BANK_PATH: str | None = None             # defaults to app/data/answer_bank.bin
+
+    # Single-flight for identical grammar checks across workers
+    SENTENCE_LOCK_TTL_MS: int = 15000
+    SENTENCE_LOCK_WAIT_MS: int = 3000
+    SENTENCE_LOCK_POLL_MS: int = 50
+
+    # Per-worker L1 in front of the Redis sentence cache
+    SENTENCE_L1_ENABLED: bool = True
+    SENTENCE_L1_MAX_ENTRIES: int = 5000
+    SENTENCE_L1_MAX_BYTES: int = 8 * 1024 * 1024
+    SENTENCE_L1_TTL_SECONDS: float = 300.0
+
+    # Redis sentence cache encoding
+    SENTENCE_CACHE_COMPRESS_THRESHOLD: int = 256    # zlib values larger than this (bytes)
+
     class Config:
         env_file = ".env"
 
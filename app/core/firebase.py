@@ -1,21 +1,309 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Protocol, Tuple
+
 import firebase_admin
+import httpx
+import jwt
+from cryptography.hazmat.primitives.serialization import load_pem_public_key
+from cryptography.x509 import load_pem_x509_certificate
 from firebase_admin import credentials, auth
 from app.core.config import settings
+from app.utils.ttl_cache import TTLCache
 from fastapi import HTTPException, status
 
+logger = logging.getLogger(__name__)
+
+_init_lock = threading.Lock()
+
+# Token verification may fetch Google certs over the network, so it runs in
+# its own small pool instead of on the event loop.
+_verify_executor = ThreadPoolExecutor(
+    max_workers=settings.FIREBASE_VERIFY_WORKERS,
+    thread_name_prefix="firebase-verify",
+)
+
+# sha256(token) -> decoded claims, each entry expiring at the token's `exp`
+_token_cache = TTLCache(max_entries=settings.TOKEN_CACHE_MAX_ENTRIES)
+
+
 def init_firebase():
-    if not firebase_admin._apps:
-        if not settings.FIREBASE_CREDENTIALS:
-            raise RuntimeError("FIREBASE_CREDENTIALS is not set in env")
-        cred = credentials.Certificate(settings.FIREBASE_CREDENTIALS)
-        firebase_admin.initialize_app(cred)
+    with _init_lock:
+        if not firebase_admin._apps:
+            if not settings.FIREBASE_CREDENTIALS:
+                raise RuntimeError("FIREBASE_CREDENTIALS is not set in env")
+            cred = credentials.Certificate(settings.FIREBASE_CREDENTIALS)
+            firebase_admin.initialize_app(cred)
 
 def verify_id_token(id_token: str) -> dict:
+    if _local_verifier is not None and _local_verifier.ready:
+        return _local_verifier.verify(id_token)
+
     init_firebase()
     try:
         decoded = auth.verify_id_token(id_token)
-        print("Decoded token:", decoded)  # <-- log the payload
+        logger.debug("Decoded token for uid %s", decoded.get("uid"))
         return decoded
     except Exception as exc:  
-        print("Token verification failed:", exc)
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid Firebase token") from exc
\ No newline at end of file
+        logger.warning("Token verification failed: %s", exc)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid Firebase token") from exc
+
+
+def _token_cache_key(id_token: str) -> str:
+    return hashlib.sha256(id_token.encode("utf-8")).hexdigest()
+
+
+async def verify_id_token_async(id_token: str) -> dict:
+    """Verify a Firebase ID token off the event loop, reusing cached claims until `exp`."""
+    key = _token_cache_key(id_token)
+    cached = _token_cache.get(key)
+    if cached is not None:
+        return cached
+
+    if _local_verifier is not None and _local_verifier.ready:
+        # Pure CPU with keys already in memory, no need for the thread hop
+        decoded = _local_verifier.verify(id_token)
+    else:
+        loop = asyncio.get_running_loop()
+        decoded = await loop.run_in_executor(_verify_executor, verify_id_token, id_token)
+
+    exp = decoded.get("exp")
+    if exp is not None:
+        # Stop serving the claims slightly before the token itself expires
+        ttl = float(exp) - time.time() - settings.TOKEN_CACHE_LEEWAY_SECONDS
+        _token_cache.set(key, decoded, ttl=ttl)
+    return decoded
+
+
+# -------------------------------
+# Local verifier (Google securetoken keys)
+# -------------------------------
+GOOGLE_CERTS_URL = (
+    "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+)
+
+PublicKeys = Dict[str, Any]
+
+
+class KeySource(Protocol):
+    async def fetch(self) -> Tuple[PublicKeys, Optional[float]]:
+        """Return (kid -> public key, max-age in seconds or None)."""
+        ...
+
+
+def _load_public_key(pem: str):
+    data = pem.encode("utf-8")
+    if b"BEGIN CERTIFICATE" in data:
+        return load_pem_x509_certificate(data).public_key()
+    return load_pem_public_key(data)
+
+
+def _parse_max_age(cache_control: Optional[str]) -> Optional[float]:
+    if not cache_control:
+        return None
+    match = re.search(r"max-age=(\d+)", cache_control)
+    return float(match.group(1)) if match else None
+
+
+class GoogleCertKeySource:
+    """Fetches the securetoken x509 certificates published by Google."""
+
+    def __init__(self, url: str = GOOGLE_CERTS_URL, timeout: float = 10.0):
+        self.url = url
+        self.timeout = timeout
+
+    async def fetch(self) -> Tuple[PublicKeys, Optional[float]]:
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            resp = await client.get(self.url)
+            resp.raise_for_status()
+        keys = {kid: _load_public_key(pem) for kid, pem in resp.json().items()}
+        return keys, _parse_max_age(resp.headers.get("cache-control"))
+
+
+class FileKeySource:
+    """Reads a JSON file of kid -> PEM certificate/public key (tests, load runs)."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def fetch(self) -> Tuple[PublicKeys, Optional[float]]:
+        with open(self.path, "r", encoding="utf-8") as fh:
+            raw = json.load(fh)
+        return {kid: _load_public_key(pem) for kid, pem in raw.items()}, None
+
+
+class StaticKeySource:
+    """Serves a fixed in-memory key set."""
+
+    def __init__(self, keys: PublicKeys):
+        self.keys = keys
+
+    async def fetch(self) -> Tuple[PublicKeys, Optional[float]]:
+        return dict(self.keys), None
+
+
+class LocalTokenVerifier:
+    """Verifies Firebase ID tokens against in-memory keys refreshed in the background."""
+
+    def __init__(
+        self,
+        project_id: str,
+        key_source: KeySource,
+        min_refresh_seconds: float = 60.0,
+        max_refresh_seconds: float = 6 * 3600.0,
+        clock_skew_seconds: int = 0,
+    ):
+        self.project_id = project_id
+        self.issuer = f"https://securetoken.google.com/{project_id}"
+        self.key_source = key_source
+        self.min_refresh_seconds = min_refresh_seconds
+        self.max_refresh_seconds = max_refresh_seconds
+        self.clock_skew_seconds = clock_skew_seconds
+
+        self._keys: PublicKeys = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self.last_refresh: Optional[float] = None
+        self.refresh_failures = 0
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._keys)
+
+    async def refresh(self) -> float:
+        """Reload keys from the source and return the delay until the next refresh."""
+        keys, max_age = await self.key_source.fetch()
+        if not keys:
+            raise RuntimeError("Key source returned no keys")
+        self._keys = keys
+        self.last_refresh = time.time()
+        delay = max_age if max_age is not None else self.max_refresh_seconds
+        delay = max(self.min_refresh_seconds, min(self.max_refresh_seconds, delay))
+        logger.info("Loaded %d Firebase public keys, next refresh in %.0fs", len(keys), delay)
+        return delay
+
+    async def _refresh_loop(self, delay: float) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                delay = await self.refresh()
+            except Exception as exc:
+                # Keep serving the previous keys and retry soon
+                self.refresh_failures += 1
+                logger.warning("Firebase key refresh failed: %s", exc)
+                delay = self.min_refresh_seconds
+
+    async def start(self) -> None:
+        delay = await self.refresh()
+        self._task = asyncio.create_task(self._refresh_loop(delay))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _request_refresh(self) -> None:
+        # Rate-limited: only wake the loop if the keys are older than the minimum interval
+        if self.last_refresh is None or time.time() - self.last_refresh >= self.min_refresh_seconds:
+            self._wakeup.set()
+
+    def verify(self, id_token: str) -> dict:
+        """Validate signature and Firebase claims. No I/O."""
+        try:
+            header = jwt.get_unverified_header(id_token)
+            if header.get("alg") != "RS256":
+                raise jwt.InvalidTokenError("Unexpected signing algorithm")
+            key = self._keys.get(header.get("kid"))
+            if key is None:
+                # Keys may have rotated; pick them up in the background
+                self._request_refresh()
+                raise jwt.InvalidTokenError("Unknown key id")
+
+            decoded = jwt.decode(
+                id_token,
+                key,
+                algorithms=["RS256"],
+                audience=self.project_id,
+                issuer=self.issuer,
+                leeway=self.clock_skew_seconds,
+                options={"require": ["exp", "iat", "aud", "iss", "sub"]},
+            )
+            sub = decoded.get("sub")
+            if not isinstance(sub, str) or not sub or len(sub) > 128:
+                raise jwt.InvalidTokenError("Invalid subject")
+            auth_time = decoded.get("auth_time")
+            if auth_time is not None and auth_time > time.time() + self.clock_skew_seconds:
+                raise jwt.InvalidTokenError("auth_time is in the future")
+        except jwt.PyJWTError as exc:
+            logger.warning("Token verification failed: %s", exc)
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid Firebase token") from exc
+
+        decoded["uid"] = sub
+        return decoded
+
+
+_local_verifier: Optional[LocalTokenVerifier] = None
+
+
+def _resolve_project_id() -> Optional[str]:
+    if settings.FIREBASE_PROJECT_ID:
+        return settings.FIREBASE_PROJECT_ID
+    if settings.FIREBASE_CREDENTIALS:
+        try:
+            with open(settings.FIREBASE_CREDENTIALS, "r", encoding="utf-8") as fh:
+                return json.load(fh).get("project_id")
+        except (OSError, ValueError):
+            return None
+    return None
+
+
+async def start_token_verifier(key_source: Optional[KeySource] = None) -> None:
+    """Load public keys and start the background refresh (called on app startup)."""
+    global _local_verifier
+    if not settings.FIREBASE_LOCAL_VERIFY:
+        return
+
+    project_id = _resolve_project_id()
+    if not project_id:
+        logger.warning("Firebase project id unknown; falling back to firebase_admin verification")
+        return
+
+    if key_source is None:
+        if settings.FIREBASE_KEYS_FILE:
+            key_source = FileKeySource(settings.FIREBASE_KEYS_FILE)
+        else:
+            key_source = GoogleCertKeySource()
+
+    verifier = LocalTokenVerifier(
+        project_id,
+        key_source,
+        min_refresh_seconds=settings.FIREBASE_KEYS_MIN_REFRESH_SECONDS,
+        clock_skew_seconds=settings.FIREBASE_CLOCK_SKEW_SECONDS,
+    )
+    try:
+        await verifier.start()
+    except Exception as exc:
+        logger.warning("Could not load Firebase public keys (%s); using firebase_admin", exc)
+        return
+    _local_verifier = verifier
+
+
+async def stop_token_verifier() -> None:
+    global _local_verifier
+    if _local_verifier is not None:
+        await _local_verifier.stop()
+        _local_verifier = None
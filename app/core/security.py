@@ -1,8 +1,12 @@
 from fastapi import Depends, HTTPException, status, Header
-from app.core.firebase import verify_id_token
+from app.core.firebase import verify_id_token_async
+from app.core.session import is_session_token, verify_session_token
 from app.core.db import get_db
 from sqlalchemy.ext.asyncio import AsyncSession
 from app import crud
+from app.models.user import User
+from app.schemas.auth import SessionUser
+from app.utils.user_cache import cache_user, get_cached_user
 # from app.schemas.user import UserOut    
 from typing import Optional
 
@@ -18,16 +22,36 @@ async def get_current_user(authorization: Optional[str] = Header(None), db: Asyn
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid auth scheme")
     
     token = authorization.split(" ", 1)[1]
-    decoded = verify_id_token(token)
+
+    # Server-issued session token: HMAC check only, no Firebase or DB work
+    if is_session_token(token):
+        claims = verify_session_token(token)
+        if not claims:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired session token")
+        return SessionUser(id=claims["sub"], firebase_uid=claims["uid"])
+
+    decoded = await verify_id_token_async(token)
     uid = decoded.get("uid")
     if not uid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
     
-    user = await crud.user.get_by_firebase_uid(db, uid)
+    # Identity snapshot from the per-worker LRU / Redis, DB only on a miss
+    cached = await get_cached_user(uid)
+    if cached is not None:
+        return cached
+
+    # find or create in one round trip
+    user, _ = await crud.user.get_or_create_from_firebase(db, uid, decoded.get("email"), decoded.get("name"))
+    return await cache_user(user)
+    # return DummyUser()
+
+
+async def get_current_db_user(current_user=Depends(get_current_user), db: AsyncSession = Depends(get_db)) -> User:
+    """Like get_current_user, but always returns the full `User` row (for profile reads/writes)."""
+    # get_current_user hands out snapshots (UserOut / SessionUser), not ORM rows
+    user = await crud.user.get_by_id(db, current_user.id)
     if not user:
-        # create new user
-        user = await crud.user.create_from_firebase(db, uid, decoded.get("email"), decoded.get("name"))
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User no longer exists")
     return user
-    # return DummyUser()
 
-# NOTE : The code is commented for testing purposes.
\ No newline at end of file
+# NOTE : The code is commented for testing purposes.
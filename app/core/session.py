@@ -0,0 +1,63 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+from typing import Optional
+
+from app.core.config import settings
+
+SESSION_TOKEN_PREFIX = "gh1."
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: str) -> str:
+    digest = hmac.new(settings.SESSION_SECRET.encode("utf-8"), payload.encode("ascii"), hashlib.sha256).digest()
+    return _b64encode(digest)
+
+
+def session_tokens_enabled() -> bool:
+    return bool(settings.SESSION_SECRET)
+
+
+def is_session_token(token: str) -> bool:
+    return token.startswith(SESSION_TOKEN_PREFIX)
+
+
+def issue_session_token(user_id: int, firebase_uid: str) -> tuple[str, int]:
+    """Return a signed session token for the user and its expiry (unix seconds)."""
+    expires_at = int(time.time()) + settings.SESSION_TTL_SECONDS
+    claims = {"sub": user_id, "uid": firebase_uid, "exp": expires_at}
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return f"{SESSION_TOKEN_PREFIX}{payload}.{_sign(payload)}", expires_at
+
+
+def verify_session_token(token: str) -> Optional[dict]:
+    """Return the token claims if the signature is valid and it has not expired."""
+    if not session_tokens_enabled() or not is_session_token(token):
+        return None
+    # Tokens we issue are pure ASCII; anything else would break _sign and compare_digest
+    if not token.isascii():
+        return None
+    try:
+        payload, signature = token[len(SESSION_TOKEN_PREFIX):].split(".", 1)
+    except ValueError:
+        return None
+    if not hmac.compare_digest(signature, _sign(payload)):
+        return None
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if not isinstance(claims, dict) or not isinstance(claims.get("exp"), (int, float)):
+        return None
+    if claims["exp"] <= time.time():
+        return None
+    return claims
@@ -1,7 +1,29 @@
+from sqlalchemy import func, literal, true
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from app.services.bkt import update_bkt
-from app.models.knowledge import KnowledgeProgress
+from app.services.bkt import update_bkt, update_bkt_sql
+from app.models.knowledge import KCParams, KnowledgeProgress
+
+# Parameters for a KC the user has never attempted (slip/guess/transit only
+# until the refit job has stored fitted ones in kc_params)
+DEFAULT_P_KNOW = 0.2
+DEFAULT_SLIP = 0.1
+DEFAULT_GUESS = 0.2
+DEFAULT_TRANSIT = 0.15
+
+def _kc_params_query(kc_id: int):
+    """One row (slip, guess, transit): the KC's fitted parameters, or the defaults."""
+    return select(
+        func.coalesce(func.max(KCParams.slip), DEFAULT_SLIP).label("slip"),
+        func.coalesce(func.max(KCParams.guess), DEFAULT_GUESS).label("guess"),
+        func.coalesce(func.max(KCParams.transit), DEFAULT_TRANSIT).label("transit"),
+    ).where(KCParams.kc_id == kc_id)
+
+async def get_kc_params(db: AsyncSession, kc_id: int) -> tuple[float, float, float]:
+    """(slip, guess, transit) a new knowledge row for this KC starts with."""
+    slip, guess, transit = (await db.execute(_kc_params_query(kc_id))).one()
+    return float(slip), float(guess), float(transit)
 
 async def update_knowledge(db: AsyncSession, user_id: int, kc_id: int, is_correct: bool):
     q = select(KnowledgeProgress).where(
@@ -20,15 +42,16 @@ async def update_knowledge(db: AsyncSession, user_id: int, kc_id: int, is_correc
         kp.p_know = update_bkt(kp.p_know, is_correct, kp.slip, kp.guess, kp.transit)
 
     else:
+        slip, guess, transit = await get_kc_params(db, kc_id)
         kp = KnowledgeProgress(
             user_id=user_id,
             kc_id=kc_id,
             attempts=1,
             correct=1 if is_correct else 0,
-            p_know=update_bkt(0.2, is_correct, 0.1, 0.2, 0.15),
-            slip=0.1,
-            guess=0.2,
-            transit=0.15
+            p_know=update_bkt(DEFAULT_P_KNOW, is_correct, slip, guess, transit),
+            slip=slip,
+            guess=guess,
+            transit=transit
         )
         db.add(kp)
 
@@ -43,6 +66,15 @@ async def get_user_kcs(db: AsyncSession, user_id: int):
     res = await db.execute(q)
     return res.scalars().all()
 
+async def get_knowledge_row(db: AsyncSession, user_id: int, kc_id: int):
+    result = await db.execute(
+        select(KnowledgeProgress).where(
+            KnowledgeProgress.user_id == user_id,
+            KnowledgeProgress.kc_id == kc_id,
+        )
+    )
+    return result.scalars().first()
+
 async def get_knowledge_value(db: AsyncSession, user_id: int, kc_id: str) -> float:
     from app.models.knowledge import KnowledgeProgress
     result = await db.execute(
@@ -52,4 +84,60 @@ async def get_knowledge_value(db: AsyncSession, user_id: int, kc_id: str) -> flo
         )
     )
     value = result.scalar_one_or_none()
-    return float(value) if value is not None else 0.5
\ No newline at end of file
+    return float(value) if value is not None else 0.5
+
+async def upsert_knowledge(db: AsyncSession, user_id: int, kc_id: int, is_correct: bool) -> float:
+    """Apply one BKT step in a single INSERT ... ON CONFLICT DO UPDATE and return the new p_know.
+
+    A new row takes the KC's fitted parameters from kc_params (read in the
+    same statement). The update reads the row's current values under the
+    row lock, so concurrent answers for the same user/KC are serialized,
+    not lost. Does not commit.
+    """
+    params = _kc_params_query(kc_id).subquery("params")
+    new_row = select(
+        literal(user_id),
+        literal(kc_id),
+        literal(1),
+        literal(1 if is_correct else 0),
+        update_bkt_sql(DEFAULT_P_KNOW, is_correct, params.c.slip, params.c.guess, params.c.transit),
+        params.c.slip,
+        params.c.guess,
+        params.c.transit,
+    ).where(true())  # keeps INSERT ... SELECT ... ON CONFLICT unambiguous for SQLite's parser
+    stmt = pg_insert(KnowledgeProgress).from_select(
+        ["user_id", "kc_id", "attempts", "correct", "p_know", "slip", "guess", "transit"], new_row,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[KnowledgeProgress.user_id, KnowledgeProgress.kc_id],
+        set_={
+            "attempts": KnowledgeProgress.attempts + 1,
+            "correct": KnowledgeProgress.correct + (1 if is_correct else 0),
+            # use stored slip, guess, transit
+            "p_know": update_bkt_sql(
+                KnowledgeProgress.p_know,
+                is_correct,
+                KnowledgeProgress.slip,
+                KnowledgeProgress.guess,
+                KnowledgeProgress.transit,
+            ),
+        },
+    ).returning(KnowledgeProgress.p_know)
+    result = await db.execute(stmt)
+    return float(result.scalar_one())
+
+async def upsert_knowledge_states(db: AsyncSession, rows: list[dict]) -> None:
+    """Write absolute BKT state for many (user_id, kc_id) pairs in one multi-row upsert. Does not commit.
+
+    Each pair may appear only once per call. slip/guess/transit are only
+    written for new rows: existing rows keep theirs, which the refit job
+    owns and may have changed since the state was read.
+    """
+    if not rows:
+        return
+    stmt = pg_insert(KnowledgeProgress).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[KnowledgeProgress.user_id, KnowledgeProgress.kc_id],
+        set_={column: stmt.excluded[column] for column in ("attempts", "correct", "p_know")},
+    )
+    await db.execute(stmt)
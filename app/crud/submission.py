@@ -1,22 +1,56 @@
-from copy import deepcopy
+from typing import Any, Dict, List
 
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.submission import Submission
+from app.utils.redis_cache import SENTENCE_KEY_FORMAT
+
+
+def submission_values(user_id: int, kc_id: int, sentence: str, feedback: dict) -> Dict[str, Any]:
+    """Column values for one submissions row.
+
+    The feedback dict is copied one level deep only: the grading result is
+    never mutated after it is returned, so nested lists can be shared. It is
+    stamped with the sentence cache key format it was graded under, so the
+    prewarm job can tell verdicts safe to reuse from ones served by an
+    older, lossy key.
+    """
+    stored = {k: v for k, v in feedback.items() if k != "from_cache"}
+    stored["cache_key_format"] = SENTENCE_KEY_FORMAT
+    ungraded = "upstream_error" in feedback
+    if ungraded:
+        stored["ungraded"] = True
+    return {
+        "user_id": user_id,
+        "kc_id": kc_id,
+        "sentence": sentence,
+        # NULL: grading failed or missed its deadline, so there is no verdict to count
+        "is_correct": None if ungraded else 1 if feedback.get("is_correct") else 0,
+        "feedback": stored,
+    }
 
 
 async def create_submission(db: AsyncSession, user_id: int, kc_id: int, sentence: str, feedback: dict):
-    feedback_payload = deepcopy(feedback)
-    feedback_payload.pop("from_cache", None)
-
-    submission = Submission(
-        user_id=user_id,
-        kc_id=kc_id,
-        sentence=sentence,
-        is_correct=1 if feedback.get("is_correct") else 0,
-        feedback=feedback_payload,
-    )
+    submission = Submission(**submission_values(user_id, kc_id, sentence, feedback))
     db.add(submission)
     await db.commit()
     await db.refresh(submission)
     return submission
+
+
+async def add_submission(db: AsyncSession, user_id: int, kc_id: int, sentence: str, feedback: dict) -> None:
+    """Queue the submission INSERT in the current transaction (no commit, no refresh)."""
+    await db.execute(insert(Submission).values(**submission_values(user_id, kc_id, sentence, feedback)))
+
+
+async def insert_submissions(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    """Bulk insert prepared rows (batched multi-row INSERT). Does not commit.
+
+    Rows whose idempotency_key is already stored are skipped, so a batch
+    may safely be written more than once.
+    """
+    if rows:
+        stmt = pg_insert(Submission).on_conflict_do_nothing(index_elements=[Submission.idempotency_key])
+        await db.execute(stmt, rows)
@@ -1,7 +1,9 @@
 from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.user import User
 from app.schemas.user import UserUpdate
+from app.utils.user_cache import invalidate_user
 from typing import Optional
 
 
@@ -17,21 +19,32 @@ async def get_by_id(db: AsyncSession, id: int) -> Optional[User]:
     return result.scalars().first()
 
 
-async def create_from_firebase(db: AsyncSession, uid: str, email: str, name: str | None):
-    # if not name:  # fallback if Firebase doesn't provide one
-    #     name = email.split("@")[0]  # e.g., use prefix of email
-    #     # or just name = "Player"
-
-    new_user = User(
-        firebase_uid=uid,
-        email=email,
-        display_name=name,
-        grade_level=None,  # will be set later via profile completion
+async def get_or_create_from_firebase(
+    db: AsyncSession, uid: str, email: str, name: str | None
+) -> tuple[User, bool]:
+    """Fetch the user, creating it if missing. Returns (user, is_new)."""
+    user = await get_by_firebase_uid(db, uid)
+    if user is not None:
+        return user, False
+
+    stmt = (
+        pg_insert(User)
+        .values(
+            firebase_uid=uid,
+            email=email,
+            display_name=name,
+            grade_level=None,  # will be set later via profile completion
+        )
+        .on_conflict_do_nothing(index_elements=[User.firebase_uid])
+        .returning(User)
     )
-    db.add(new_user)
+    user = (await db.execute(stmt)).scalars().first()
     await db.commit()
-    await db.refresh(new_user)
-    return new_user
+    if user is not None:
+        return user, True
+
+    # a concurrent login inserted the row between our SELECT and INSERT
+    return await get_by_firebase_uid(db, uid), False
 
 
 async def update_user(db: AsyncSession, user: User, updates: UserUpdate) -> User:
@@ -40,4 +53,5 @@ async def update_user(db: AsyncSession, user: User, updates: UserUpdate) -> User
     db.add(user)
     await db.commit()
     await db.refresh(user)
+    await invalidate_user(user.firebase_uid)
     return user
\ No newline at end of file
@@ -1,8 +1,14 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import auth, gameplay, users, adaptive, inventory, adventure, knowledge
+from app.routers import auth, gameplay, users, adaptive, inventory, adventure, knowledge, stats
 from app.core.config import settings
+from app.core.firebase import start_token_verifier, stop_token_verifier
+from app.services.grammar import close_http_client, init_http_client, load_answer_bank, load_local_engine
+from app.services.knowledge_state import start_knowledge_flusher, stop_knowledge_flusher
+from app.services.prewarm import start_prewarm_job, stop_prewarm_job
+from app.services.submission_writer import start_submission_writer, stop_submission_writer
 from app.utils.logger import setup_grammar_cache_logger
+from app.utils.user_cache import start_user_cache_listener, stop_user_cache_listener
 import logging
 
 
@@ -37,15 +43,30 @@ def create_app() -> FastAPI:
     app.include_router(inventory.router)
     app.include_router(adventure.router)
     app.include_router(knowledge.router)
+    app.include_router(stats.router)
 
     # --- Events ---
     @app.on_event("startup")
     async def on_startup():
+        await start_token_verifier()
+        start_user_cache_listener()
+        await init_http_client()
+        load_local_engine()
+        load_answer_bank()
+        start_submission_writer()
+        start_knowledge_flusher()
+        start_prewarm_job()
         logger.info("🚀 Grammar Heroes Backend started successfully.")
 
     @app.on_event("shutdown")
     async def on_shutdown():
         logger.info("🛑 Shutting down Grammar Heroes Backend.")
+        await stop_prewarm_job()
+        await stop_submission_writer()
+        await stop_knowledge_flusher()
+        await stop_token_verifier()
+        await stop_user_cache_listener()
+        await close_http_client()
 
     # --- Health Check Endpoint ---
     @app.get("/", tags=["Health"])
@@ -3,6 +3,6 @@ from .user import User
 # from .progress import Progress
 from .submission import Submission
 from .inventory import InventoryItem
-from .knowledge import KnowledgeProgress
+from .knowledge import KnowledgeProgress, KCParams
 from .adventure import Adventure
 # later: from .knowledge import Knowledge, etc.
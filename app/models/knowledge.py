@@ -1,8 +1,13 @@
-from sqlalchemy import Column, Integer, ForeignKey, Float
+from sqlalchemy import Column, Integer, ForeignKey, Float, UniqueConstraint, DateTime
+from sqlalchemy.sql import func
 from app.core.db import Base
 
 class KnowledgeProgress(Base):
     __tablename__ = "knowledge_progress"
+    __table_args__ = (
+        # one row per user/KC; the submit path upserts on it
+        UniqueConstraint("user_id", "kc_id", name="uq_knowledge_progress_user_kc"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -16,4 +21,16 @@ class KnowledgeProgress(Base):
     p_know = Column(Float, default=0.2) # prior knowledge (P(L₀))
     transit = Column(Float, default=0.15) # learning rate (P(T))
     slip = Column(Float, default=0.1) # mistake probability (P(S))
-    guess = Column(Float, default=0.2) # lucky guess probability (P(G))
\ No newline at end of file
+    guess = Column(Float, default=0.2) # lucky guess probability (P(G))
+
+
+class KCParams(Base):
+    """Fitted BKT parameters per KC (written by the refit job); new knowledge rows start from these."""
+    __tablename__ = "kc_params"
+
+    kc_id = Column(Integer, primary_key=True)
+    slip = Column(Float, nullable=False)
+    guess = Column(Float, nullable=False)
+    transit = Column(Float, nullable=False)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
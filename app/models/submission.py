@@ -1,16 +1,21 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, JSON
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, JSON, UniqueConstraint
 from sqlalchemy.sql import func
 from app.core.db import Base
 
 class Submission(Base):
     __tablename__ = "submissions"
+    __table_args__ = (
+        # write-behind rows may be inserted twice (flush retry + spool replay); the key dedupes them
+        UniqueConstraint("idempotency_key", name="uq_submissions_idempotency_key"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     kc_id = Column(Integer, nullable=False)
 
     sentence = Column(String, nullable=False)
-    is_correct = Column(Integer, nullable=False, default=0) # store as 0/1
+    is_correct = Column(Integer, nullable=True) # store as 0/1; NULL = ungraded (no default: an ORM default would turn NULL into 0)
     feedback = Column(JSON, nullable=True) # { "error_indices": [...] }
 
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    idempotency_key = Column(String(32), nullable=True) # set by the write-behind buffer
\ No newline at end of file
@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.db import get_db
 from app.core.security import get_current_user
-from app.crud import knowledge as knowledge_crud
+from app.services import knowledge_state
 from app.services.adaptive import select_worst_kc
 from app.schemas.adaptive import AdaptiveKCResponse
 
@@ -14,6 +14,6 @@ async def get_next_kc(
     db: AsyncSession = Depends(get_db), 
     current_user=Depends(get_current_user)
 ):
-    kcs = await knowledge_crud.get_user_kcs(db, current_user.id)
+    kcs = await knowledge_state.get_user_knowledge(db, current_user.id)
     kc_id = select_worst_kc(kcs, eligible_kc_ids)
     return {"kc_id": kc_id}
\ No newline at end of file
@@ -1,10 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
-from app.core.firebase import verify_id_token
+from app.core.firebase import verify_id_token_async
 from app.core.db import get_db
 from app import crud
-from app.core.security import get_current_user
+from app.core.security import get_current_db_user, get_current_user
+from app.core.session import issue_session_token, session_tokens_enabled
+from app.schemas.auth import SessionTokenOut
 from app.schemas.user import UserOut
+from app.services.knowledge_state import flush_user
 from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -15,7 +18,7 @@ class TokenIn(BaseModel):
 @router.post("/firebase")
 async def firebase_login(token_in: TokenIn, db: AsyncSession = Depends(get_db)):
     # 1️⃣ Verify Firebase token
-    decoded = verify_id_token(token_in.id_token)
+    decoded = await verify_id_token_async(token_in.id_token)
     uid = decoded.get("uid")
     if not uid:
         raise HTTPException(
@@ -23,15 +26,11 @@ async def firebase_login(token_in: TokenIn, db: AsyncSession = Depends(get_db)):
             detail="Invalid token payload."
         )
 
-    # 2️⃣ Find or create user
-    user = await crud.user.get_by_firebase_uid(db, uid)
-    is_new_user = False
-    if not user:
-        # Do NOT assign a default display_name
-        user = await crud.user.create_from_firebase(
-            db, uid, decoded.get("email"), decoded.get("name")  # can be None
-        )
-        is_new_user = True
+    # 2️⃣ Find or create user (single upsert, safe against parallel first requests)
+    # Do NOT assign a default display_name
+    user, is_new_user = await crud.user.get_or_create_from_firebase(
+        db, uid, decoded.get("email"), decoded.get("name")  # can be None
+    )
 
     # 3️⃣ Decide if profile completion is needed
     # first_login is True if this is a new user OR they have no display_name yet
@@ -43,6 +42,38 @@ async def firebase_login(token_in: TokenIn, db: AsyncSession = Depends(get_db)):
     }
 
 
+@router.post("/session", response_model=SessionTokenOut)
+async def create_session(token_in: TokenIn, db: AsyncSession = Depends(get_db)):
+    """Exchange a Firebase ID token for a short-lived server session token."""
+    if not session_tokens_enabled():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Session tokens are not configured."
+        )
+
+    decoded = await verify_id_token_async(token_in.id_token)
+    uid = decoded.get("uid")
+    if not uid:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token payload."
+        )
+
+    user, _ = await crud.user.get_or_create_from_firebase(
+        db, uid, decoded.get("email"), decoded.get("name")
+    )
+
+    session_token, expires_at = issue_session_token(user.id, user.firebase_uid)
+    return {"session_token": session_token, "expires_at": expires_at}
+
+
 @router.get("/me", response_model=UserOut)
-async def me(current_user=Depends(get_current_user)):
+async def me(current_user=Depends(get_current_db_user)):
     return current_user
+
+
+@router.post("/logout")
+async def logout(current_user=Depends(get_current_user)):
+    """Write the user's Redis-held knowledge state to Postgres (no-op with the Postgres backend)."""
+    flushed = await flush_user(current_user.id)
+    return {"flushed": flushed}
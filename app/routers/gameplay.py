@@ -1,11 +1,18 @@
-from fastapi import APIRouter, Depends
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
 from app.schemas.gameplay import SubmissionCreate, SubmissionOut
+from app.schemas.sentence_cache import BatchCheckRequest, BatchCheckResponse
+from app.core.config import settings
 from app.core.db import get_db
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.security import get_current_user
-from app.services.grammar import check_sentence
+from app.services import knowledge_state
+from app.services.grammar import PRIORITY_LIVE, check_sentence, check_sentences
+from app.services.submission_writer import enqueue_submission
 from app.crud import submission as submission_crud
-from app.crud import knowledge as knowledge_crud
+from app.utils.timing import StageTimer, submit_timings
 import logging
 
 logger = logging.getLogger("uvicorn")
@@ -13,14 +20,69 @@ logging.basicConfig(level=logging.INFO)
 
 router = APIRouter(prefix="/gameplay", tags=["gameplay"])
 
+# Shown instead of the upstream error, which may quote the raw Sapling response
+UNGRADED_FEEDBACK = ["We couldn't check this sentence right now. Please try again."]
+
+
+def _grading_deadline(requested_ms: Optional[int]) -> float:
+    """Absolute loop time by which grading must finish, clamped to the server maximum."""
+    budget_ms = requested_ms if requested_ms and requested_ms > 0 else settings.SUBMIT_DEADLINE_MS
+    budget_ms = min(budget_ms, settings.SUBMIT_DEADLINE_MAX_MS)
+    return asyncio.get_running_loop().time() + budget_ms / 1000
+
+
+async def _record_answer(db: AsyncSession, user_id: int, kc_id: int, sentence: str, feedback: dict) -> float:
+    """BKT upsert and submission record; returns the new p_know.
+
+    With write-behind on, the submissions row is buffered and bulk-inserted
+    later, so only the upsert is on the request path.
+    """
+    p_know = await knowledge_state.record_answer(db, user_id, kc_id, feedback["is_correct"])
+    if not settings.SUBMISSION_WRITE_BEHIND:
+        await submission_crud.add_submission(db, user_id=user_id, kc_id=kc_id, sentence=sentence, feedback=feedback)
+    await db.commit()
+    if settings.SUBMISSION_WRITE_BEHIND:
+        await enqueue_submission(user_id, kc_id, sentence, feedback)
+    return p_know
+
+
+async def _record_ungraded(db: AsyncSession, user_id: int, kc_id: int, sentence: str, feedback: dict) -> None:
+    """Submission record only (is_correct NULL); knowledge state is left unchanged."""
+    if settings.SUBMISSION_WRITE_BEHIND:
+        await enqueue_submission(user_id, kc_id, sentence, feedback)
+    else:
+        await submission_crud.add_submission(db, user_id=user_id, kc_id=kc_id, sentence=sentence, feedback=feedback)
+        await db.commit()
+
+
 @router.post("/submit", response_model=SubmissionOut)
 async def submit_sentence(
     payload: SubmissionCreate,
+    response: Response,
     db: AsyncSession = Depends(get_db),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    x_request_deadline_ms: Optional[int] = Header(None),
 ):
-    # 1️⃣ Check grammar (cached if available)
-    feedback = await check_sentence(payload.sentence)
+    timer = StageTimer()
+
+    # 1️⃣ Check grammar (cached if available) within the request's budget. Meanwhile, in
+    # Redis mode load the KC's state hash so the BKT step after grading is one Redis call.
+    # The Postgres upsert reads its row itself, so there it is the pool checkout (and any
+    # wait for a free connection) that moves off the post-grading path
+    deadline = _grading_deadline(x_request_deadline_ms)
+    grading = asyncio.create_task(timer.time("grammar", check_sentence(payload.sentence, payload.kc_id, deadline=deadline)))
+    prior_p_know = None
+    try:
+        if knowledge_state.redis_backend():
+            prior_p_know = await timer.time(
+                "prefetch", knowledge_state.get_p_know(db, current_user.id, payload.kc_id)
+            )
+        else:
+            await timer.time("connect", db.connection())
+    except BaseException:
+        grading.cancel()
+        raise
+    feedback = await grading
     is_correct = feedback["is_correct"]
 
     if feedback.get("from_cache", False):
@@ -28,28 +90,70 @@ async def submit_sentence(
     else:
         logger.info(f"[CACHE MISS] {payload.sentence}")
 
-    # 2️⃣ Update user's knowledge using BKT
-    await knowledge_crud.update_knowledge(db, current_user.id, payload.kc_id, is_correct)
-
-    # 3️⃣ Fetch updated p_know after update
-    p_know = await knowledge_crud.get_knowledge_value(db, current_user.id, payload.kc_id)
-    if p_know is None:
-        p_know = 0.5  # fallback default
-
-    # 4️⃣ Record submission
-    submission = await submission_crud.create_submission(
-        db,
-        user_id=current_user.id,
-        kc_id=payload.kc_id,
-        sentence=payload.sentence,
-        feedback=feedback
-    )
+    if "upstream_error" in feedback:
+        # Ungraded: kept in the submission history, but not counted as a wrong answer
+        logger.warning(f"[UNGRADED] {payload.sentence}: {feedback['upstream_error']}")
+        if prior_p_know is None:
+            prior_p_know = await timer.time("prior", knowledge_state.get_p_know(db, current_user.id, payload.kc_id))
+        await timer.time("write", _record_ungraded(db, current_user.id, payload.kc_id, payload.sentence, feedback))
+        response.headers["Server-Timing"] = timer.server_timing()
+        submit_timings.record(timer)
+        return {
+            "is_correct": False,
+            "error_indices": [],
+            "feedback": UNGRADED_FEEDBACK,
+            "from_cache": False,
+            "degraded": True,
+            "p_know": float(prior_p_know),
+        }
 
-    # 5️⃣ Return data (Unity will store p_know in GameData.currentPKnow)
+    # 2️⃣ Update user's knowledge (upsert, RETURNING p_know) and record the submission
+    try:
+        p_know = await timer.time(
+            "write", _record_answer(db, current_user.id, payload.kc_id, payload.sentence, feedback)
+        )
+    except knowledge_state.KnowledgeStateUnavailable:
+        # Nothing was recorded, so the client can safely resend the answer
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Progress could not be saved. Please try again."
+        )
+    response.headers["Server-Timing"] = timer.server_timing()
+    submit_timings.record(timer)
+
+    # 3️⃣ Return data (Unity will store p_know in GameData.currentPKnow)
     return {
-        "is_correct": bool(submission.is_correct),
-        "error_indices": submission.feedback.get("error_indices", []),
-        "feedback": submission.feedback.get("feedback", []),
+        "is_correct": bool(is_correct),
+        "error_indices": feedback.get("error_indices", []),
+        "feedback": feedback.get("feedback", []),
         "from_cache": feedback.get("from_cache", False),
-        "p_know": float(p_know)
-    }
\ No newline at end of file
+        "degraded": False,
+        "p_know": p_know
+    }
+
+
+@router.post("/check-batch", response_model=BatchCheckResponse)
+async def check_batch(
+    payload: BatchCheckRequest,
+    current_user = Depends(get_current_user),
+    x_request_deadline_ms: Optional[int] = Header(None),
+):
+    """Grade several sentences at once (no knowledge update or submission record)."""
+    deadline = _grading_deadline(x_request_deadline_ms)
+    # A player is waiting on these, so they queue with /submit, not with prewarm and bank builds
+    results = await check_sentences(
+        [(item.sentence, item.kc_id) for item in payload.items], deadline=deadline, priority=PRIORITY_LIVE
+    )
+    return {
+        "results": [
+            {
+                "is_correct": bool(result["is_correct"]) and "upstream_error" not in result,
+                "error_indices": result.get("error_indices", []),
+                "feedback": UNGRADED_FEEDBACK if "upstream_error" in result else result.get("feedback", []),
+                "kc_id": item.kc_id,
+                "from_cache": result.get("from_cache", False),
+                "degraded": result.get("degraded", False),
+            }
+            for item, result in zip(payload.items, results)
+        ]
+    }
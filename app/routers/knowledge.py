@@ -5,7 +5,7 @@ from typing import List
 from app.core.db import get_db
 from app.core.security import get_current_user
 from app.schemas.knowledge import KnowledgeOut
-from app.crud import knowledge as knowledge_crud
+from app.services import knowledge_state
 
 router = APIRouter(prefix="/knowledge", tags=["knowledge"])
 
@@ -15,4 +15,4 @@ async def get_user_knowledge(
     current_user = Depends(get_current_user)
 ):
     """Return all KnowledgeComponent (KC) progress for the authenticated user."""
-    return await knowledge_crud.get_user_kcs(db, current_user.id)
+    return await knowledge_state.get_user_knowledge(db, current_user.id)
@@ -0,0 +1,37 @@
+from fastapi import APIRouter
+from app.services.grammar import grammar_stats
+from app.services.knowledge_state import knowledge_state_stats
+from app.services.submission_writer import submission_writer_stats
+from app.utils.redis_cache import sentence_cache_stats
+from app.utils.timing import submit_timings
+
+router = APIRouter(prefix="/stats", tags=["Health"])
+
+@router.get("/cache")
+async def get_cache_stats():
+    """Per-worker sentence cache counters (L1 in-memory, L2 Redis)."""
+    return sentence_cache_stats()
+
+
+@router.get("/grammar")
+async def get_grammar_stats():
+    """Per-worker grammar pipeline counters."""
+    return grammar_stats()
+
+
+@router.get("/submit")
+async def get_submit_stats():
+    """Per-worker /gameplay/submit stage timings; grammar overlaps "prefetch" (Redis mode) or "connect" (Postgres mode)."""
+    return submit_timings.as_dict()
+
+
+@router.get("/submissions")
+async def get_submission_writer_stats():
+    """Per-worker write-behind submission buffer counters."""
+    return submission_writer_stats()
+
+
+@router.get("/knowledge")
+async def get_knowledge_state_stats():
+    """Knowledge state backend and per-worker flush counters."""
+    return knowledge_state_stats()
@@ -2,24 +2,25 @@ from fastapi import APIRouter, Depends, Query, HTTPException, status
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.db import get_db
-from app.core.security import get_current_user
+from app.core.security import get_current_db_user
 from app.schemas.user import UserOut, UserUpdate
 from app.models.user import User
 from app import crud
+from app.utils.user_cache import invalidate_user
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 # --- Existing endpoints ---
 @router.get("/me", response_model=UserOut)
-async def get_me(current_user: User = Depends(get_current_user)):
+async def get_me(current_user: User = Depends(get_current_db_user)):
     return current_user
 
 @router.patch("/me", response_model=UserOut)
 async def update_me(
     updates: UserUpdate,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_current_db_user),
 ):    
     return await crud.user.update_user(db, current_user, updates)
 
@@ -39,7 +40,7 @@ class DisplayNameUpdate(BaseModel):
 async def update_display_name(
     payload: DisplayNameUpdate,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_db_user)
 ):
     # Check uniqueness
     existing = await db.scalar(select(User).where(User.display_name == payload.display_name))
@@ -50,5 +51,6 @@ async def update_display_name(
     current_user.display_name = payload.display_name
     await db.commit()
     await db.refresh(current_user)
+    await invalidate_user(current_user.firebase_uid)
 
     return {"display_name": current_user.display_name}
\ No newline at end of file
@@ -3,4 +3,16 @@ from pydantic import BaseModel
 class TokenVerifyOut(BaseModel):
     uid: str
     email: str | None = None
-    name: str | None = None
\ No newline at end of file
+    name: str | None = None
+
+
+class SessionTokenOut(BaseModel):
+    session_token: str
+    token_type: str = "Bearer"
+    expires_at: int
+
+
+class SessionUser(BaseModel):
+    """Identity carried by a session token; no database row attached."""
+    id: int
+    firebase_uid: str
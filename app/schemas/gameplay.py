@@ -30,6 +30,7 @@ class SubmissionOut(BaseModel):
     best_candidate: Optional[str] = None
     candidates: List[CandidateFeedback] = []
     from_cache: bool = False
+    degraded: bool = False  # not graded in time; knowledge was left unchanged
     p_know: Optional[float] = None  # <-- add this line
 
     class Config:
@@ -1,10 +1,22 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+from app.core.config import settings
 
 class SentenceCheckRequest(BaseModel):
     sentence: str
+    kc_id: Optional[int] = None
 
 class SentenceCheckResponse(BaseModel):
     is_correct: bool
     error_indices: List[int]
-    feedback: List[str]
\ No newline at end of file
+    feedback: List[str]
+    kc_id: Optional[int] = None
+    from_cache: bool = False
+    degraded: bool = False  # not graded in time or upstream unavailable
+
+class BatchCheckRequest(BaseModel):
+    items: List[SentenceCheckRequest] = Field(..., min_length=1, max_length=settings.BATCH_CHECK_MAX_ITEMS)
+
+class BatchCheckResponse(BaseModel):
+    results: List[SentenceCheckResponse]  # same order as the request items
@@ -0,0 +1,110 @@
+"""Compare bytes per sentence-cache entry: legacy JSON vs compact digest/msgpack.
+
+Sentences come from a text file (one per line) or a built-in sample. The
+payloads mimic what check_sentence stores. With --redis, entries are also
+written under a throwaway prefix and measured with MEMORY USAGE.
+
+Usage:
+    python -m app.scripts.bench_cache_format [sentences.txt] [--redis]
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+from statistics import mean
+
+from app.core.config import settings
+from app.utils.normalize import normalize_sentence
+from app.utils.sentence_codec import encode_payload, sentence_digest
+
+SAMPLE = [
+    "The dog runs across the street.",
+    "The dog run the street.",
+    "A funny bear sings and dances in front.",
+    "The drivers drive their way through the Dutch Grand Prix.",
+    "They is happy.",
+    "She can sings in the garden with her friends.",
+]
+
+
+def _payload(sentence: str, rng: random.Random) -> dict:
+    tokens = sentence.split()
+    wrong = sorted(rng.sample(range(len(tokens)), k=min(len(tokens), rng.choice([0, 0, 1, 2]))))
+    return {
+        "is_correct": not wrong,
+        "error_indices": wrong,
+        "feedback": [f"Replace '{re.sub(r'[.?!]$', '', tokens[i])}' with 'something'" for i in wrong],
+        "scores": {"sapling_edits": len(wrong)},
+        "candidates": [],
+        "best_candidate": sentence,
+        "from_cache": False,
+    }
+
+
+def _formats(sentence: str, payload: dict):
+    normalized = normalize_sentence(sentence)
+    legacy_key = f"sentence_cache:{normalized}".encode("utf-8")
+    legacy_value = json.dumps(payload).encode("utf-8")
+    compact_key = b"sc2:" + sentence_digest(normalized, None)
+    compact_value = encode_payload(normalized, payload, settings.SENTENCE_CACHE_COMPRESS_THRESHOLD)
+    return (legacy_key, legacy_value), (compact_key, compact_value)
+
+
+async def _redis_usage(entries, prefix: bytes) -> float:
+    from app.utils.redis_cache import redis_bytes
+
+    usages = []
+    try:
+        for key, value in entries:
+            await redis_bytes.set(prefix + key, value, ex=300)
+            usages.append(await redis_bytes.memory_usage(prefix + key))
+    finally:
+        for key, _ in entries:
+            await redis_bytes.delete(prefix + key)
+    return mean(usages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sentences", nargs="?", help="file with one sentence per line")
+    parser.add_argument("--redis", action="store_true", help="also measure MEMORY USAGE on REDIS_URL")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.sentences:
+        with open(args.sentences, "r", encoding="utf-8") as fh:
+            sentences = [line.strip() for line in fh if line.strip()]
+    else:
+        sentences = SAMPLE
+
+    rng = random.Random(args.seed)
+    legacy, compact = [], []
+    for sentence in sentences:
+        old, new = _formats(sentence, _payload(sentence, rng))
+        legacy.append(old)
+        compact.append(new)
+
+    def row(name, entries):
+        keys = mean(len(k) for k, _ in entries)
+        values = mean(len(v) for _, v in entries)
+        print(f"{name:<10} key {keys:7.1f} B  value {values:7.1f} B  total {keys + values:7.1f} B")
+        return keys + values
+
+    print(f"{len(sentences)} entries")
+    old_total = row("legacy", legacy)
+    new_total = row("compact", compact)
+    print(f"compact/legacy payload ratio: {new_total / old_total:.2f}")
+
+    if args.redis:
+        async def measure():
+            old = await _redis_usage(legacy, b"bench:")
+            new = await _redis_usage(compact, b"bench:")
+            return old, new
+
+        old, new = asyncio.run(measure())
+        print(f"MEMORY USAGE per entry: legacy {old:.1f} B, compact {new:.1f} B ({new / old:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
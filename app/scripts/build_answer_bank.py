@@ -0,0 +1,195 @@
+"""Compile the per-level answer bank used by check_sentence.
+
+Input is a JSON list of levels:
+
+    [{"level_id": "f1_l1", "kc_id": 1,
+      "tile_sets": [["Dog", "Across", "Street", "Run", "Runs", "The", "The"]],
+      "proper_nouns": [], "punctuation": ["."],
+      "sentences": ["The dog runs across the street."]}]
+
+Listed `sentences` are always graded. With --enumerate, orderings of each
+tile set are generated as well, capped per set: nearest to a listed
+sentence first (one tile swapped, moved, substituted or dropped, then
+two, ...), since those are the mistakes players actually make; tile sets
+that no listed sentence uses fall back to plain orderings, longest first.
+Every candidate is graded by the local engine when it is confident,
+otherwise by check_sentence (Redis cache, then Sapling) until --budget
+upstream calls are spent.
+
+Usage:
+    python -m app.scripts.build_answer_bank levels.json -o app/data/answer_bank.bin --enumerate
+"""
+import argparse
+import asyncio
+import json
+import logging
+from collections import Counter, deque
+from itertools import permutations
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.services import grammar
+from app.services.answer_bank import AnswerBank
+
+logger = logging.getLogger("grammar_cache")
+
+
+def _sentence_from_tiles(tiles: List[str], proper_nouns: set, punctuation: str) -> str:
+    words = [tile if tile == "I" or tile in proper_nouns else tile.lower() for tile in tiles]
+    words[0] = words[0][0].upper() + words[0][1:]
+    return " ".join(words) + punctuation
+
+
+def _tile_order(sentence: str, tiles: List[str]) -> Optional[Tuple[str, ...]]:
+    """The tiles, in order, that spell `sentence` (case and end punctuation ignored), or None."""
+    words = sentence.split()
+    if words and words[-1] in (".", "!", "?"):
+        words = words[:-1]
+    elif words and words[-1][-1] in ".!?":
+        words[-1] = words[-1][:-1]
+    unused = list(tiles)
+    ordering = []
+    for word in words:
+        match = next((tile for tile in unused if tile.lower() == word.lower()), None)
+        if match is None:
+            return None
+        unused.remove(match)
+        ordering.append(match)
+    return tuple(ordering)
+
+
+def _one_edit_away(ordering: Tuple[str, ...], tiles: List[str], min_words: int) -> Iterator[Tuple[str, ...]]:
+    """Orderings one player mistake away, likeliest first: a spare tile swapped in
+    ("Run" for "Runs"), two neighbours swapped, one tile moved, any two swapped, one dropped."""
+    n = len(ordering)
+    spare = Counter(tiles) - Counter(ordering)
+    for i in range(n):
+        for tile in spare:
+            if tile != ordering[i]:
+                yield ordering[:i] + (tile,) + ordering[i + 1:]
+    for i in range(n - 1):
+        yield ordering[:i] + (ordering[i + 1], ordering[i]) + ordering[i + 2:]
+    for i in range(n):
+        rest = ordering[:i] + ordering[i + 1:]
+        for j in range(n):
+            if j != i:
+                yield rest[:j] + (ordering[i],) + rest[j:]
+    for i in range(n):
+        for j in range(i + 2, n):
+            swapped = list(ordering)
+            swapped[i], swapped[j] = swapped[j], swapped[i]
+            yield tuple(swapped)
+    if n > min_words:
+        for i in range(n):
+            yield ordering[:i] + ordering[i + 1:]
+
+
+def _nearest_first(starts: List[Tuple[str, ...]], tiles: List[str], min_words: int) -> Iterator[Tuple[str, ...]]:
+    """Breadth-first over single edits from the listed sentences' orderings."""
+    seen = set(starts)
+    queue = deque(starts)
+    while queue:
+        ordering = queue.popleft()
+        yield ordering
+        for nearby in _one_edit_away(ordering, tiles, min_words):
+            if nearby not in seen:
+                seen.add(nearby)
+                queue.append(nearby)
+
+
+def _longest_first(tiles: List[str], min_words: int) -> Iterator[Tuple[str, ...]]:
+    for length in range(len(tiles), min_words - 1, -1):
+        yield from permutations(tiles, length)
+
+
+def _enumerate(level: Dict, min_words: int, max_per_set: int) -> Iterator[str]:
+    proper_nouns = set(level.get("proper_nouns", []))
+    for tiles in level.get("tile_sets", []):
+        starts = [_tile_order(sentence, tiles) for sentence in level.get("sentences", [])]
+        starts = list(dict.fromkeys(start for start in starts if start))
+        orderings: Iterable[Tuple[str, ...]] = (
+            _nearest_first(starts, tiles, min_words) if starts else _longest_first(tiles, min_words)
+        )
+        seen = set()
+        for ordering in orderings:
+            for punctuation in level.get("punctuation", ["."]):
+                sentence = _sentence_from_tiles(list(ordering), proper_nouns, punctuation)
+                if sentence in seen:
+                    continue
+                seen.add(sentence)
+                yield sentence
+                if len(seen) >= max_per_set:
+                    break
+            if len(seen) >= max_per_set:
+                break
+
+
+def _detached_variant(sentence: str, verdict: Dict[str, object]):
+    """'The dog runs.' -> 'The dog runs .' (punctuation as its own card), if indices still line up."""
+    tokens = sentence.split()
+    last = tokens[-1]
+    if len(last) < 2 or last[-1] not in ".!?":
+        return None
+    if len(tokens) - 1 in verdict.get("error_indices", []):
+        return None
+    return " ".join(tokens[:-1] + [last[:-1], last[-1]])
+
+
+async def build(levels: List[Dict], enumerate_tiles: bool, min_words: int, max_per_set: int, budget: int):
+    graded: Dict[str, Dict[str, object]] = {}
+    upstream_calls = 0
+    skipped = 0
+    grammar.load_local_engine()
+
+    for level in levels:
+        candidates = list(level.get("sentences", []))
+        if enumerate_tiles:
+            candidates.extend(_enumerate(level, min_words, max_per_set))
+
+        for sentence in candidates:
+            if sentence in graded:
+                continue
+            verdict = grammar.local_check(sentence, level.get("kc_id"))
+            if verdict is None:
+                if upstream_calls >= budget:
+                    skipped += 1
+                    continue
+                verdict = await grammar.check_sentence(sentence, priority=grammar.PRIORITY_BATCH)
+                if not verdict.get("from_cache"):
+                    upstream_calls += 1
+                if "upstream_error" in verdict:
+                    skipped += 1
+                    continue
+            graded[sentence] = verdict
+            variant = _detached_variant(sentence, verdict)
+            if variant and variant not in graded:
+                graded[variant] = verdict
+
+    return graded, upstream_calls, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("levels", help="JSON file describing levels and tile sets")
+    parser.add_argument("-o", "--output", default="app/data/answer_bank.bin")
+    parser.add_argument("--enumerate", action="store_true", help="also grade tile orderings")
+    parser.add_argument("--min-words", type=int, default=3)
+    parser.add_argument("--max-per-set", type=int, default=500)
+    parser.add_argument("--budget", type=int, default=1000, help="max upstream (Sapling) calls")
+    args = parser.parse_args()
+
+    with open(args.levels, "r", encoding="utf-8") as fh:
+        levels = json.load(fh)
+
+    async def run():
+        try:
+            return await build(levels, args.enumerate, args.min_words, args.max_per_set, args.budget)
+        finally:
+            await grammar.close_http_client()
+
+    graded, upstream_calls, skipped = asyncio.run(run())
+    count = AnswerBank.dump(args.output, graded.items())
+    print(f"Wrote {count} entries to {args.output} ({upstream_calls} upstream calls, {skipped} skipped)")
+
+
+if __name__ == "__main__":
+    main()
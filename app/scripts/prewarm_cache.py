@@ -0,0 +1,40 @@
+"""Warm the Redis sentence cache from submission history.
+
+Submissions are streamed from Postgres and ranked by frequency per kc_id.
+Sentences whose stored feedback is a usable verdict graded under the
+current cache key format are written straight to the cache; the rest are
+graded by check_sentence at prewarm priority, up to --budget upstream
+calls. Prints a JSON report.
+
+Usage:
+    python -m app.scripts.prewarm_cache --max-keys 5000 --budget 200 --days 30
+"""
+import argparse
+import asyncio
+import json
+
+from app.core.config import settings
+from app.services import grammar
+from app.services.prewarm import prewarm_sentence_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-keys", type=int, default=settings.PREWARM_MAX_KEYS)
+    parser.add_argument("--budget", type=int, default=settings.PREWARM_UPSTREAM_BUDGET, help="max upstream (Sapling) calls")
+    parser.add_argument("--days", type=int, default=settings.PREWARM_LOOKBACK_DAYS, help="history window; 0 scans everything")
+    parser.add_argument("--concurrency", type=int, default=settings.PREWARM_CONCURRENCY)
+    args = parser.parse_args()
+
+    async def run():
+        try:
+            return await prewarm_sentence_cache(args.max_keys, args.budget, args.days, args.concurrency)
+        finally:
+            await grammar.close_http_client()
+
+    report = asyncio.run(run())
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
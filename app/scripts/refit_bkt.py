@@ -0,0 +1,45 @@
+"""Refit per-KC BKT parameters (slip, guess, transit) from submission history.
+
+Submissions are streamed from Postgres ordered by (kc_id, user_id,
+created_at), one KC at a time, and fitted with the NumPy EM engine on
+--workers processes, with --restarts EM runs per KC (the best
+log-likelihood wins). KCs with too little data or a degenerate fit are
+skipped. The rest are stored in kc_params, which new knowledge_progress
+rows start from, and written to every existing row of the KC with
+set-based UPDATEs (and to live Redis state when
+KNOWLEDGE_STATE_BACKEND=redis). Prints a JSON report.
+
+Usage:
+    python -m app.scripts.refit_bkt [--kc 1 --kc 2] [--workers 8] [--restarts 3] [--dry-run]
+"""
+import argparse
+import asyncio
+import json
+import os
+
+from app.services import bkt_refit
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kc", type=int, action="append", dest="kc_ids", help="only refit this kc_id (repeatable)")
+    parser.add_argument("--min-users", type=int, default=bkt_refit.MIN_USERS)
+    parser.add_argument("--min-answers", type=int, default=bkt_refit.MIN_ANSWERS)
+    parser.add_argument("--max-iters", type=int, default=100)
+    parser.add_argument("--tol", type=float, default=1e-5)
+    parser.add_argument("--yield-per", type=int, default=5000, help="rows fetched per cursor round trip")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="fitting processes; 1 fits in-process")
+    parser.add_argument("--restarts", type=int, default=1, help="EM runs per KC (defaults, then random inits)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random restart inits")
+    parser.add_argument("--dry-run", action="store_true", help="fit and report without writing")
+    args = parser.parse_args()
+
+    report = asyncio.run(bkt_refit.refit_bkt_params(
+        args.kc_ids, args.min_users, args.min_answers, args.max_iters, args.tol, args.dry_run, args.yield_per,
+        args.workers, args.restarts, args.seed,
+    ))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import gzip
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("grammar_cache")
+
+BANK_MAGIC = b"GHAB"
+BANK_VERSION = 2
+
+# digest -> (is_correct, error_indices, feedback, Sapling edit count; 0 if graded locally)
+BankEntry = Tuple[bool, Tuple[int, ...], Tuple[str, ...], int]
+
+
+def token_digest(tokens: Sequence[str]) -> int:
+    """64-bit digest of an exact whitespace token sequence (case and punctuation kept)."""
+    joined = "\x1f".join(tokens).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(joined, digest_size=8).digest(), "big")
+
+
+def sentence_digest(sentence: str) -> int:
+    return token_digest(sentence.split())
+
+
+class AnswerBank:
+    """Precompiled verdicts for tile-puzzle sentences, keyed by token-sequence digest."""
+
+    def __init__(self, entries: Optional[Dict[int, BankEntry]] = None):
+        self._entries: Dict[int, BankEntry] = entries or {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, sentence: str) -> Optional[Dict[str, object]]:
+        entry = self._entries.get(sentence_digest(sentence))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        is_correct, error_indices, feedback, sapling_edits = entry
+        return {
+            "is_correct": is_correct,
+            "error_indices": list(error_indices),
+            "feedback": list(feedback),
+            "sapling_edits": sapling_edits,
+        }
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    # -------------------------------
+    # Serialization
+    # -------------------------------
+    @classmethod
+    def load(cls, path: str) -> "AnswerBank":
+        raw = Path(path).read_bytes()
+        if raw[:4] != BANK_MAGIC or raw[4] != BANK_VERSION:
+            raise ValueError(f"{path} is not a version {BANK_VERSION} answer bank")
+        rows = json.loads(gzip.decompress(raw[5:]))
+        entries = {
+            digest: (bool(is_correct), tuple(indices), tuple(feedback), int(sapling_edits))
+            for digest, is_correct, indices, feedback, sapling_edits in rows
+        }
+        logger.info("Loaded answer bank with %d entries from %s", len(entries), path)
+        return cls(entries)
+
+    @staticmethod
+    def dump(path: str, graded: Iterable[Tuple[str, Dict[str, object]]]) -> int:
+        """Write (sentence, verdict) pairs to `path`. Returns the entry count."""
+        rows: Dict[int, List] = {}
+        for sentence, verdict in graded:
+            rows[sentence_digest(sentence)] = [
+                1 if verdict.get("is_correct") else 0,
+                list(verdict.get("error_indices", [])),
+                list(verdict.get("feedback", [])),
+                (verdict.get("scores") or {}).get("sapling_edits", 0),
+            ]
+        payload = json.dumps(
+            [[digest, *row] for digest, row in rows.items()], separators=(",", ":")
+        ).encode("utf-8")
+        Path(path).write_bytes(BANK_MAGIC + bytes([BANK_VERSION]) + gzip.compress(payload, 9))
+        return len(rows)
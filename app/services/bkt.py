@@ -1,6 +1,8 @@
 # bkt.py
 import math
 
+from sqlalchemy import func, literal
+
 def update_bkt(prior: float, is_correct: bool, slip: float, guess: float, transit: float) -> float:
     """
     Smoothed Bayesian Knowledge Tracing update.
@@ -33,4 +35,33 @@ def update_bkt(prior: float, is_correct: bool, slip: float, guess: float, transi
         next_prior = posterior * (1 - unlearn_rate)
 
     # Clamp again for safety
-    return max(0.0, min(1.0, next_prior))
\ No newline at end of file
+    return max(0.0, min(1.0, next_prior))
+
+def update_bkt_sql(prior, is_correct: bool, slip, guess, transit):
+    """
+    SQL expression equivalent of update_bkt, for use inside an UPDATE/upsert.
+    `prior`, `slip`, `guess` and `transit` are column expressions (or numbers);
+    `is_correct` is known up front, so only the matching branch is emitted.
+    """
+    def clamp(value):
+        return func.greatest(literal(0.0), func.least(literal(1.0), value))
+
+    prior = clamp(prior)
+
+    if is_correct:
+        num = prior * (1 - slip)
+        den = num + (1 - prior) * guess
+    else:
+        num = prior * slip
+        den = num + (1 - prior) * (1 - guess)
+
+    posterior = num / (den + 1e-9)
+
+    if is_correct:
+        scaled_T = transit * (1 - prior)
+        next_prior = posterior + (1 - posterior) * scaled_T
+    else:
+        unlearn_rate = 0.05 + (0.15 * prior)
+        next_prior = posterior * (1 - unlearn_rate)
+
+    return clamp(next_prior)
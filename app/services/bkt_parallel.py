@@ -0,0 +1,198 @@
+"""
+Parallel BKT fitting across KCs (and random restarts) on a process pool.
+
+Each KC's answers are copied once into a shared-memory block laid out as
+int64 sequence lengths followed by the concatenated int8 answers; workers
+attach by name and pack it themselves, so only the block name and a few
+numbers are pickled per task. This module is imported by the pool's
+worker processes, so it stays free of DB/Redis/settings imports.
+"""
+import asyncio
+import multiprocessing
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services import em_numpy
+
+# Fits with slip or guess at or above this are degenerate (a "known" student
+# answering worse than chance) and are not used
+MAX_SLIP = 0.5
+MAX_GUESS = 0.5
+
+
+def is_degenerate(fit: Dict[str, float]) -> bool:
+    return fit["S"] >= MAX_SLIP or fit["G"] >= MAX_GUESS
+
+
+def restart_inits(kc_id: int, restarts: int, seed: int) -> List[Optional[Tuple[float, float, float, float]]]:
+    """Initial (L0, T, S, G) per restart: the EM defaults first, then random draws (reproducible per KC)."""
+    rng = random.Random(seed * 1_000_003 + kc_id)
+    inits: List[Optional[Tuple[float, float, float, float]]] = [None]
+    for _ in range(restarts - 1):
+        inits.append((rng.uniform(0.05, 0.95), rng.uniform(0.01, 0.5), rng.uniform(0.01, 0.3), rng.uniform(0.01, 0.3)))
+    return inits
+
+
+def fit_packed(packed: em_numpy.PackedSequences, init, max_iters: int, tol: float) -> Dict[str, float]:
+    """One EM run; returns the params, their log-likelihood and the CPU time spent."""
+    start = time.process_time()
+    fit = em_numpy.em_fit_bkt(packed, max_iters=max_iters, tol=tol, init_params=init)
+    fit["log_likelihood"] = em_numpy.log_likelihood(packed, fit["L0"], fit["T"], fit["S"], fit["G"])
+    fit["cpu_seconds"] = time.process_time() - start
+    return fit
+
+
+# -------------------------------
+# Shared-memory transport
+# -------------------------------
+def _share(flat: np.ndarray, lengths: np.ndarray) -> shared_memory.SharedMemory:
+    block = shared_memory.SharedMemory(create=True, size=max(1, lengths.nbytes + flat.nbytes))
+    np.ndarray(lengths.shape, dtype=np.int64, buffer=block.buf)[:] = lengths
+    np.ndarray(flat.shape, dtype=np.int8, buffer=block.buf, offset=lengths.nbytes)[:] = flat
+    return block
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # The parent owns and unlinks the block. Spawned workers share its resource
+    # tracker, where attaching re-registers the same name and is harmless.
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+def _fit_shared(name: str, n_seq: int, n_obs: int, init, max_iters: int, tol: float) -> Dict[str, float]:
+    """Worker entry point: attach to a KC's block, pack it and fit."""
+    block = _attach(name)
+    try:
+        lengths = np.ndarray((n_seq,), dtype=np.int64, buffer=block.buf)
+        flat = np.ndarray((n_obs,), dtype=np.int8, buffer=block.buf, offset=lengths.nbytes)
+        # _pack copies into its own arrays, so the block can be closed right after
+        packed = em_numpy.PackedSequences.from_arrays(flat, lengths)
+        del lengths, flat
+    finally:
+        block.close()
+    return fit_packed(packed, init, max_iters, tol)
+
+
+# -------------------------------
+# Driver
+# -------------------------------
+def _size_check(sequences: Dict[int, bytearray], min_users: int, min_answers: int) -> Dict[str, object]:
+    n_answers = sum(len(seq) for seq in sequences.values())
+    fit: Dict[str, object] = {"users": len(sequences), "answers": n_answers}
+    if len(sequences) < min_users or n_answers < min_answers:
+        fit["skipped"] = "too_few_answers"
+    return fit
+
+
+def _best(runs: List[Dict[str, float]]) -> Dict[str, object]:
+    usable = [run for run in runs if not is_degenerate(run)]
+    best = max(usable or runs, key=lambda run: run["log_likelihood"])
+    fit: Dict[str, object] = {p: best[p] for p in ("L0", "T", "S", "G", "log_likelihood")}
+    fit["restarts"] = len(runs)
+    fit["restart_log_likelihoods"] = [run["log_likelihood"] for run in runs]
+    fit["cpu_seconds"] = sum(run["cpu_seconds"] for run in runs)
+    if not usable:
+        fit["skipped"] = "degenerate"
+    return fit
+
+
+async def fit_kcs(
+    kc_stream: AsyncIterator[Tuple[int, Dict[int, bytearray]]],
+    workers: int = 1,
+    restarts: int = 1,
+    min_users: int = 20,
+    min_answers: int = 200,
+    max_iters: int = 100,
+    tol: float = 1e-5,
+    seed: int = 0,
+) -> AsyncIterator[Tuple[int, Dict[str, object], List[int]]]:
+    """Fit each KC from `kc_stream`; yields (kc_id, fit, user_ids) as KCs finish.
+
+    With workers > 1 every restart of every KC is a separate pool task, and
+    at most 2 * workers KCs are in flight, so memory stays bounded while
+    the stream keeps the pool busy. Each fit reports its best restart's
+    params and log-likelihood, its wall time from submission to the last
+    restart, and the CPU time summed over restarts.
+    """
+    if workers <= 1:
+        async for kc_id, sequences in kc_stream:
+            fit = _size_check(sequences, min_users, min_answers)
+            if "skipped" not in fit:
+                start = time.perf_counter()
+                packed = em_numpy.PackedSequences(list(sequences.values()))
+                runs = [fit_packed(packed, init, max_iters, tol) for init in restart_inits(kc_id, restarts, seed)]
+                fit.update(_best(runs))
+                fit["seconds"] = time.perf_counter() - start
+            yield kc_id, fit, list(sequences)
+        return
+
+    loop = asyncio.get_running_loop()
+    results: asyncio.Queue = asyncio.Queue()
+    in_flight = asyncio.Semaphore(2 * workers)
+    done = object()
+
+    async def run_kc(pool, kc_id, sequences, fit):
+        start = time.perf_counter()
+        flat, lengths = em_numpy.flatten_sequences(list(sequences.values()))
+        block = _share(flat, lengths)
+        try:
+            runs = await asyncio.gather(*(
+                loop.run_in_executor(pool, _fit_shared, block.name, len(lengths), len(flat), init, max_iters, tol)
+                for init in restart_inits(kc_id, restarts, seed)
+            ))
+            fit.update(_best(runs))
+            fit["seconds"] = time.perf_counter() - start
+            await results.put((kc_id, fit, list(sequences)))
+        except Exception as e:
+            await results.put(e)
+        finally:
+            block.close()
+            block.unlink()
+            in_flight.release()
+
+    async def produce(pool):
+        tasks = []
+        try:
+            async for kc_id, sequences in kc_stream:
+                fit = _size_check(sequences, min_users, min_answers)
+                if "skipped" in fit:
+                    await results.put((kc_id, fit, list(sequences)))
+                    continue
+                await in_flight.acquire()
+                tasks.append(asyncio.create_task(run_kc(pool, kc_id, sequences, fit)))
+            await asyncio.gather(*tasks)
+        except Exception as e:
+            await results.put(e)
+        finally:
+            # Only still pending if the stream failed or we were cancelled; their blocks get unlinked
+            for task in tasks:
+                task.cancel()
+            await results.put(done)
+
+    # spawn, not fork: the parent holds DB/Redis connections and event-loop threads
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        producer = asyncio.create_task(produce(pool))
+        try:
+            while True:
+                item = await results.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            if not producer.done():
+                producer.cancel()
+            try:
+                await producer
+            except asyncio.CancelledError:
+                pass
+
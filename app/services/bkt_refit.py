@@ -0,0 +1,149 @@
+import logging
+import time
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.db import AsyncSessionLocal
+from app.models.knowledge import KCParams, KnowledgeProgress
+from app.models.submission import Submission
+from app.services import bkt_parallel, knowledge_state
+
+logger = logging.getLogger(__name__)
+
+MIN_USERS = 20
+MIN_ANSWERS = 200
+WRITE_BATCH_KCS = 100
+
+
+async def stream_kc_sequences(
+    db: AsyncSession,
+    kc_ids: Optional[Sequence[int]] = None,
+    yield_per: int = 5000,
+) -> AsyncIterator[Tuple[int, Dict[int, bytearray]]]:
+    """Yield (kc_id, {user_id: 0/1 answers in order}) one KC at a time.
+
+    Submissions come through a server-side cursor ordered by
+    (kc_id, user_id, created_at), so only the current KC is ever in memory.
+    """
+    stmt = select(Submission.kc_id, Submission.user_id, Submission.is_correct).where(
+        # Ungraded answers never updated BKT either
+        Submission.is_correct.isnot(None)
+    ).order_by(
+        Submission.kc_id, Submission.user_id, Submission.created_at, Submission.id
+    )
+    if kc_ids:
+        stmt = stmt.where(Submission.kc_id.in_(kc_ids))
+
+    current_kc = None
+    sequences: Dict[int, bytearray] = {}
+    result = await db.stream(stmt.execution_options(yield_per=yield_per))
+    async for kc_id, user_id, is_correct in result:
+        if kc_id != current_kc:
+            if sequences:
+                yield current_kc, sequences
+            current_kc, sequences = kc_id, {}
+        seq = sequences.get(user_id)
+        if seq is None:
+            seq = sequences[user_id] = bytearray()
+        seq.append(1 if is_correct else 0)
+    if sequences:
+        yield current_kc, sequences
+
+
+async def write_params(db: AsyncSession, fits: Dict[int, Dict[str, object]]) -> int:
+    """Store these KCs' slip/guess/transit in kc_params (new rows start from them), then copy
+    them onto every existing knowledge_progress row of the KCs in one UPDATE ... FROM kc_params.
+
+    p_know is left alone: it is each user's current estimate, not a KC parameter.
+    Does not commit. Returns the number of knowledge_progress rows updated.
+    """
+    if not fits:
+        return 0
+    stored = pg_insert(KCParams).values([
+        {"kc_id": kc_id, "slip": fit["S"], "guess": fit["G"], "transit": fit["T"]} for kc_id, fit in fits.items()
+    ])
+    await db.execute(stored.on_conflict_do_update(
+        index_elements=[KCParams.kc_id],
+        set_={
+            "slip": stored.excluded.slip,
+            "guess": stored.excluded.guess,
+            "transit": stored.excluded.transit,
+            "updated_at": func.now(),
+        },
+    ))
+    stmt = (
+        update(KnowledgeProgress)
+        .where(KnowledgeProgress.kc_id == KCParams.kc_id, KCParams.kc_id.in_(list(fits)))
+        .values(slip=KCParams.slip, guess=KCParams.guess, transit=KCParams.transit)
+    )
+    result = await db.execute(stmt)
+    return result.rowcount
+
+
+async def refit_bkt_params(
+    kc_ids: Optional[Sequence[int]] = None,
+    min_users: int = MIN_USERS,
+    min_answers: int = MIN_ANSWERS,
+    max_iters: int = 100,
+    tol: float = 1e-5,
+    dry_run: bool = False,
+    yield_per: int = 5000,
+    workers: int = 1,
+    restarts: int = 1,
+    seed: int = 0,
+) -> Dict[str, object]:
+    """Refit slip/guess/transit per KC from submission history and write them back.
+
+    With workers > 1, KCs (and their random restarts) are fitted on a
+    process pool while the stream keeps reading; see bkt_parallel.fit_kcs.
+    """
+    started = time.perf_counter()
+    report: Dict[str, object] = {
+        "workers": workers, "restarts": restarts,
+        "kcs": {}, "kcs_fitted": 0, "kcs_skipped": 0, "rows_updated": 0,
+    }
+    pending: Dict[int, Dict[str, object]] = {}
+    pending_users: Dict[int, List[int]] = {}
+
+    async def flush():
+        if dry_run or not pending:
+            pending.clear()
+            pending_users.clear()
+            return
+        async with AsyncSessionLocal() as writer:
+            report["rows_updated"] += await write_params(writer, pending)
+            await writer.commit()
+        if knowledge_state.redis_backend():
+            for kc_id, fit in pending.items():
+                # Live state hashes would otherwise keep stepping with the old params (flushes don't write them back)
+                await knowledge_state.set_state_params(pending_users[kc_id], kc_id, fit["S"], fit["G"], fit["T"])
+        pending.clear()
+        pending_users.clear()
+
+    async with AsyncSessionLocal() as db:
+        fits = bkt_parallel.fit_kcs(
+            stream_kc_sequences(db, kc_ids, yield_per),
+            workers, restarts, min_users, min_answers, max_iters, tol, seed,
+        )
+        async for kc_id, fit, user_ids in fits:
+            report["kcs"][kc_id] = fit
+            if "skipped" in fit:
+                report["kcs_skipped"] += 1
+                logger.info("KC %s skipped (%s): %d users, %d answers", kc_id, fit["skipped"], fit["users"], fit["answers"])
+                continue
+            report["kcs_fitted"] += 1
+            logger.info(
+                "KC %s: L0=%.4f T=%.4f S=%.4f G=%.4f loglik=%.1f (%d users, %d answers, %.2fs)",
+                kc_id, fit["L0"], fit["T"], fit["S"], fit["G"], fit["log_likelihood"],
+                fit["users"], fit["answers"], fit["seconds"],
+            )
+            pending[kc_id] = fit
+            pending_users[kc_id] = user_ids
+            if len(pending) >= WRITE_BATCH_KCS:
+                await flush()
+    await flush()
+    report["seconds"] = time.perf_counter() - started
+    return report
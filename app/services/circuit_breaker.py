@@ -0,0 +1,114 @@
+import time
+from collections import deque
+from typing import Dict, Optional
+
+
+class CircuitBreaker:
+    """Rolling-window circuit breaker for an upstream dependency.
+
+    Trips OPEN when, over the last `window_size` calls (and at least
+    `min_calls`), the failure rate or the slow-call rate crosses its
+    threshold. While OPEN every call is refused. After `open_seconds` it
+    lets `half_open_max_calls` probes through; a healthy probe closes the
+    circuit, a failed one re-opens it.
+
+    Every state change starts a new period. `allow()` hands out a permit
+    naming the period the call was admitted in, and `record()`/`release()`
+    ignore permits from an earlier period, so a call admitted while CLOSED
+    that finishes during HALF_OPEN cannot stand in for a probe.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        window_size: int = 50,
+        min_calls: int = 10,
+        error_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 5.0,
+        slow_rate_threshold: float = 0.5,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 1,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate_threshold = slow_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state = self.CLOSED
+        self._calls: deque = deque(maxlen=window_size)  # (failed, slow)
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._period = 0
+
+        self.rejected = 0
+        self.trips = 0
+
+    def allow(self) -> Optional[int]:
+        """Return a permit if a call may go upstream now, else None."""
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                self.rejected += 1
+                return None
+            self._enter(self.HALF_OPEN)
+            self._half_open_in_flight = 0
+
+        if self.state == self.HALF_OPEN:
+            if self._half_open_in_flight >= self.half_open_max_calls:
+                self.rejected += 1
+                return None
+            self._half_open_in_flight += 1
+        return self._period
+
+    def record(self, permit: int, success: bool, duration: float) -> None:
+        if permit != self._period:
+            return  # admitted under an earlier state; says nothing about this one
+        slow = duration >= self.slow_call_seconds
+        if self.state == self.HALF_OPEN:
+            self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+            if success and not slow:
+                self._enter(self.CLOSED)
+                self._calls.clear()
+            else:
+                self._trip()
+            return
+
+        self._calls.append((not success, slow))
+        if self.state == self.CLOSED and len(self._calls) >= self.min_calls:
+            total = len(self._calls)
+            failures = sum(1 for failed, _ in self._calls if failed)
+            slow_calls = sum(1 for _, was_slow in self._calls if was_slow)
+            if failures / total >= self.error_rate_threshold or slow_calls / total >= self.slow_rate_threshold:
+                self._trip()
+
+    def release(self, permit: int) -> None:
+        """Give back an allowed call that never reached upstream."""
+        if self.state == self.HALF_OPEN and permit == self._period:
+            self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+
+    def _enter(self, state: str) -> None:
+        self.state = state
+        self._period += 1
+
+    def _trip(self) -> None:
+        self._enter(self.OPEN)
+        self._opened_at = time.monotonic()
+        self.trips += 1
+        self._calls.clear()
+
+    def stats(self) -> Dict[str, object]:
+        total = len(self._calls)
+        return {
+            "state": self.state,
+            "window_calls": total,
+            "window_failures": sum(1 for failed, _ in self._calls if failed),
+            "window_slow": sum(1 for _, slow in self._calls if slow),
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,197 @@
+# em_numpy.py
+"""
+Vectorized BKT forward-backward and EM, equivalent to app.services.em.
+
+All sequences are packed into one padded time-major (max_len, n_seq) array,
+sorted by length (longest first) so that the sequences still running at
+step t are always the leading columns of row t. Each forward/backward step
+then updates every active sequence with one contiguous slice operation
+instead of a Python loop.
+"""
+from itertools import chain
+
+import numpy as np
+
+from app.services.em import EPS, clamp
+
+
+def flatten_sequences(sequences):
+    """(flat int8 answers, int64 lengths) for a list of 0/1 sequences, in input order."""
+    lengths = np.fromiter((len(seq) for seq in sequences), dtype=np.int64, count=len(sequences))
+    flat = np.fromiter(chain.from_iterable(sequences), dtype=np.int8, count=int(lengths.sum()))
+    return flat, lengths
+
+
+class PackedSequences:
+    """0/1 observation sequences as a padded (max_len, n_seq) array plus a validity mask."""
+
+    def __init__(self, sequences):
+        self._pack(*flatten_sequences(list(sequences)))
+
+    @classmethod
+    def from_arrays(cls, flat, lengths) -> "PackedSequences":
+        """Pack sequences given as concatenated answers plus per-sequence lengths."""
+        packed = cls.__new__(cls)
+        packed._pack(np.asarray(flat, dtype=np.int8), np.asarray(lengths, dtype=np.int64))
+        return packed
+
+    def _pack(self, flat, lengths):
+        if not (lengths > 0).any():
+            raise ValueError("No valid sequences")
+        # Longest first; empty sequences sort last and take no column
+        order = np.argsort(-lengths, kind="stable")
+        column_of = np.empty_like(order)
+        column_of[order] = np.arange(len(lengths))
+
+        self.n_seq = int((lengths > 0).sum())
+        self.lengths = lengths[order][:self.n_seq]
+        self.max_len = int(self.lengths[0])
+
+        n_obs = len(flat)
+        starts = np.cumsum(lengths) - lengths
+        steps = np.arange(n_obs) - np.repeat(starts, lengths)
+        self.obs = np.zeros((self.max_len, self.n_seq), dtype=np.int8)
+        self.obs[steps, np.repeat(column_of, lengths)] = flat
+        self.mask = np.arange(self.max_len)[:, None] < self.lengths
+        # float masks so the M-step sums are dot products
+        self.correct = ((self.obs == 1) & self.mask).astype(np.float64)
+        self.incorrect = ((self.obs == 0) & self.mask).astype(np.float64)
+        self.has_next = self.mask[1:].astype(np.float64)
+        # active[t] = number of sequences longer than t (a prefix of the columns)
+        at_most = np.cumsum(np.bincount(self.lengths, minlength=self.max_len + 1))
+        self.active = self.n_seq - at_most[:self.max_len]
+
+    @property
+    def n_obs(self) -> int:
+        return int(self.lengths.sum())
+
+
+def forward_backward(packed: PackedSequences, L0, T, S, G):
+    """
+    Forward-backward over all sequences at once.
+    returns (gamma_u, gamma_k, xi_0_to_1) arrays of shape (max_len, n_seq) and
+    (max_len - 1, n_seq); entries past a sequence's end are 0.
+    """
+    n_seq, max_len, active = packed.n_seq, packed.max_len, packed.active
+    is_correct = packed.obs == 1
+    emit_k = np.where(is_correct, 1 - S, S)
+    emit_u = np.where(is_correct, G, 1 - G)
+
+    # Forward pass (normalized per step, like em.forward_backward)
+    alpha_u = np.zeros((max_len, n_seq))
+    alpha_k = np.zeros((max_len, n_seq))
+    a_u = (1 - L0) * emit_u[0]
+    a_k = L0 * emit_k[0]
+    norm = a_k + a_u + EPS
+    alpha_u[0] = a_u / norm
+    alpha_k[0] = a_k / norm
+    for t in range(1, max_len):
+        n = active[t]
+        prev_u = alpha_u[t - 1, :n]
+        prev_k = alpha_k[t - 1, :n]
+        a_u = prev_u * (1 - T) * emit_u[t, :n]
+        a_k = (prev_u * T + prev_k) * emit_k[t, :n]
+        s = a_u + a_k + EPS
+        alpha_u[t, :n] = a_u / s
+        alpha_k[t, :n] = a_k / s
+
+    # Backward pass, with the smoothed marginals and expected unknown→known
+    # transitions computed on each step's active slice as beta becomes known.
+    # A sequence's last step keeps beta = (1, 1).
+    gamma_u = np.zeros((max_len, n_seq))
+    gamma_k = np.zeros((max_len, n_seq))
+    xi_0_to_1 = np.zeros((max(max_len - 1, 0), n_seq))
+
+    b_u = np.ones(active[max_len - 1])
+    b_k = np.ones(active[max_len - 1])
+    for t in range(max_len - 1, -1, -1):
+        n = active[t]
+        if t < max_len - 1:
+            m = active[t + 1]
+            emit_next_u, emit_next_k = emit_u[t + 1, :m], emit_k[t + 1, :m]
+            next_u = emit_next_u * b_u
+            next_k = emit_next_k * b_k
+            val_u = (1 - T) * next_u + T * next_k
+            s = val_u + next_k + EPS
+            # Sequences ending at t start with beta = (1, 1)
+            b_u = np.ones(n)
+            b_k = np.ones(n)
+            b_u[:m] = val_u / s
+            b_k[:m] = next_k / s
+
+            a_u, a_k = alpha_u[t, :m], alpha_k[t, :m]
+            val_00 = a_u * (1 - T) * next_u
+            val_01 = a_u * T * next_k
+            val_11 = a_k * next_k
+            xi_0_to_1[t, :m] = val_01 / (val_00 + val_01 + val_11 + EPS)
+
+        g_u = alpha_u[t, :n] * b_u
+        g_k = alpha_k[t, :n] * b_k
+        s = g_u + g_k + EPS
+        gamma_u[t, :n] = g_u / s
+        gamma_k[t, :n] = g_k / s
+
+    return gamma_u, gamma_k, xi_0_to_1
+
+
+def log_likelihood(packed: PackedSequences, L0, T, S, G) -> float:
+    """log P(all observations | L0, T, S, G), from the forward pass's per-step normalizers."""
+    is_correct = packed.obs == 1
+    emit_k = np.where(is_correct, 1 - S, S)
+    emit_u = np.where(is_correct, G, 1 - G)
+
+    a_u = (1 - L0) * emit_u[0]
+    a_k = L0 * emit_k[0]
+    s = a_u + a_k
+    total = np.log(s).sum()
+    p_u, p_k = a_u / s, a_k / s
+    for t in range(1, packed.max_len):
+        n = packed.active[t]
+        p_u, p_k = p_u[:n], p_k[:n]
+        a_u = p_u * (1 - T) * emit_u[t, :n]
+        a_k = (p_u * T + p_k) * emit_k[t, :n]
+        s = a_u + a_k
+        total += np.log(s).sum()
+        p_u, p_k = a_u / s, a_k / s
+    return float(total)
+
+
+def em_fit_bkt(sequences, max_iters=100, tol=1e-5, verbose=False, init_params=None):
+    """
+    Fit BKT parameters (L0, T, S, G) using Expectation-Maximization.
+    sequences: list of lists of 0/1 (1=correct), or a PackedSequences
+    Same updates and stopping rule as em.em_fit_bkt.
+    """
+    packed = sequences if isinstance(sequences, PackedSequences) else PackedSequences(sequences)
+    if init_params is None:
+        L0, T, S, G = 0.2, 0.1, 0.15, 0.25
+    else:
+        L0, T, S, G = init_params
+
+    for it in range(max_iters):
+        gamma_u, gamma_k, xi = forward_backward(packed, L0, T, S, G)
+
+        sum_gamma0 = gamma_k[0].sum()
+        sum_gamma = gamma_k.sum()
+        sum_gamma_incorrect = np.vdot(gamma_k, packed.incorrect)
+        sum_one_minus_gamma = gamma_u.sum()
+        sum_one_minus_gamma_correct = np.vdot(gamma_u, packed.correct)
+        sum_xi_0_to_1 = xi.sum()
+        # positions with a successor (the t in xi_t)
+        sum_expected_zero = np.vdot(1 - gamma_k[:-1], packed.has_next)
+
+        new_L0 = sum_gamma0 / packed.n_seq
+        new_T = sum_xi_0_to_1 / (sum_expected_zero + EPS)
+        new_S = sum_gamma_incorrect / (sum_gamma + EPS)
+        new_G = sum_one_minus_gamma_correct / (sum_one_minus_gamma + EPS)
+
+        new_L0, new_T, new_S, new_G = (clamp(float(v)) for v in (new_L0, new_T, new_S, new_G))
+        diff = max(abs(new_L0 - L0), abs(new_T - T), abs(new_S - S), abs(new_G - G))
+
+        L0, T, S, G = new_L0, new_T, new_S, new_G
+        if verbose:
+            print(f"[EM] iter {it:03d} L0={L0:.4f} T={T:.4f} S={S:.4f} G={G:.4f} Δ={diff:.6f}")
+        if diff < tol:
+            break
+
+    return {"L0": L0, "T": T, "S": S, "G": G}
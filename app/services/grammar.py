@@ -1,11 +1,31 @@
+import asyncio
+import heapq
+import itertools
 import json
 import logging
-import re
+import secrets
+import time
+from bisect import bisect_right
 from typing import Dict, List, Optional
 import httpx
 
-from app.utils.normalize import normalize_sentence
-from app.utils.redis_cache import get_sentence_cache, set_sentence_cache
+from app.services.answer_bank import AnswerBank
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.local_grammar import DATA_DIR, LocalGrammarEngine, LocalGrammarStats, load_rule_engine
+from app.utils.normalize import CanonicalSentence, same_canonical_text
+from app.utils.redis_cache import (
+    acquire_sentence_lock,
+    acquire_upstream_slot,
+    get_negative_cache,
+    get_negative_cache_many,
+    get_sentence_cache,
+    get_sentence_cache_many,
+    release_sentence_lock,
+    release_upstream_slot,
+    set_negative_cache,
+    set_sentence_cache,
+    set_sentence_cache_many,
+)
 from app.core.config import settings
 
 logger = logging.getLogger("grammar_cache")
@@ -14,75 +34,535 @@ SAPLING_API_URL = "https://api.sapling.ai/api/v1/edits"
 SAPLING_API_KEY = settings.SAPLING_API_KEY
 
 
+# -------------------------------
+# Shared HTTP client
+# -------------------------------
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _build_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=settings.SAPLING_HTTP2,
+        limits=httpx.Limits(
+            max_connections=settings.SAPLING_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.SAPLING_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.SAPLING_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(
+            connect=settings.SAPLING_CONNECT_TIMEOUT,
+            read=settings.SAPLING_READ_TIMEOUT,
+            write=settings.SAPLING_WRITE_TIMEOUT,
+            pool=settings.SAPLING_POOL_TIMEOUT,
+        ),
+    )
+
+
+async def init_http_client() -> None:
+    """Create the worker's pooled Sapling client (called on app startup)."""
+    global _http_client
+    if _http_client is None:
+        _http_client = _build_http_client()
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    # Scripts and tests may call check_sentence without the app lifespan
+    global _http_client
+    if _http_client is None:
+        _http_client = _build_http_client()
+    return _http_client
+
+
+# -------------------------------
+# Upstream scheduler
+# -------------------------------
+# Lower value = served first
+PRIORITY_LIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_PREWARM = 2
+_PRIORITY_NAMES = {PRIORITY_LIVE: "live", PRIORITY_BATCH: "batch", PRIORITY_PREWARM: "prewarm"}
+
+
+class SchedulerTimeout(Exception):
+    """A request waited longer than its priority class allows for a Sapling slot."""
+
+
+class _UpstreamScheduler:
+    """Admits Sapling requests by priority under per-worker and shared limits.
+
+    Each worker hands out `worker_concurrency` local slots, most urgent
+    waiter first. An admitted request must then lease a slot from the
+    Redis-wide pool, which enforces a global concurrency and requests-per-
+    second limit. Batch and prewarm traffic only get `background_share` of
+    the global limits so live gameplay always has headroom.
+    """
+
+    def __init__(
+        self,
+        worker_concurrency: int,
+        global_concurrency: int,
+        global_rps: int,
+        background_share: float,
+        queue_timeouts_ms: Dict[int, float],
+        shared: bool = True,
+    ):
+        self.worker_concurrency = worker_concurrency
+        self.global_concurrency = global_concurrency
+        self.global_rps = global_rps
+        self.background_share = background_share
+        self.queue_timeouts = {p: ms / 1000 for p, ms in queue_timeouts_ms.items()}
+        self.shared = shared
+
+        self._active = 0
+        self._waiters: List[list] = []  # heap of [priority, seq, future]
+        self._seq = itertools.count()
+
+        self._admitted = {p: 0 for p in _PRIORITY_NAMES}
+        self._timeouts = {p: 0 for p in _PRIORITY_NAMES}
+        self._wait_total = {p: 0.0 for p in _PRIORITY_NAMES}
+        self._wait_max = {p: 0.0 for p in _PRIORITY_NAMES}
+        self.shared_full = 0
+        self.rate_limited = 0
+
+    def _limits(self, priority: int) -> tuple:
+        if priority == PRIORITY_LIVE:
+            return self.global_concurrency, self.global_rps
+        return (
+            max(1, int(self.global_concurrency * self.background_share)),
+            max(1, int(self.global_rps * self.background_share)),
+        )
+
+    async def acquire(self, priority: int) -> Optional[str]:
+        """Wait for a slot. Returns a shared-slot token to pass to `release`."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.queue_timeouts[priority]
+        try:
+            await self._acquire_local(priority, deadline)
+        except asyncio.TimeoutError:
+            self._timeouts[priority] += 1
+            raise SchedulerTimeout(f"no local Sapling slot within {self.queue_timeouts[priority]:.1f}s")
+
+        try:
+            token = await self._acquire_shared(priority, deadline) if self.shared else None
+        except BaseException:
+            self._release_local()
+            raise
+
+        waited = loop.time() - started
+        self._admitted[priority] += 1
+        self._wait_total[priority] += waited
+        self._wait_max[priority] = max(self._wait_max[priority], waited)
+        return token
+
+    async def release(self, token: Optional[str]) -> None:
+        self._release_local()
+        if token is not None:
+            await release_upstream_slot(token)
+
+    async def _acquire_local(self, priority: int, deadline: float) -> None:
+        if self._active < self.worker_concurrency and not self._waiters:
+            self._active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [priority, next(self._seq), future])
+        try:
+            # The slot is handed over by _release_local; _active is not decremented in between
+            await asyncio.wait_for(future, deadline - asyncio.get_running_loop().time())
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # Handed a slot just as we gave up: pass it on
+                self._release_local()
+            raise
+
+    def _release_local(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    async def _acquire_shared(self, priority: int, deadline: float) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        concurrency, rps = self._limits(priority)
+        token = secrets.token_hex(8)
+        while True:
+            admitted = await acquire_upstream_slot(token, concurrency, rps, settings.SAPLING_SLOT_LEASE_MS)
+            if admitted is None:
+                # Redis unavailable: local limits still apply
+                return None
+            if admitted == 1:
+                return token
+            if admitted == 0:
+                self.shared_full += 1
+                delay = settings.SAPLING_SCHEDULER_POLL_MS / 1000
+            else:
+                self.rate_limited += 1
+                delay = max(1.0 - time.time() % 1.0, settings.SAPLING_SCHEDULER_POLL_MS / 1000)
+            if loop.time() + delay > deadline:
+                self._timeouts[priority] += 1
+                raise SchedulerTimeout("no shared Sapling slot within the queue timeout")
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, object]:
+        queued = {name: 0 for name in _PRIORITY_NAMES.values()}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                queued[_PRIORITY_NAMES[priority]] += 1
+        return {
+            "active": self._active,
+            "queued": queued,
+            "shared_full": self.shared_full,
+            "rate_limited": self.rate_limited,
+            "classes": {
+                name: {
+                    "admitted": self._admitted[p],
+                    "timeouts": self._timeouts[p],
+                    "avg_wait_ms": 1000 * self._wait_total[p] / self._admitted[p] if self._admitted[p] else 0.0,
+                    "max_wait_ms": 1000 * self._wait_max[p],
+                }
+                for p, name in _PRIORITY_NAMES.items()
+            },
+        }
+
+
+_scheduler = _UpstreamScheduler(
+    worker_concurrency=settings.SAPLING_WORKER_CONCURRENCY,
+    global_concurrency=settings.SAPLING_GLOBAL_CONCURRENCY,
+    global_rps=settings.SAPLING_GLOBAL_RPS,
+    background_share=settings.SAPLING_BACKGROUND_SHARE,
+    queue_timeouts_ms={
+        PRIORITY_LIVE: settings.SAPLING_QUEUE_TIMEOUT_LIVE_MS,
+        PRIORITY_BATCH: settings.SAPLING_QUEUE_TIMEOUT_BATCH_MS,
+        PRIORITY_PREWARM: settings.SAPLING_QUEUE_TIMEOUT_PREWARM_MS,
+    },
+    shared=settings.SAPLING_SHARED_LIMITS,
+)
+
+
 # -------------------------------
 # Sapling Request Logic
 # -------------------------------
-async def _sapling_check(sentence: str) -> Optional[Dict]:
+_breaker = CircuitBreaker(
+    "sapling",
+    window_size=settings.SAPLING_BREAKER_WINDOW,
+    min_calls=settings.SAPLING_BREAKER_MIN_CALLS,
+    error_rate_threshold=settings.SAPLING_BREAKER_ERROR_RATE,
+    slow_call_seconds=settings.SAPLING_BREAKER_SLOW_CALL_SECONDS,
+    slow_rate_threshold=settings.SAPLING_BREAKER_SLOW_RATE,
+    open_seconds=settings.SAPLING_BREAKER_OPEN_SECONDS,
+)
+
+CIRCUIT_OPEN_ERROR = "Grammar service temporarily unavailable"
+QUEUE_TIMEOUT_ERROR = "Grammar service busy"
+# Refused before reaching Sapling; says nothing about the sentence itself
+_LOCAL_REJECTIONS = {CIRCUIT_OPEN_ERROR, QUEUE_TIMEOUT_ERROR}
+
+
+async def _sapling_request(text: str, priority: int = PRIORITY_LIVE) -> Dict:
     """Send a grammar check request to Sapling API."""
+    permit = _breaker.allow()
+    if permit is None:
+        return {"error": CIRCUIT_OPEN_ERROR}
+
+    try:
+        token = await _scheduler.acquire(priority)
+    except SchedulerTimeout as e:
+        _breaker.release(permit)
+        logger.warning("Sapling request not scheduled: %s", e)
+        return {"error": QUEUE_TIMEOUT_ERROR}
+    except BaseException:
+        _breaker.release(permit)
+        raise
+
+    try:
+        return await _send_sapling_request(text, permit)
+    finally:
+        await _scheduler.release(token)
+
+
+async def _send_sapling_request(text: str, permit: int) -> Dict:
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    healthy = False
+    cancelled = False
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.post(
+        resp = await asyncio.wait_for(
+            _get_http_client().post(
                 SAPLING_API_URL,
                 json={
                     "key": SAPLING_API_KEY,
-                    "text": sentence,
+                    "text": text,
                     "session_id": "grammar_heroes",
                 },
-            )
+            ),
+            timeout=settings.SAPLING_CALL_TIMEOUT,
+        )
 
-            if 200 <= resp.status_code < 300:
-                return resp.json()
-            else:
-                logger.error(f"Sapling API error {resp.status_code}: {resp.text}")
-                return {"error": f"Sapling API error {resp.status_code}: {resp.text}"}
+        if 200 <= resp.status_code < 300:
+            data = resp.json()
+            healthy = True
+            return data
+        else:
+            # A 4xx about this particular text says nothing about Sapling's health
+            healthy = resp.status_code < 500 and resp.status_code != 429
+            logger.error(f"Sapling API error {resp.status_code}: {resp.text}")
+            return {"error": f"Sapling API error {resp.status_code}: {resp.text}"}
 
+    except asyncio.TimeoutError:
+        logger.error("Sapling API call timed out after %.1fs", settings.SAPLING_CALL_TIMEOUT)
+        return {"error": "Sapling API timed out"}
+    except asyncio.CancelledError:
+        # The caller gave up (e.g. a client-supplied deadline); that says nothing
+        # about Sapling, so only free a half-open probe slot
+        cancelled = True
+        _breaker.release(permit)
+        raise
     except Exception as e:
         logger.exception("Sapling API call failed: %s", e)
         return {"error": str(e)}
+    finally:
+        if not cancelled:
+            _breaker.record(permit, healthy, loop.time() - started)
+
+
+def _split_edits(data: Dict, sentences: List[str], offsets: List[int]) -> List[Dict]:
+    """Split a Sapling response for joined text back into one response per sentence.
+
+    Sapling reports `start`/`end` relative to the sentence it detected, which
+    begins at `sentence_start` in the submitted text. Each edit is rebased onto
+    the caller's sentence so downstream code can slice it directly.
+    """
+    if not data or "edits" not in data:
+        return [data for _ in sentences]
+
+    per_sentence: List[List[Dict]] = [[] for _ in sentences]
+    for edit in data["edits"]:
+        base = edit.get("sentence_start", 0)
+        abs_start = base + edit.get("start", 0)
+        abs_end = base + edit.get("end", 0)
+        i = max(0, bisect_right(offsets, abs_start) - 1)
+        sentence = sentences[i]
+        # Clamp to the caller's sentence (edits never legitimately span the separator)
+        start = min(abs_start - offsets[i], len(sentence))
+        end = max(start, min(abs_end - offsets[i], len(sentence)))
+        per_sentence[i].append({**edit, "sentence": sentence, "sentence_start": 0, "start": start, "end": end})
+    return [{"edits": edits} for edits in per_sentence]
+
+
+class _SaplingBatcher:
+    """Collects misses for a few milliseconds and sends them as one request."""
+
+    SEPARATOR = "\n\n"
+
+    def __init__(self, window_ms: float, max_sentences: int, max_chars: int):
+        self.window = window_ms / 1000
+        self.max_sentences = max_sentences
+        self.max_chars = max_chars
+        self._pending: List[tuple] = []
+        self._chars = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+
+        self.batches = 0
+        self.sentences = 0
+
+    async def submit(self, sentence: str, priority: int = PRIORITY_LIVE) -> Dict:
+        loop = asyncio.get_running_loop()
+        size = len(sentence) + len(self.SEPARATOR)
+        if self._pending and self._chars + size > self.max_chars:
+            self._flush()
+
+        future = loop.create_future()
+        self._pending.append((sentence, future, priority))
+        self._chars += size
+
+        if len(self._pending) >= self.max_sentences or self._chars >= self.max_chars:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._chars = self._pending, [], 0
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[tuple]) -> None:
+        # Callers that gave up (cancelled) are dropped before we spend a request on them
+        batch = [entry for entry in batch if not entry[1].done()]
+        if not batch:
+            return
+        sentences = [sentence for sentence, _, _ in batch]
+        # The batch goes out at its most urgent member's priority
+        priority = min(entry_priority for _, _, entry_priority in batch)
+        offsets = []
+        position = 0
+        for sentence in sentences:
+            offsets.append(position)
+            position += len(sentence) + len(self.SEPARATOR)
+
+        self.batches += 1
+        self.sentences += len(batch)
+        try:
+            data = await _sapling_request(self.SEPARATOR.join(sentences), priority)
+            results = _split_edits(data, sentences, offsets)
+        except Exception as exc:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "sentences": self.sentences,
+            "avg_batch_size": self.sentences / self.batches if self.batches else 0.0,
+        }
+
+
+_batcher = _SaplingBatcher(
+    window_ms=settings.SAPLING_BATCH_WINDOW_MS,
+    max_sentences=settings.SAPLING_BATCH_MAX_SENTENCES,
+    max_chars=settings.SAPLING_BATCH_MAX_CHARS,
+)
+
+
+async def _sapling_check(sentence: str, priority: int = PRIORITY_LIVE) -> Optional[Dict]:
+    """Check one sentence, micro-batched with concurrent misses when enabled."""
+    if settings.SAPLING_BATCH_ENABLED:
+        return await _batcher.submit(sentence, priority)
+    data = await _sapling_request(sentence, priority)
+    return _split_edits(data, [sentence], [0])[0]
 
 
 # -------------------------------
-# Postprocessing and Scoring
+# Local engine (short-circuits Sapling when confident)
 # -------------------------------
-def _extract_feedback(data: Dict) -> List[str]:
-    """Convert Sapling edits into human-readable feedback."""
-    feedback = []
-    if not data or "edits" not in data:
-        if "error" in data:
-            feedback.append(data["error"])
-        return feedback
-
-    for edit in data.get("edits", []):
-        old_sentence = edit.get("sentence", "")
-        start = edit.get("start", 0)
-        end = edit.get("end", 0)
-        replacement = edit.get("replacement", "")
-        wrong_part = old_sentence[start:end]
-        if wrong_part and replacement:
-            feedback.append(f"Replace '{wrong_part}' with '{replacement}'")
-        elif wrong_part and not replacement:
-            feedback.append(f"Remove '{wrong_part}'")
-    return feedback
-
-
-def _extract_error_indices(sentence: str, edits: List[Dict]) -> List[int]:
-    """Convert Sapling character offsets to token indices."""
-    if not edits:
-        return []
-
-    tokens = list(re.finditer(r"\S+", sentence))
-    error_indices = set()
+_local_engine: Optional[LocalGrammarEngine] = None
+_local_engine_loaded = False
+_local_stats = LocalGrammarStats()
 
-    for edit in edits:
-        start = edit.get("start", 0)
-        end = edit.get("end", 0)
-        for i, token in enumerate(tokens):
-            token_start, token_end = token.span()
-            # overlap check
-            if token_end > start and token_start < end:
-                error_indices.add(i)
 
-    return sorted(error_indices)
+def load_local_engine(engine: Optional[LocalGrammarEngine] = None) -> None:
+    """Install the local grammar engine (called once on app startup)."""
+    global _local_engine, _local_engine_loaded
+    _local_engine_loaded = True
+    if engine is None:
+        if not settings.LOCAL_GRAMMAR_ENABLED:
+            _local_engine = None
+            return
+        engine = load_rule_engine(settings.LOCAL_GRAMMAR_LEXICON_PATH, settings.LOCAL_GRAMMAR_RULES_PATH)
+    _local_engine = engine
+
+
+def local_check(sentence: str, kc_id: Optional[int]) -> Optional[Dict[str, object]]:
+    """Grade `sentence` with the local rule engine, or None if it cannot decide."""
+    if not _local_engine_loaded:
+        load_local_engine()
+    if _local_engine is None:
+        return None
+
+    try:
+        verdict = _local_engine.check(sentence, kc_id)
+    except Exception as e:
+        logger.exception("Local grammar engine failed: %s", e)
+        verdict = None
+    _local_stats.record(verdict)
+    if verdict is None:
+        return None
+
+    return {
+        "is_correct": verdict["is_correct"],
+        "error_indices": verdict["error_indices"],
+        "feedback": verdict["feedback"],
+        "scores": {
+            "sapling_edits": 0,
+            "local_rules": verdict.get("rules", []),
+        },
+        "candidates": [],
+        "best_candidate": sentence,
+        "from_cache": False,
+        "source": "local",
+    }
+
+
+# -------------------------------
+# Answer bank (precompiled tile-puzzle verdicts)
+# -------------------------------
+_answer_bank: Optional[AnswerBank] = None
+_answer_bank_loaded = False
+
+
+def load_answer_bank(bank: Optional[AnswerBank] = None) -> None:
+    """Load the compiled answer bank (called once on app startup)."""
+    global _answer_bank, _answer_bank_loaded
+    _answer_bank_loaded = True
+    if bank is None:
+        path = settings.ANSWER_BANK_PATH or str(DATA_DIR / "answer_bank.bin")
+        try:
+            bank = AnswerBank.load(path)
+        except FileNotFoundError:
+            logger.info("No answer bank at %s", path)
+        except Exception as e:
+            logger.error("Failed to load answer bank %s: %s", path, e)
+    _answer_bank = bank
+
+
+def _answer_bank_check(sentence: str) -> Optional[Dict[str, object]]:
+    if not _answer_bank_loaded:
+        load_answer_bank()
+    if _answer_bank is None:
+        return None
+    verdict = _answer_bank.lookup(sentence)
+    if verdict is None:
+        return None
+    sapling_edits = verdict.pop("sapling_edits")
+    return {
+        **verdict,
+        "scores": {"sapling_edits": sapling_edits},
+        "candidates": [],
+        "best_candidate": sentence,
+        "from_cache": True,
+        "source": "answer_bank",
+    }
+
+
+def grammar_stats() -> Dict[str, object]:
+    return {
+        "batching": _batcher.stats(),
+        "local": _local_stats.as_dict(),
+        "answer_bank": _answer_bank.stats() if _answer_bank is not None else None,
+        "circuit_breaker": _breaker.stats(),
+        "scheduler": _scheduler.stats(),
+    }
+
+
+# -------------------------------
+# Postprocessing and Scoring
+# -------------------------------
+def _edit_feedback(wrong_part: str, replacement: str) -> Optional[str]:
+    """Human-readable feedback for one edit."""
+    if wrong_part and replacement:
+        return f"Replace '{wrong_part}' with '{replacement}'"
+    if wrong_part:
+        return f"Remove '{wrong_part}'"
+    return None
 
 
 def _is_grammatically_correct(data: Dict) -> bool:
@@ -92,41 +572,360 @@ def _is_grammatically_correct(data: Dict) -> bool:
     return len(data["edits"]) == 0
 
 
+def _graded_edits(sentence: str, edits: List[Dict]) -> List[Dict]:
+    """Drop edits that only change whitespace or quote style (e.g. "home ." -> "home.").
+
+    The cache key ignores both, so such an edit would otherwise fail every
+    spelling that shares the key, with nothing to highlight.
+    """
+    return [
+        edit for edit in edits
+        if not same_canonical_text(sentence[edit.get("start", 0):edit.get("end", 0)], edit.get("replacement", ""))
+    ]
+
+
 # -------------------------------
-# Main Entry
+# Canonical cache payloads
+# -------------------------------
+# Cached verdicts are stored in canonical token coordinates (see CanonicalSentence)
+# and remapped onto each caller's own tokens when read. Sapling verdicts carry
+# "edits" as [first, offset, last, offset, replacement] so feedback can be rebuilt
+# from the caller's text. Verdicts without edits (e.g. reused submission history)
+# carry the "layout" they were graded with and only serve callers with that layout.
+def _canonical_edits(canon: CanonicalSentence, edits: List[Dict]) -> List[list]:
+    located = []
+    for edit in edits:
+        span = canon.locate(edit.get("start", 0), edit.get("end", 0))
+        # Pure insertions have no token to highlight
+        if span is not None:
+            located.append([*span, edit.get("replacement", "")])
+    return located
+
+
+def canonical_payload(canon: CanonicalSentence, result: Dict[str, object]) -> Dict[str, object]:
+    """Cache payload for a verdict in the caller's coordinates that has no edits."""
+    payload = {k: v for k, v in result.items() if k not in ("from_cache", "source", "best_candidate")}
+    payload["error_indices"] = canon.from_original(result.get("error_indices", []))
+    payload["layout"] = list(canon.layout)
+    return payload
+
+
+def _from_canonical(canon: CanonicalSentence, payload: Dict[str, object]) -> Optional[Dict[str, object]]:
+    """Remap a canonical payload onto the caller's tokens; None if it can't be done faithfully."""
+    result = {k: v for k, v in payload.items() if k not in ("edits", "layout")}
+    edits = payload.get("edits")
+    if edits is not None:
+        feedback = [_edit_feedback(canon.text(*edit[:4]), edit[4]) for edit in edits]
+        result["feedback"] = [line for line in feedback if line]
+    elif "layout" in payload and payload["layout"] != canon.layout:
+        return None
+    result["error_indices"] = canon.to_original(payload.get("error_indices", []))
+    result["best_candidate"] = canon.sentence
+    return result
+
+
+# -------------------------------
+# Single-flight
 # -------------------------------
-async def check_sentence(sentence: str, kc_id: Optional[int] = None) -> Dict[str, object]:
-    """Main grammar check function with Redis cache and Sapling integration."""
-    normalized = normalize_sentence(sentence)
-    cached = await get_sentence_cache(normalized, kc_id)
+class _LeaderCancelled(Exception):
+    """The coroutine filling an in-flight check was cancelled; followers retry."""
+
+
+# cache key -> future of the check currently running in this worker
+_inflight: Dict[tuple, asyncio.Future] = {}
+
+
+def _upstream_error_result(sentence: str, error: str) -> Dict[str, object]:
+    """An ungraded answer: never cached as a verdict."""
+    return {
+        "is_correct": False,
+        "error_indices": [],
+        "feedback": [error],
+        "scores": {
+            "sapling_edits": 0,
+        },
+        "candidates": [],
+        "best_candidate": sentence,
+        "from_cache": False,
+        "upstream_error": error,
+    }
 
-    if cached:
-        logger.info("[CACHE HIT] '%s'", normalized)
-        cached["from_cache"] = True
-        return cached
 
-    logger.info("[CACHE MISS] '%s'", normalized)
-    sapling_result = await _sapling_check(sentence)
+async def _grade_with_sapling(canon: CanonicalSentence, priority: int = PRIORITY_LIVE) -> Dict[str, object]:
+    """Grade with Sapling; the verdict is returned in canonical coordinates."""
+    sapling_result = await _sapling_check(canon.sentence, priority)
+    if sapling_result and "error" in sapling_result:
+        return _upstream_error_result(canon.sentence, sapling_result["error"])
 
-    feedback = _extract_feedback(sapling_result)
+    if sapling_result and "edits" in sapling_result:
+        sapling_result = {**sapling_result, "edits": _graded_edits(canon.sentence, sapling_result["edits"])}
     is_correct = _is_grammatically_correct(sapling_result)
     edits = sapling_result.get("edits", []) if sapling_result else []
+    located = _canonical_edits(canon, edits)
 
-    # Map edits → token indices
-    error_indices = _extract_error_indices(sentence, edits)
+    # Map edits → canonical token indices
+    error_indices = sorted({i for first, _, last, _, _ in located for i in range(first, last + 1)})
 
-    result: Dict[str, object] = {
+    return {
         "is_correct": is_correct,
         "error_indices": error_indices,
-        "feedback": feedback,
+        "feedback": [],  # rebuilt from edits for each caller
         "scores": {
             "sapling_edits": len(edits),
         },
         "candidates": [],
-        "best_candidate": sentence,
+        "best_candidate": None,
         "from_cache": False,
+        "edits": located,
     }
 
-    # Cache result for 30 days
-    await set_sentence_cache(normalized, kc_id, result)
-    return result
\ No newline at end of file
+
+async def _wait_for_other_worker(canon: CanonicalSentence, kc_id: Optional[int]) -> Optional[Dict[str, object]]:
+    """Poll the cache while another worker holds the fill lock."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.SENTENCE_LOCK_WAIT_MS / 1000
+    while loop.time() < deadline:
+        await asyncio.sleep(settings.SENTENCE_LOCK_POLL_MS / 1000)
+        cached = await get_sentence_cache(canon.key, kc_id)
+        # Only a fresh Sapling verdict (with edits) is sure to remap onto every follower
+        if cached and "edits" in cached:
+            cached["from_cache"] = True
+            return cached
+        failure = await get_negative_cache(canon.key, kc_id)
+        if failure is not None:
+            return _upstream_error_result(canon.sentence, failure)
+    return None
+
+
+async def _fill(canon: CanonicalSentence, kc_id: Optional[int], priority: int) -> Dict[str, object]:
+    """Grade a cache miss, letting at most one worker call upstream per sentence."""
+    failure = await get_negative_cache(canon.key, kc_id)
+    if failure is not None:
+        logger.info("[NEGATIVE HIT] '%s' failed upstream recently", canon.sentence)
+        return _upstream_error_result(canon.sentence, failure)
+
+    token = await acquire_sentence_lock(canon.key, kc_id)
+    if token is None:
+        logger.info("[COALESCED] '%s' is being checked by another worker", canon.sentence)
+        result = await _wait_for_other_worker(canon, kc_id)
+        if result is not None:
+            return result
+        # The lock holder is slow or gone; check it ourselves
+
+    try:
+        result = await _grade_with_sapling(canon, priority)
+        error = result.get("upstream_error")
+        if error is None:
+            # Cache result for 30 days
+            await set_sentence_cache(canon.key, kc_id, result)
+        elif error not in _LOCAL_REJECTIONS:
+            # Only remember failures Sapling itself reported
+            await set_negative_cache(canon.key, kc_id, error)
+        return result
+    finally:
+        if token is not None:
+            await release_sentence_lock(canon.key, kc_id, token)
+
+
+async def _single_flight(key: tuple, fill) -> tuple:
+    """Run `fill()` unless this worker is already grading `key`. Returns (payload, led)."""
+    while True:
+        pending = _inflight.get(key)
+        if pending is None:
+            break
+        try:
+            # shield: a follower giving up must not cancel the leader
+            return await asyncio.shield(pending), False
+        except _LeaderCancelled:
+            continue
+
+    future = asyncio.get_running_loop().create_future()
+    # Mark exceptions as retrieved when nobody else was waiting
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    _inflight[key] = future
+    try:
+        result = await fill()
+    except asyncio.CancelledError:
+        future.set_exception(_LeaderCancelled())
+        raise
+    except Exception as exc:
+        future.set_exception(exc)
+        raise
+    else:
+        future.set_result(result)
+        return result, True
+    finally:
+        _inflight.pop(key, None)
+
+
+async def _check_upstream(canon: CanonicalSentence, kc_id: Optional[int], priority: int) -> Dict[str, object]:
+    """Grade via Sapling, sharing one in-flight check per canonical sentence within the worker."""
+    payload, _ = await _single_flight((canon.key, kc_id), lambda: _fill(canon, kc_id, priority))
+    return payload
+
+
+# -------------------------------
+# Main Entry
+# -------------------------------
+DEADLINE_ERROR = "Grammar check timed out"
+
+# A Sapling verdict doesn't depend on the KC, so every KC shares one cache entry
+# per sentence; the KC only decides which local rules may grade it
+CACHE_KC_ID = None
+
+
+async def check_sentence(
+    sentence: str,
+    kc_id: Optional[int] = None,
+    deadline: Optional[float] = None,
+    priority: int = PRIORITY_LIVE,
+) -> Dict[str, object]:
+    """Main grammar check function with Redis cache and Sapling integration.
+
+    `kc_id` selects the local engine's rule set; the sentence cache is
+    shared by all KCs. `deadline` is an event-loop time (``loop.time()``).
+    If Sapling has not answered by then this caller stops waiting and gets
+    an ungraded, degraded result instead. Without micro-batching its
+    Sapling request is cancelled; with it, the shared batch request still
+    completes for the other sentences in it. `priority` selects the
+    scheduler class for the Sapling request.
+    """
+    banked = _answer_bank_check(sentence)
+    if banked is not None:
+        return banked
+
+    canon = CanonicalSentence(sentence)
+    cached = await get_sentence_cache(canon.key, CACHE_KC_ID)
+    result = _from_canonical(canon, cached) if cached else None
+
+    if result is not None:
+        logger.info("[CACHE HIT] '%s'", sentence)
+        result["from_cache"] = True
+        return result
+
+    logger.info("[CACHE MISS] '%s'", sentence)
+    local = local_check(sentence, kc_id)
+    if local is not None:
+        logger.info("[LOCAL] '%s' graded without Sapling", sentence)
+        return local
+
+    if deadline is None:
+        payload = await _check_upstream(canon, CACHE_KC_ID, priority)
+    else:
+        remaining = deadline - asyncio.get_running_loop().time()
+        try:
+            if remaining <= 0:
+                raise asyncio.TimeoutError
+            payload = await asyncio.wait_for(_check_upstream(canon, CACHE_KC_ID, priority), remaining)
+        except asyncio.TimeoutError:
+            logger.warning("[DEADLINE] '%s' not graded within budget", sentence)
+            payload = _upstream_error_result(sentence, DEADLINE_ERROR)
+
+    # Fresh verdicts always carry edits (or are errors), so this never declines
+    result = _from_canonical(canon, payload)
+    if "upstream_error" in result:
+        # Bank, cache and local engine were all consulted above; nothing better to offer
+        result["degraded"] = True
+    return result
+
+
+async def _grade_misses(
+    misses: Dict[tuple, CanonicalSentence],
+    deadline: Optional[float],
+    priority: int,
+) -> Dict[tuple, Dict[str, object]]:
+    """Grade distinct cache misses concurrently and write them back in one pipeline.
+
+    Unlike `_fill` there is no per-sentence cross-worker lock, which would cost
+    round trips per sentence; in-worker single-flight still applies, and the
+    concurrent Sapling calls share micro-batches.
+    """
+    payloads: Dict[tuple, Dict[str, object]] = {}
+    failures = await get_negative_cache_many(list(misses))
+    tasks: Dict[tuple, asyncio.Task] = {}
+    for (key, canon), failure in zip(misses.items(), failures):
+        if failure is not None:
+            payloads[key] = _upstream_error_result(canon.sentence, failure)
+        else:
+            tasks[key] = asyncio.ensure_future(
+                _single_flight(key, lambda canon=canon: _grade_with_sapling(canon, priority))
+            )
+    if not tasks:
+        return payloads
+
+    timeout = None if deadline is None else max(0.0, deadline - asyncio.get_running_loop().time())
+    done, not_done = await asyncio.wait(tasks.values(), timeout=timeout)
+    for task in not_done:
+        task.cancel()
+    await asyncio.gather(*not_done, return_exceptions=True)
+
+    writes = []
+    negatives = []
+    for key, task in tasks.items():
+        sentence = misses[key].sentence
+        if task not in done:
+            payloads[key] = _upstream_error_result(sentence, DEADLINE_ERROR)
+            continue
+        if task.exception() is not None:
+            logger.error("Grammar check failed for '%s': %s", sentence, task.exception())
+            payloads[key] = _upstream_error_result(sentence, str(task.exception()))
+            continue
+        payload, led = task.result()
+        payloads[key] = payload
+        if not led:
+            continue  # the leader writes its own result
+        error = payload.get("upstream_error")
+        if error is None:
+            writes.append((key[0], key[1], payload))
+        elif error not in _LOCAL_REJECTIONS:
+            negatives.append(set_negative_cache(key[0], key[1], error))
+
+    await asyncio.gather(set_sentence_cache_many(writes), *negatives)
+    return payloads
+
+
+async def check_sentences(
+    items: List[tuple],
+    deadline: Optional[float] = None,
+    priority: int = PRIORITY_BATCH,
+) -> List[Dict[str, object]]:
+    """Grade many (sentence, kc_id) pairs; results are in input order.
+
+    As in check_sentence, `kc_id` only selects the local rule set. The
+    sentence cache is read with one MGET and written back with one
+    pipeline, so Redis round trips do not grow with the number of sentences.
+    """
+    results: List[Optional[Dict[str, object]]] = [None] * len(items)
+    lookups = []
+    for i, (sentence, kc_id) in enumerate(items):
+        banked = _answer_bank_check(sentence)
+        if banked is not None:
+            results[i] = banked
+        else:
+            lookups.append((i, CanonicalSentence(sentence), kc_id))
+
+    cached = await get_sentence_cache_many([(canon.key, CACHE_KC_ID) for _, canon, _ in lookups])
+    misses: Dict[tuple, CanonicalSentence] = {}
+    waiting = []
+    for (i, canon, kc_id), payload in zip(lookups, cached):
+        result = _from_canonical(canon, payload) if payload else None
+        if result is not None:
+            result["from_cache"] = True
+            results[i] = result
+            continue
+        local = local_check(canon.sentence, kc_id)
+        if local is not None:
+            results[i] = local
+            continue
+        misses.setdefault((canon.key, CACHE_KC_ID), canon)
+        waiting.append((i, canon))
+
+    if misses:
+        logger.info("[BATCH] %d of %d sentences need Sapling", len(misses), len(items))
+        graded = await _grade_misses(misses, deadline, priority)
+        for i, canon in waiting:
+            result = _from_canonical(canon, graded[(canon.key, CACHE_KC_ID)])
+            if "upstream_error" in result:
+                result["degraded"] = True
+            results[i] = result
+    return results
@@ -0,0 +1,373 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal
+from app.crud import knowledge as knowledge_crud
+from app.models.knowledge import KnowledgeProgress
+from app.utils.redis_cache import redis
+
+logger = logging.getLogger(__name__)
+
+# Per (user, KC) hash; the {user} hash tag keeps a user's keys in one cluster slot
+STATE_FIELDS = ("p_know", "attempts", "correct", "slip", "guess", "transit")
+DIRTY_USERS_KEY = "kstate:dirty_users"
+
+
+class KnowledgeStateUnavailable(Exception):
+    """Redis mode could not apply a BKT step; nothing was recorded."""
+
+
+def redis_backend() -> bool:
+    return settings.KNOWLEDGE_STATE_BACKEND == "redis"
+
+
+def _state_key(user_id: int, kc_id: int) -> str:
+    return f"kstate:{{{user_id}}}:{kc_id}"
+
+
+def _dirty_key(user_id: int) -> str:
+    return f"kstate:{{{user_id}}}:dirty"
+
+
+def _index_key(user_id: int) -> str:
+    return f"kstate:{{{user_id}}}:kcs"
+
+
+# -------------------------------
+# Lua scripts
+# -------------------------------
+# KEYS[1] = state hash, KEYS[2] = user's dirty KC set, KEYS[3] = user's KC index
+# ARGV = kc_id, correct (1/0), ttl seconds, then optionally the seed
+#        p_know, attempts, correct, slip, guess, transit for a missing hash
+# Same arithmetic as bkt.update_bkt; returns the new p_know, or nil if the
+# hash is missing and no seed was given.
+_UPDATE_BKT_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then
+    if #ARGV < 9 then
+        return false
+    end
+    redis.call('hset', KEYS[1], 'p_know', ARGV[4], 'attempts', ARGV[5], 'correct', ARGV[6],
+               'slip', ARGV[7], 'guess', ARGV[8], 'transit', ARGV[9])
+end
+local state = redis.call('hmget', KEYS[1], 'p_know', 'slip', 'guess', 'transit')
+local prior = math.max(0.0, math.min(1.0, tonumber(state[1])))
+local slip, guess, transit = tonumber(state[2]), tonumber(state[3]), tonumber(state[4])
+local correct = ARGV[2] == '1'
+
+local num, den
+if correct then
+    num = prior * (1 - slip)
+    den = num + (1 - prior) * guess
+else
+    num = prior * slip
+    den = num + (1 - prior) * (1 - guess)
+end
+local posterior = num / (den + 1e-9)
+
+local next_prior
+if correct then
+    next_prior = posterior + (1 - posterior) * (transit * (1 - prior))
+else
+    next_prior = posterior * (1 - (0.05 + (0.15 * prior)))
+end
+local p_know = string.format('%.17g', math.max(0.0, math.min(1.0, next_prior)))
+
+redis.call('hset', KEYS[1], 'p_know', p_know)
+redis.call('hincrby', KEYS[1], 'attempts', 1)
+if correct then
+    redis.call('hincrby', KEYS[1], 'correct', 1)
+end
+redis.call('expire', KEYS[1], ARGV[3])
+redis.call('sadd', KEYS[2], ARGV[1])
+redis.call('sadd', KEYS[3], ARGV[1])
+redis.call('expire', KEYS[3], ARGV[3])
+return p_know
+"""
+
+# KEYS[1] = state hash, KEYS[2] = user's KC index; ARGV = kc_id, ttl, then the six STATE_FIELDS
+_SEED_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then
+    redis.call('hset', KEYS[1], 'p_know', ARGV[3], 'attempts', ARGV[4], 'correct', ARGV[5],
+               'slip', ARGV[6], 'guess', ARGV[7], 'transit', ARGV[8])
+    redis.call('expire', KEYS[1], ARGV[2])
+    redis.call('sadd', KEYS[2], ARGV[1])
+    redis.call('expire', KEYS[2], ARGV[2])
+end
+return 1
+"""
+
+# KEYS[1] = user's dirty KC set, then one state hash per flushed KC
+# ARGV = the flushed KC ids, then the attempts each was flushed at ('' if the hash was gone)
+# Drops a KC's marker only if no answer has landed since it was read
+_ACK_FLUSH_SCRIPT = """
+local n = #KEYS - 1
+for i = 1, n do
+    local attempts = redis.call('hget', KEYS[i + 1], 'attempts') or ''
+    if attempts == ARGV[n + i] then
+        redis.call('srem', KEYS[1], ARGV[i])
+    end
+end
+return 1
+"""
+
+# KEYS = state hashes; ARGV = slip, guess, transit. Only touches hashes that exist.
+_SET_PARAMS_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call('exists', key) == 1 then
+        redis.call('hset', key, 'slip', ARGV[1], 'guess', ARGV[2], 'transit', ARGV[3])
+    end
+end
+return 1
+"""
+
+
+async def _seed_args(db: AsyncSession, kc_id: int, row: Optional[KnowledgeProgress]) -> List:
+    if row is None:
+        # Same starting point as a new Postgres row: the KC's fitted params, or the defaults
+        slip, guess, transit = await knowledge_crud.get_kc_params(db, kc_id)
+        return [repr(knowledge_crud.DEFAULT_P_KNOW), 0, 0, repr(slip), repr(guess), repr(transit)]
+    return [repr(float(row.p_know)), row.attempts or 0, row.correct or 0,
+            repr(float(row.slip)), repr(float(row.guess)), repr(float(row.transit))]
+
+
+def _parse_state(user_id: int, kc_id: int, data: Dict[str, str]) -> Optional[Dict]:
+    if not data or any(field not in data for field in STATE_FIELDS):
+        return None
+    return {
+        "user_id": user_id,
+        "kc_id": kc_id,
+        "p_know": float(data["p_know"]),
+        "attempts": int(data["attempts"]),
+        "correct": int(data["correct"]),
+        "slip": float(data["slip"]),
+        "guess": float(data["guess"]),
+        "transit": float(data["transit"]),
+    }
+
+
+# -------------------------------
+# Request path
+# -------------------------------
+async def get_p_know(db: AsyncSession, user_id: int, kc_id: int) -> float:
+    """Current p_know for one KC; in Redis mode this also loads the KC's state hash."""
+    if not redis_backend():
+        return await knowledge_crud.get_knowledge_value(db, user_id, kc_id)
+
+    key = _state_key(user_id, kc_id)
+    try:
+        cached = await redis.hget(key, "p_know")
+    except Exception as e:
+        logger.error("Redis hget failed for %s: %s", key, e)
+        return await knowledge_crud.get_knowledge_value(db, user_id, kc_id)
+    if cached is not None:
+        return float(cached)
+
+    row = await knowledge_crud.get_knowledge_row(db, user_id, kc_id)
+    if row is None:
+        # Same answer as get_knowledge_value; the hash is created on the first graded answer
+        return 0.5
+    try:
+        await redis.eval(
+            _SEED_SCRIPT, 2, key, _index_key(user_id),
+            kc_id, settings.KNOWLEDGE_STATE_TTL_SECONDS, *await _seed_args(db, kc_id, row),
+        )
+    except Exception as e:
+        logger.error("Redis seed failed for %s: %s", key, e)
+    return float(row.p_know)
+
+
+async def record_answer(db: AsyncSession, user_id: int, kc_id: int, is_correct: bool) -> float:
+    """Apply one BKT step and return the new p_know.
+
+    Postgres mode upserts the row (caller commits). Redis mode runs the
+    step atomically in the state hash and marks it dirty for the next
+    flush. If Redis is unreachable it raises KnowledgeStateUnavailable
+    rather than upserting into Postgres: the hash may hold unflushed
+    answers, and its next flush would overwrite the Postgres write.
+    """
+    if not redis_backend():
+        return await knowledge_crud.upsert_knowledge(db, user_id, kc_id, is_correct)
+
+    keys = [_state_key(user_id, kc_id), _dirty_key(user_id), _index_key(user_id)]
+    args = [kc_id, 1 if is_correct else 0, settings.KNOWLEDGE_STATE_TTL_SECONDS]
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.eval(_UPDATE_BKT_SCRIPT, 3, *keys, *args)
+            pipe.sadd(DIRTY_USERS_KEY, user_id)
+            p_know, _ = await pipe.execute()
+        if p_know is None:
+            # Not loaded (or expired): seed from Postgres and apply the step in one go
+            row = await knowledge_crud.get_knowledge_row(db, user_id, kc_id)
+            p_know = await redis.eval(_UPDATE_BKT_SCRIPT, 3, *keys, *args, *await _seed_args(db, kc_id, row))
+    except Exception as e:
+        logger.error("Redis BKT update failed for %s: %s", keys[0], e)
+        raise KnowledgeStateUnavailable(keys[0]) from e
+    return float(p_know)
+
+
+async def get_user_knowledge(db: AsyncSession, user_id: int) -> List[KnowledgeProgress]:
+    """All KC progress for a user, with any unflushed Redis state laid over the Postgres rows."""
+    rows = list(await knowledge_crud.get_user_kcs(db, user_id))
+    if not redis_backend():
+        return rows
+
+    try:
+        kc_ids = [int(kc_id) for kc_id in await redis.smembers(_index_key(user_id))]
+        if not kc_ids:
+            return rows
+        async with redis.pipeline(transaction=False) as pipe:
+            for kc_id in kc_ids:
+                pipe.hgetall(_state_key(user_id, kc_id))
+            states = await pipe.execute()
+    except Exception as e:
+        logger.error("Redis state read failed for user %s: %s", user_id, e)
+        return rows
+
+    merged = {row.kc_id: row for row in rows}
+    for kc_id, data in zip(kc_ids, states):
+        state = _parse_state(user_id, kc_id, data)
+        if state is not None:
+            # Transient copy; the session's rows are left untouched
+            merged[kc_id] = KnowledgeProgress(**state)
+    return list(merged.values())
+
+
+async def set_state_params(user_ids: Sequence[int], kc_id: int, slip: float, guess: float, transit: float) -> None:
+    """Replace a KC's BKT parameters in whichever of these users' state hashes are live."""
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            # One script call per user: a user's keys share a cluster slot, different users may not
+            for user_id in user_ids:
+                pipe.eval(_SET_PARAMS_SCRIPT, 1, _state_key(user_id, kc_id), repr(slip), repr(guess), repr(transit))
+            await pipe.execute()
+    except Exception as e:
+        logger.error("Redis param update failed for KC %s: %s", kc_id, e)
+
+
+# -------------------------------
+# Flushing dirty state to Postgres
+# -------------------------------
+async def _flush_users(user_ids: Sequence[int]) -> int:
+    """Upsert the dirty KCs of these users in one statement. Returns rows written.
+
+    KC markers are only read here and dropped after the commit, so a
+    failure anywhere leaves them in place for the next flush.
+    """
+    async with redis.pipeline(transaction=False) as pipe:
+        for user_id in user_ids:
+            pipe.smembers(_dirty_key(user_id))
+        dirty = await pipe.execute()
+
+    pairs = [(user_id, int(kc_id)) for user_id, kc_ids in zip(user_ids, dirty) for kc_id in kc_ids or ()]
+    if not pairs:
+        return 0
+    async with redis.pipeline(transaction=False) as pipe:
+        for user_id, kc_id in pairs:
+            pipe.hgetall(_state_key(user_id, kc_id))
+        states = await pipe.execute()
+    rows = [
+        state for state in (_parse_state(user_id, kc_id, data) for (user_id, kc_id), data in zip(pairs, states))
+        if state is not None
+    ]
+
+    async with AsyncSessionLocal() as db:
+        await knowledge_crud.upsert_knowledge_states(db, rows)
+        await db.commit()
+
+    flushed: Dict[int, List] = {}
+    for (user_id, kc_id), data in zip(pairs, states):
+        flushed.setdefault(user_id, []).append((kc_id, (data or {}).get("attempts", "")))
+    async with redis.pipeline(transaction=False) as pipe:
+        # One script call per user: a user's keys share a cluster slot, different users may not
+        for user_id, kcs in flushed.items():
+            keys = [_dirty_key(user_id), *(_state_key(user_id, kc_id) for kc_id, _ in kcs)]
+            pipe.eval(_ACK_FLUSH_SCRIPT, len(keys), *keys, *(kc_id for kc_id, _ in kcs), *(a for _, a in kcs))
+        await pipe.execute()
+    return len(rows)
+
+
+async def flush_dirty(batch_users: int = 200) -> int:
+    """Flush every dirty user's state, `batch_users` users per upsert. Returns rows written."""
+    written = 0
+    while True:
+        user_ids = await redis.spop(DIRTY_USERS_KEY, batch_users)
+        if not user_ids:
+            return written
+        try:
+            written += await _flush_users([int(user_id) for user_id in user_ids])
+        except Exception:
+            # Their KC markers are still set; queue the users for the next flush
+            await redis.sadd(DIRTY_USERS_KEY, *user_ids)
+            raise
+
+
+async def flush_user(user_id: int) -> int:
+    """Flush one user's dirty state now (e.g. on logout). Returns rows written."""
+    if not redis_backend():
+        return 0
+    try:
+        await redis.srem(DIRTY_USERS_KEY, user_id)
+        return await _flush_users([user_id])
+    except Exception as e:
+        logger.error("Knowledge state flush failed for user %s: %s", user_id, e)
+        try:
+            # Its KC markers are still set; leave the user to the background flusher
+            await redis.sadd(DIRTY_USERS_KEY, user_id)
+        except Exception:
+            pass
+        return 0
+
+
+# -------------------------------
+# Background flusher (every worker; SPOP splits the work)
+# -------------------------------
+_flush_task: Optional[asyncio.Task] = None
+_stop_flusher = asyncio.Event()
+_flush_stats = {"flushes": 0, "rows_written": 0, "errors": 0}
+
+
+async def _flush_once() -> None:
+    try:
+        written = await flush_dirty(settings.KNOWLEDGE_STATE_FLUSH_BATCH_USERS)
+    except Exception as e:
+        _flush_stats["errors"] += 1
+        logger.error("Knowledge state flush failed: %s", e)
+        return
+    _flush_stats["flushes"] += 1
+    _flush_stats["rows_written"] += written
+    if written:
+        logger.info("Flushed %d knowledge rows to Postgres", written)
+
+
+async def _run_flusher() -> None:
+    while not _stop_flusher.is_set():
+        try:
+            await asyncio.wait_for(_stop_flusher.wait(), timeout=settings.KNOWLEDGE_STATE_FLUSH_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        # Also the final drain on shutdown, so a deploy doesn't leave state only in Redis
+        await _flush_once()
+
+
+def knowledge_state_stats() -> Dict[str, object]:
+    return {"backend": settings.KNOWLEDGE_STATE_BACKEND, **_flush_stats}
+
+
+def start_knowledge_flusher() -> None:
+    global _flush_task
+    if _flush_task is None and redis_backend():
+        _stop_flusher.clear()
+        _flush_task = asyncio.create_task(_run_flusher())
+
+
+async def stop_knowledge_flusher() -> None:
+    global _flush_task
+    if _flush_task is not None:
+        # Let an in-progress flush finish: cancelling after SPOP would drop its users from the dirty set
+        _stop_flusher.set()
+        await _flush_task
+        _flush_task = None
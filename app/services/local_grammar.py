@@ -0,0 +1,360 @@
+import json
+import logging
+import re
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("grammar_cache")
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+
+SVA = "subject_verb_agreement"
+ARTICLE = "article_usage"
+KNOWN_RULES = {SVA, ARTICLE}
+
+# Stop exploring after this many complete parses; ambiguity that large is never "confident"
+MAX_PARSES = 32
+
+_WORD = re.compile(r"^[A-Za-z]+$")
+_TERMINAL = re.compile(r"^(.*?)([.!?])$")
+
+
+class LocalGrammarEngine(ABC):
+    """Interface for in-process graders that run before Sapling.
+
+    `check` returns a verdict dict (is_correct, error_indices, feedback, rules)
+    when the engine is confident, or None to fall through to Sapling.
+    """
+
+    @abstractmethod
+    def check(self, sentence: str, kc_id: Optional[int] = None) -> Optional[Dict[str, object]]:
+        ...
+
+
+class RuleBasedEngine(LocalGrammarEngine):
+    """Deterministic checker for narrow sentence shapes (subject + verb phrase).
+
+    Only grades sentences whose every word is in the POS lexicon and which
+    parse unambiguously as: subject NP, verb phrase, optional objects /
+    adverbs / prepositional phrases, terminal punctuation.
+    """
+
+    def __init__(self, lexicon: Dict, kc_rules: Dict):
+        self._tags: Dict[str, List[Tuple]] = {}
+        self._forms: Dict[str, List[str]] = {}
+        self._an_exceptions = set(lexicon.get("an_exceptions", []))
+        self._a_exceptions = set(lexicon.get("a_exceptions", []))
+        self._index(lexicon)
+
+        self._default_rules = self._known(kc_rules.get("default", []), "default")
+        self._kc_rules = {
+            int(kc): self._known(rules, f"KC {kc}") for kc, rules in kc_rules.get("kcs", {}).items()
+        }
+
+    @staticmethod
+    def _known(rules: List[str], scope: str) -> set:
+        unknown = set(rules) - KNOWN_RULES
+        if unknown:
+            raise ValueError(f"Unknown grammar rules for {scope}: {', '.join(sorted(unknown))}")
+        return set(rules)
+
+    # -------------------------------
+    # Lexicon
+    # -------------------------------
+    def _add(self, word: str, tag: Tuple) -> None:
+        self._tags.setdefault(word.lower(), []).append(tag)
+
+    def _index(self, lexicon: Dict) -> None:
+        for word, number in lexicon.get("determiners", {}).items():
+            self._add(word, ("DET", number))
+        for singular, plural in lexicon.get("nouns", {}).items():
+            self._add(singular, ("NOUN", "sg"))
+            if plural != singular:
+                self._add(plural, ("NOUN", "pl"))
+            else:
+                self._add(plural, ("NOUN", "any"))
+        for base, (third, past) in lexicon.get("verbs", {}).items():
+            self._forms[base] = [base, third, past]
+            self._add(base, ("VERB", "base", base))
+            self._add(third, ("VERB", "3sg", base))
+            self._add(past, ("VERB", "past", base))
+        for word, persons in lexicon.get("be", {}).items():
+            self._add(word, ("BE", frozenset(persons)))
+        for word in lexicon.get("modals", []):
+            self._add(word, ("MODAL",))
+        for word, person in lexicon.get("pronouns", {}).items():
+            self._add(word, ("PRON", person))
+        for word in lexicon.get("object_pronouns", []):
+            self._add(word, ("OBJ",))
+        for word in lexicon.get("adjectives", []):
+            self._add(word, ("ADJ",))
+        for word in lexicon.get("adverbs", []):
+            self._add(word, ("ADV",))
+        for word in lexicon.get("prepositions", []):
+            self._add(word, ("PREP",))
+        for word in lexicon.get("conjunctions", []):
+            self._add(word, ("CONJ",))
+
+    def _has(self, word: str, kind: str) -> List[Tuple]:
+        return [tag for tag in self._tags.get(word, []) if tag[0] == kind]
+
+    # -------------------------------
+    # Agreement helpers
+    # -------------------------------
+    def _needs_an(self, word: str) -> bool:
+        if word in self._an_exceptions:
+            return True
+        if word in self._a_exceptions:
+            return False
+        return word[0] in "aeiou"
+
+    def _verb_fix(self, tag: Tuple, person: str) -> Optional[str]:
+        """Return the corrected verb form, or None if it already agrees."""
+        _, form, base = tag
+        if form == "past":
+            return None
+        if person == "3sg" and form == "base":
+            return self._forms[base][1]
+        if person != "3sg" and form == "3sg":
+            return base
+        return None
+
+    @staticmethod
+    def _be_fix(word: str, persons: frozenset, person: str) -> Optional[str]:
+        if person in persons:
+            return None
+        past = word in ("was", "were")
+        if person == "1sg":
+            return "was" if past else "am"
+        if person == "3sg":
+            return "was" if past else "is"
+        return "were" if past else "are"
+
+    # -------------------------------
+    # Parser (backtracking over tag sets)
+    # -------------------------------
+    def _noun_phrase(self, words: List[str], pos: int, subject: bool) -> Iterator[Tuple[int, str, tuple]]:
+        """Yield (next_pos, person, errors) for each way to read an NP at `pos`."""
+        if pos >= len(words):
+            return
+        word = words[pos]
+        if subject:
+            for _, person in self._has(word, "PRON"):
+                yield pos + 1, person, ()
+        elif self._has(word, "OBJ"):
+            yield pos + 1, "3sg", ()
+
+        starts = [(pos, None)]
+        for _, number in self._has(word, "DET"):
+            starts.append((pos + 1, number))
+
+        for cursor, det_number in starts:
+            # ADJ* then the head noun; try every split since some words are both
+            while True:
+                yield from self._noun_head(words, pos, cursor, det_number)
+                if cursor < len(words) and self._has(words[cursor], "ADJ"):
+                    cursor += 1
+                else:
+                    break
+
+    def _noun_head(self, words, start, cursor, det_number) -> Iterator[Tuple[int, str, tuple]]:
+        if cursor >= len(words):
+            return
+        for _, number in self._has(words[cursor], "NOUN"):
+            if det_number is None and number == "sg":
+                continue  # bare singular count noun: leave it to Sapling
+            if det_number is not None and "any" not in (det_number, number) and det_number != number:
+                continue  # determiner/noun mismatch: not our call
+            errors = ()
+            if det_number is not None and words[start] in ("a", "an"):
+                wants_an = self._needs_an(words[start + 1])
+                if wants_an != (words[start] == "an"):
+                    errors = ((ARTICLE, start, "an" if wants_an else "a"),)
+            person = "pl" if number == "pl" or (number == "any" and det_number == "pl") else "3sg"
+            yield cursor + 1, person, errors
+
+    def _subject(self, words: List[str]) -> Iterator[Tuple[int, str, tuple]]:
+        for pos, person, errors in self._noun_phrase(words, 0, subject=True):
+            yield pos, person, errors
+            if pos < len(words) and self._has(words[pos], "CONJ"):
+                for pos2, _, errors2 in self._noun_phrase(words, pos + 1, subject=True):
+                    yield pos2, "pl", errors + errors2
+
+    def _verb(self, words: List[str], pos: int, person: str) -> Iterator[Tuple[int, tuple, bool]]:
+        """Yield (next_pos, errors, is_be) for a single verb group at `pos`."""
+        if pos >= len(words):
+            return
+        word = words[pos]
+        for tag in self._has(word, "VERB"):
+            fix = self._verb_fix(tag, person)
+            yield pos + 1, ((SVA, pos, fix),) if fix else (), False
+        for _, persons in self._has(word, "BE"):
+            fix = self._be_fix(word, persons, person)
+            yield pos + 1, ((SVA, pos, fix),) if fix else (), True
+        if self._has(word, "MODAL") and pos + 1 < len(words):
+            for tag in self._has(words[pos + 1], "VERB"):
+                _, form, base = tag
+                errors = ((SVA, pos + 1, base),) if form != "base" else ()
+                yield pos + 2, errors, False
+
+    def _tail(self, words: List[str], pos: int, allow_object: bool) -> Iterator[Tuple[int, tuple]]:
+        """Consume objects / adverbs / prepositional phrases up to the end."""
+        if pos == len(words):
+            yield pos, ()
+            return
+        word = words[pos]
+        if self._has(word, "ADV"):
+            for end, errors in self._tail(words, pos + 1, False):
+                yield end, errors
+        if self._has(word, "PREP"):
+            for nxt, _, errors in self._noun_phrase(words, pos + 1, subject=False):
+                for end, errors2 in self._tail(words, nxt, False):
+                    yield end, errors + errors2
+        if allow_object:
+            for nxt, _, errors in self._noun_phrase(words, pos, subject=False):
+                for end, errors2 in self._tail(words, nxt, False):
+                    yield end, errors + errors2
+
+    def _complement(self, words: List[str], pos: int) -> Iterator[Tuple[int, tuple]]:
+        """What may follow a form of `be`: adjectives, an NP, or the usual tail."""
+        cursor = pos
+        if cursor < len(words) and words[cursor] == "very":
+            cursor += 1
+        if cursor < len(words) and self._has(words[cursor], "ADJ"):
+            yield from self._tail(words, cursor + 1, False)
+        if pos < len(words):
+            yield from self._tail(words, pos, True)
+
+    def _predicate(self, words: List[str], pos: int, person: str) -> Iterator[tuple]:
+        for nxt, errors, is_be in self._verb(words, pos, person):
+            rests = self._complement(words, nxt) if is_be else self._tail(words, nxt, True)
+            for end, errors2 in rests:
+                if end == len(words):
+                    yield errors + errors2
+            # "sings and dances ..."
+            if not is_be and nxt < len(words) and self._has(words[nxt], "CONJ"):
+                for nxt2, errors2, is_be2 in self._verb(words, nxt + 1, person):
+                    if is_be2:
+                        continue
+                    for end, errors3 in self._tail(words, nxt2, True):
+                        if end == len(words):
+                            yield errors + errors2 + errors3
+
+    def _parses(self, words: List[str]) -> Iterator[frozenset]:
+        for pos, person, errors in self._subject(words):
+            if pos < len(words) and self._has(words[pos], "ADV"):
+                starts = [pos, pos + 1]
+            else:
+                starts = [pos]
+            for start in starts:
+                for errors2 in self._predicate(words, start, person):
+                    yield frozenset(errors + errors2)
+
+    # -------------------------------
+    # Entry
+    # -------------------------------
+    def _rules_for(self, kc_id: Optional[int]) -> set:
+        # KCs without their own entry use the default rule set
+        if kc_id is None:
+            return self._default_rules
+        return self._kc_rules.get(kc_id, self._default_rules)
+
+    def check(self, sentence: str, kc_id: Optional[int] = None) -> Optional[Dict[str, object]]:
+        rules = self._rules_for(kc_id)
+        if not rules:
+            return None
+
+        tokens = sentence.split()
+        if not tokens:
+            return None
+
+        # Exactly one terminal punctuation mark, either attached or as its own card
+        if tokens[-1] in (".", "!", "?"):
+            tokens = tokens[:-1]
+        else:
+            match = _TERMINAL.match(tokens[-1])
+            if not match or not match.group(1):
+                return None
+            tokens = tokens[:-1] + [match.group(1)]
+
+        if not tokens or not all(_WORD.match(token) for token in tokens):
+            return None
+        # Capital first letter, no other capitals except "I" (proper nouns are out of scope)
+        if not tokens[0][0].isupper() or "i" in tokens:
+            return None
+        if any(len(token) > 1 and not token[1:].islower() for token in tokens):
+            return None
+        if any(token[0].isupper() and token != "I" for token in tokens[1:]):
+            return None
+
+        words = [token.lower() for token in tokens]
+        if any(word not in self._tags for word in words):
+            return None
+
+        verdicts = set()
+        for count, errors in enumerate(self._parses(words)):
+            verdicts.add(errors)
+            if len(verdicts) > 1 or count >= MAX_PARSES:
+                return None
+        if len(verdicts) != 1:
+            return None
+
+        errors = sorted(verdicts.pop(), key=lambda error: error[1])
+        if any(rule not in rules for rule, _, _ in errors):
+            return None
+
+        feedback = []
+        for _, index, replacement in errors:
+            original = tokens[index]
+            if original[0].isupper():
+                replacement = replacement[0].upper() + replacement[1:]
+            feedback.append(f"Replace '{original}' with '{replacement}'")
+
+        return {
+            "is_correct": not errors,
+            "error_indices": sorted({index for _, index, _ in errors}),
+            "feedback": feedback,
+            "rules": sorted({rule for rule, _, _ in errors}),
+        }
+
+
+# -------------------------------
+# Loading and stats
+# -------------------------------
+def load_rule_engine(lexicon_path: Optional[str] = None, rules_path: Optional[str] = None) -> RuleBasedEngine:
+    lexicon_file = Path(lexicon_path) if lexicon_path else DATA_DIR / "pos_lexicon.json"
+    rules_file = Path(rules_path) if rules_path else DATA_DIR / "kc_rules.json"
+    with open(lexicon_file, "r", encoding="utf-8") as fh:
+        lexicon = json.load(fh)
+    with open(rules_file, "r", encoding="utf-8") as fh:
+        kc_rules = json.load(fh)
+    engine = RuleBasedEngine(lexicon, kc_rules)
+    logger.info("Loaded local grammar engine with %d lexicon entries", len(engine._tags))
+    return engine
+
+
+class LocalGrammarStats:
+    def __init__(self):
+        self.checked = 0
+        self.absorbed_correct = 0
+        self.absorbed_incorrect = 0
+
+    def record(self, verdict: Optional[Dict[str, object]]) -> None:
+        self.checked += 1
+        if verdict is None:
+            return
+        if verdict["is_correct"]:
+            self.absorbed_correct += 1
+        else:
+            self.absorbed_incorrect += 1
+
+    def as_dict(self) -> Dict[str, float]:
+        absorbed = self.absorbed_correct + self.absorbed_incorrect
+        return {
+            "checked": self.checked,
+            "absorbed_correct": self.absorbed_correct,
+            "absorbed_incorrect": self.absorbed_incorrect,
+            "fell_through": self.checked - absorbed,
+            "absorbed_share": absorbed / self.checked if self.checked else 0.0,
+        }
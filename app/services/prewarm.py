@@ -0,0 +1,250 @@
+import asyncio
+import logging
+import secrets
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal
+from app.models.submission import Submission
+from app.services import grammar
+from app.utils.normalize import CanonicalSentence
+from app.utils.redis_cache import SENTENCE_KEY_FORMAT, get_sentence_cache_many, redis, set_sentence_cache_many
+
+logger = logging.getLogger("grammar_cache")
+
+# The sentence cache is shared across KCs (see grammar.CACHE_KC_ID)
+CACHE_KC_ID = grammar.CACHE_KC_ID
+PREWARM_LOCK_KEY = "prewarm:lock"
+# Set once a run has filled the current key format (e.g. "prewarm:done:sc3"); a new prefix starts cold
+PREWARM_DONE_KEY = "prewarm:done:" + SENTENCE_KEY_FORMAT
+CHUNK_SIZE = 500
+
+
+class _Candidate:
+    __slots__ = ("canon", "count", "kc_counts", "payload")
+
+    def __init__(self, canon: CanonicalSentence):
+        self.canon = canon
+        self.count = 0
+        self.kc_counts: Counter = Counter()
+        self.payload: Optional[Dict] = None
+
+
+def _reusable_payload(feedback) -> Optional[Dict]:
+    """A stored submission verdict that is safe to serve from the cache, if any."""
+    if not isinstance(feedback, dict) or "is_correct" not in feedback:
+        return None
+    if "upstream_error" in feedback or feedback.get("degraded"):
+        return None
+    # Unstamped rows predate the current key format; some were served another spelling's
+    # verdict under the old lossy key and look no different, so they are re-graded instead
+    if feedback.get("cache_key_format") != SENTENCE_KEY_FORMAT:
+        return None
+    # Older rows stored Sapling failures as incorrect-with-nothing-highlighted
+    if not feedback.get("is_correct") and not feedback.get("error_indices"):
+        return None
+    return {k: v for k, v in feedback.items() if k != "cache_key_format"}
+
+
+async def scan_submissions(
+    db: AsyncSession,
+    since: Optional[datetime] = None,
+    yield_per: int = 1000,
+) -> Tuple[int, Dict[str, _Candidate]]:
+    """Stream submissions through a server-side cursor and count them per canonical sentence."""
+    stmt = select(Submission.kc_id, Submission.sentence, Submission.feedback).order_by(Submission.id)
+    if since is not None:
+        stmt = stmt.where(Submission.created_at >= since)
+
+    total = 0
+    candidates: Dict[str, _Candidate] = {}
+    result = await db.stream(stmt.execution_options(yield_per=yield_per))
+    async for kc_id, sentence, feedback in result:
+        total += 1
+        canon = CanonicalSentence(sentence)
+        candidate = candidates.get(canon.key)
+        if candidate is None:
+            candidate = candidates[canon.key] = _Candidate(canon)
+        candidate.count += 1
+        candidate.kc_counts[kc_id] += 1
+        # Rows come oldest first, so the newest usable verdict wins
+        payload = _reusable_payload(feedback)
+        if payload is not None:
+            candidate.canon = canon
+            candidate.payload = grammar.canonical_payload(canon, payload)
+    return total, candidates
+
+
+def rank_candidates(candidates: Dict[str, _Candidate]) -> List[Tuple[str, _Candidate]]:
+    """Interleave each KC's most frequent sentences so no KC is starved by a busier one."""
+    per_kc: Dict[int, List[Tuple[int, str]]] = defaultdict(list)
+    kc_volume: Counter = Counter()
+    for key, candidate in candidates.items():
+        for kc_id, count in candidate.kc_counts.items():
+            per_kc[kc_id].append((count, key))
+            kc_volume[kc_id] += count
+
+    queues = []
+    for kc_id, _ in kc_volume.most_common():
+        queues.append(iter(sorted(per_kc[kc_id], key=lambda item: -item[0])))
+
+    ranked: List[Tuple[str, _Candidate]] = []
+    seen = set()
+    while queues:
+        remaining = []
+        for queue in queues:
+            for _, key in queue:
+                if key not in seen:
+                    seen.add(key)
+                    ranked.append((key, candidates[key]))
+                    remaining.append(queue)
+                    break
+        queues = remaining
+    return ranked
+
+
+async def _grade(candidates: List[_Candidate], concurrency: int) -> Counter:
+    """Grade sentences through check_sentence at prewarm priority and tally the outcomes."""
+    semaphore = asyncio.Semaphore(concurrency)
+    outcome: Counter = Counter()
+
+    async def one(candidate: _Candidate):
+        async with semaphore:
+            # The KC it was mostly submitted under decides whether the local engine grades it
+            kc_id = candidate.kc_counts.most_common(1)[0][0] if candidate.kc_counts else None
+            result = await grammar.check_sentence(
+                candidate.canon.sentence, kc_id, priority=grammar.PRIORITY_PREWARM
+            )
+        if "upstream_error" in result:
+            outcome["failed"] += 1
+        elif result.get("source") in ("local", "answer_bank"):
+            # Served without Sapling on the live path too; nothing to cache
+            outcome["local"] += 1
+        else:
+            # check_sentence wrote the cache entry itself
+            outcome["warmed"] += 1
+            outcome["submissions"] += candidate.count
+
+    await asyncio.gather(*(one(candidate) for candidate in candidates))
+    return outcome
+
+
+async def prewarm_sentence_cache(
+    max_keys: int = settings.PREWARM_MAX_KEYS,
+    upstream_budget: int = settings.PREWARM_UPSTREAM_BUDGET,
+    lookback_days: Optional[int] = settings.PREWARM_LOOKBACK_DAYS,
+    concurrency: int = settings.PREWARM_CONCURRENCY,
+) -> Dict[str, object]:
+    """Fill the sentence cache with the most submitted sentences.
+
+    Stored submission verdicts are written back in pipelined batches; the
+    rest are graded upstream (at most `upstream_budget`). Hit-rate figures
+    are the share of scanned submissions whose sentence was cached before
+    and after the run.
+    """
+    since = datetime.now(timezone.utc) - timedelta(days=lookback_days) if lookback_days else None
+    async with AsyncSessionLocal() as db:
+        total, candidates = await scan_submissions(db, since)
+    ranked = rank_candidates(candidates)[:max_keys]
+
+    already_cached = from_history = 0
+    covered_before = gained = 0
+    to_grade: List[_Candidate] = []
+    for start in range(0, len(ranked), CHUNK_SIZE):
+        chunk = ranked[start:start + CHUNK_SIZE]
+        cached = await get_sentence_cache_many([(key, CACHE_KC_ID) for key, _ in chunk])
+
+        writes = []
+        chunk_gain = 0
+        for (key, candidate), hit in zip(chunk, cached):
+            if hit is not None:
+                already_cached += 1
+                covered_before += candidate.count
+            elif candidate.payload is not None:
+                writes.append((key, CACHE_KC_ID, candidate.payload))
+                chunk_gain += candidate.count
+            else:
+                to_grade.append(candidate)
+        # Keep the warmed keys out of this worker's L1 so they don't evict live traffic
+        written = await set_sentence_cache_many(writes, fill_l1=False)
+        if written:
+            from_history += written
+            gained += chunk_gain
+
+    budgeted = to_grade[:max(0, upstream_budget)]
+    graded = await _grade(budgeted, concurrency)
+    from_upstream = graded["warmed"]
+    gained += graded["submissions"]
+
+    report = {
+        "submissions_scanned": total,
+        "distinct_sentences": len(candidates),
+        "considered": len(ranked),
+        "already_cached": already_cached,
+        "warmed_from_history": from_history,
+        "warmed_from_upstream": from_upstream,
+        "graded_locally": graded["local"],
+        "upstream_failed": graded["failed"],
+        "skipped_over_budget": len(to_grade) - len(budgeted),
+        "keys_warmed": from_history + from_upstream,
+        "estimated_hit_rate_before": covered_before / total if total else 0.0,
+        "estimated_hit_rate_after": (covered_before + gained) / total if total else 0.0,
+    }
+    report["estimated_hit_rate_gain"] = report["estimated_hit_rate_after"] - report["estimated_hit_rate_before"]
+    logger.info(
+        "Prewarm warmed %d keys (%d from history, %d upstream); est. hit rate %.1f%% -> %.1f%%",
+        report["keys_warmed"], from_history, from_upstream,
+        100 * report["estimated_hit_rate_before"], 100 * report["estimated_hit_rate_after"],
+    )
+    try:
+        await redis.set(PREWARM_DONE_KEY, datetime.now(timezone.utc).isoformat())
+    except Exception as e:
+        logger.error("Redis prewarm marker failed: %s", e)
+    return report
+
+
+# -------------------------------
+# Background job (one worker per deployment)
+# -------------------------------
+_prewarm_task: Optional[asyncio.Task] = None
+
+
+async def _run_prewarm_job() -> None:
+    await asyncio.sleep(settings.PREWARM_STARTUP_DELAY_SECONDS)
+    try:
+        if not settings.PREWARM_ON_STARTUP and await redis.exists(PREWARM_DONE_KEY):
+            # Only here for a cache key format change, and this format is warm already
+            return
+        # Only one worker runs the job; the lock outlives a normal run
+        if not await redis.set(PREWARM_LOCK_KEY, secrets.token_hex(8), nx=True, ex=3600):
+            logger.info("Prewarm already ran or is running on another worker")
+            return
+    except Exception as e:
+        logger.error("Redis prewarm lock failed: %s", e)
+        return
+    try:
+        await prewarm_sentence_cache()
+    except Exception as e:
+        logger.exception("Prewarm job failed: %s", e)
+
+
+def start_prewarm_job() -> None:
+    global _prewarm_task
+    if _prewarm_task is None and (settings.PREWARM_ON_STARTUP or settings.PREWARM_ON_CACHE_FORMAT_CHANGE):
+        _prewarm_task = asyncio.create_task(_run_prewarm_job())
+
+
+async def stop_prewarm_job() -> None:
+    global _prewarm_task
+    if _prewarm_task is not None:
+        _prewarm_task.cancel()
+        try:
+            await _prewarm_task
+        except asyncio.CancelledError:
+            pass
+        _prewarm_task = None
@@ -0,0 +1,262 @@
+import asyncio
+import json
+import logging
+import secrets
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal
+from app.crud.submission import insert_submissions, submission_values
+from app.utils.redis_cache import redis
+
+logger = logging.getLogger("uvicorn")
+
+SPOOL_STREAM_KEY = "submissions:spool"
+SPOOL_RECOVER_LOCK_KEY = "submissions:spool:recover"
+RECOVER_CHUNK_SIZE = 500
+
+
+def _encode_row(row: Dict[str, Any]) -> str:
+    return json.dumps({**row, "created_at": row["created_at"].isoformat()}, separators=(",", ":"))
+
+
+def _decode_row(data: str) -> Dict[str, Any]:
+    row = json.loads(data)
+    row["created_at"] = datetime.fromisoformat(row["created_at"])
+    return row
+
+
+class SubmissionWriter:
+    """Per-worker write-behind buffer for submissions rows.
+
+    Requests only append to the buffer; a background task flushes it in
+    bulk once `flush_size` rows are waiting or every `flush_interval`
+    seconds, and `stop()` drains whatever is left. With `spool` on, each
+    row is first XADDed to a Redis stream and XDELed once inserted, so rows
+    held by a worker that crashed are replayed by `recover()`.
+
+    Every row carries a random idempotency key and inserts skip keys that
+    are already stored, so a row written by both its owner and `recover()`
+    (a live worker stuck retrying, or a failed XDEL) is only stored once.
+
+    A batch the database rejects outright (e.g. an FK violation for a
+    deleted user) is split until the offending rows are isolated; those
+    are logged, counted as `rejected` and never retried, so they cannot
+    hold up the rows queued behind them.
+    """
+
+    def __init__(
+        self,
+        flush_size: int = 200,
+        flush_interval: float = 0.5,
+        max_pending: int = 10000,
+        spool: bool = False,
+        recover_age: float = 120.0,
+    ):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.spool = spool
+        self.recover_age = recover_age
+
+        self._pending: List[Tuple[Optional[str], Dict[str, Any]]] = []  # (stream id, row)
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.recovered = 0
+
+    async def enqueue(self, user_id: int, kc_id: int, sentence: str, feedback: dict) -> None:
+        row = submission_values(user_id, kc_id, sentence, feedback)
+        row["created_at"] = datetime.now(timezone.utc)
+        row["idempotency_key"] = secrets.token_hex(16)
+
+        stream_id = None
+        if self.spool:
+            try:
+                stream_id = await redis.xadd(SPOOL_STREAM_KEY, {"row": _encode_row(row)})
+            except Exception as e:
+                logger.error("Redis spool XADD failed: %s", e)
+
+        if len(self._pending) >= self.max_pending:
+            # Spooled rows are still replayed by recover(); the rest are lost
+            self.dropped += 1
+            logger.error("Submission buffer full (%d rows), dropping row for user %s", len(self._pending), user_id)
+            return
+        self._pending.append((stream_id, row))
+        self.enqueued += 1
+        if len(self._pending) >= self.flush_size:
+            self._wakeup.set()
+
+    async def flush(self, drain: bool = False) -> None:
+        """Insert buffered rows in batches of `flush_size`; with `drain`, everything buffered."""
+        async with self._flush_lock:
+            while self._pending and (drain or len(self._pending) >= self.flush_size):
+                batch = self._pending[:self.flush_size]
+                del self._pending[:len(batch)]
+                try:
+                    await self._write_splitting(batch)
+                except Exception as e:
+                    self.failed_flushes += 1
+                    logger.error("Submission flush of %d rows failed: %s", len(batch), e)
+                    # Keep them for the next attempt, ahead of newer rows
+                    self._pending[:0] = batch
+                    return
+                self.written += len(batch)
+                self.batches += 1
+                await self._unspool([stream_id for stream_id, _ in batch if stream_id is not None])
+
+    async def _write(self, rows: List[Dict[str, Any]]) -> None:
+        async with AsyncSessionLocal() as db:
+            await insert_submissions(db, rows)
+            await db.commit()
+
+    async def _write_splitting(self, batch: List[Tuple[Optional[str], Dict[str, Any]]]) -> None:
+        """Write a batch, bisecting it on rows the database rejects and dropping those.
+
+        Other errors (connection, timeout) propagate so the caller retries;
+        halves already committed by then are skipped on retry by their keys.
+        """
+        try:
+            await self._write([row for _, row in batch])
+            return
+        except (IntegrityError, DataError) as e:
+            if len(batch) > 1:
+                middle = len(batch) // 2
+                await self._write_splitting(batch[:middle])
+                await self._write_splitting(batch[middle:])
+                return
+            error = e
+        stream_id, row = batch[0]
+        self.rejected += 1
+        logger.error("Submission row rejected, not retrying: %s (row %s)", error.orig, _encode_row(row))
+        if stream_id is not None:
+            # Otherwise recover() would replay it forever
+            await self._unspool([stream_id])
+
+    async def _unspool(self, stream_ids: List[str]) -> None:
+        if not stream_ids:
+            return
+        try:
+            await redis.xdel(SPOOL_STREAM_KEY, *stream_ids)
+        except Exception as e:
+            # Left in the stream: recover() replays them, which the idempotency key makes a no-op
+            logger.error("Redis spool XDEL failed for %d rows: %s", len(stream_ids), e)
+
+    async def recover(self) -> int:
+        """Insert spooled rows old enough to belong to a dead worker. Returns the count.
+
+        A live worker may still hold some of them (e.g. retrying through a
+        long DB outage); its later flush skips whatever was replayed here.
+        """
+        token = secrets.token_hex(8)
+        try:
+            if not await redis.set(SPOOL_RECOVER_LOCK_KEY, token, nx=True, ex=300):
+                return 0
+        except Exception as e:
+            logger.error("Redis spool recovery lock failed: %s", e)
+            return 0
+
+        recovered = 0
+        try:
+            cutoff_ms = int((time.time() - self.recover_age) * 1000)
+            while True:
+                entries = await redis.xrange(SPOOL_STREAM_KEY, "-", f"{cutoff_ms}", count=RECOVER_CHUNK_SIZE)
+                if not entries:
+                    break
+                await self._write_splitting([(None, _decode_row(fields["row"])) for _, fields in entries])
+                await redis.xdel(SPOOL_STREAM_KEY, *[stream_id for stream_id, _ in entries])
+                recovered += len(entries)
+        except Exception as e:
+            logger.error("Submission spool recovery failed after %d rows: %s", recovered, e)
+        finally:
+            try:
+                await redis.delete(SPOOL_RECOVER_LOCK_KEY)
+            except Exception:
+                pass
+
+        if recovered:
+            self.recovered += recovered
+            logger.warning("Recovered %d spooled submissions", recovered)
+        return recovered
+
+    async def _run(self) -> None:
+        last_recover = 0.0
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush(drain=True)
+            if self._stopping:
+                break
+            if self.spool and time.monotonic() - last_recover >= self.recover_age:
+                last_recover = time.monotonic()
+                await self.recover()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            # Let the loop finish its current flush rather than cancel it mid-INSERT
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._stopping = False
+        await self.flush(drain=True)
+        if self._pending:
+            logger.error("Shutting down with %d unwritten submissions", len(self._pending))
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "pending": len(self._pending),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "batches": self.batches,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "recovered": self.recovered,
+            "spool": self.spool,
+        }
+
+
+_writer = SubmissionWriter(
+    flush_size=settings.SUBMISSION_FLUSH_SIZE,
+    flush_interval=settings.SUBMISSION_FLUSH_INTERVAL_MS / 1000,
+    max_pending=settings.SUBMISSION_QUEUE_MAX,
+    spool=settings.SUBMISSION_SPOOL_ENABLED,
+    recover_age=settings.SUBMISSION_SPOOL_RECOVER_AGE_SECONDS,
+)
+
+
+async def enqueue_submission(user_id: int, kc_id: int, sentence: str, feedback: dict) -> None:
+    await _writer.enqueue(user_id, kc_id, sentence, feedback)
+
+
+def submission_writer_stats() -> Dict[str, object]:
+    return _writer.stats()
+
+
+def start_submission_writer() -> None:
+    if settings.SUBMISSION_WRITE_BEHIND:
+        _writer.start()
+
+
+async def stop_submission_writer() -> None:
+    await _writer.stop()
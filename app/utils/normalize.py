@@ -1,7 +1,91 @@
 import re
+from typing import Optional
 
 def normalize_sentence(sentence: str) -> str:
     s = sentence.strip().lower()
     s = re.sub(r'[.?!]+$', '', s) # remove trailing punctuation(?)
     s = re.sub(r'\s+', ' ', s) # collapse whitespace
-    return s
\ No newline at end of file
+    return s
+
+# -------------------------------
+# Canonical token form (sentence cache identity)
+# -------------------------------
+# One-for-one replacements only, so character offsets into the caller's text stay valid
+_QUOTES = str.maketrans({
+    "‘": "'", "’": "'", "‚": "'", "‛": "'", "′": "'",
+    "“": '"', "”": '"', "„": '"', "‟": '"', "″": '"',
+    "–": "-", "—": "-",
+})
+# Words (with inner apostrophes/hyphens) or any single other character
+_SUBTOKEN = re.compile(r"[^\W_]+(?:['-][^\W_]+)*|\S")
+
+
+def same_canonical_text(a: str, b: str) -> bool:
+    """True if two strings differ only in what the canonical key ignores (whitespace, quote style)."""
+    return "".join(a.translate(_QUOTES).split()) == "".join(b.translate(_QUOTES).split())
+
+
+def _case_class(token: str) -> str:
+    if token.lower() == token.upper():
+        return "-"
+    if token.islower():
+        return "l"
+    if token[0].isupper() and token[1:] == token[1:].lower():
+        return "c"
+    if token.isupper():
+        return "u"
+    return token  # mixed case: keep it exact
+
+
+class CanonicalSentence:
+    """A sentence split into canonical tokens, with a map back to the caller's tokens.
+
+    Punctuation becomes its own token, curly quotes are straightened and
+    whitespace is irrelevant, so "I am happy ." and "I am  happy." share a
+    key. Casing is kept in the key as a per-token signature, so "i am happy"
+    does not. `token_of[i]` is the caller's whitespace-token index that
+    canonical token `i` came from.
+    """
+
+    __slots__ = ("sentence", "tokens", "spans", "token_of", "layout", "key")
+
+    def __init__(self, sentence: str):
+        self.sentence = sentence
+        self.tokens: list[str] = []
+        self.spans: list[tuple[int, int]] = []
+        self.token_of: list[int] = []
+        self.layout: list[int] = []  # canonical tokens per caller token
+        for index, word in enumerate(re.finditer(r"\S+", sentence.translate(_QUOTES))):
+            count = 0
+            for part in _SUBTOKEN.finditer(word.group()):
+                self.tokens.append(part.group())
+                self.spans.append((word.start() + part.start(), word.start() + part.end()))
+                self.token_of.append(index)
+                count += 1
+            self.layout.append(count)
+        self.key = " ".join(t.lower() for t in self.tokens) + "\x1e" + ",".join(_case_class(t) for t in self.tokens)
+
+    def to_original(self, indices) -> list[int]:
+        """Canonical token indices -> the caller's whitespace-token indices."""
+        return sorted({self.token_of[i] for i in indices if 0 <= i < len(self.token_of)})
+
+    def from_original(self, indices) -> list[int]:
+        wanted = set(indices)
+        return [i for i, token in enumerate(self.token_of) if token in wanted]
+
+    def locate(self, start: int, end: int) -> Optional[list]:
+        """Character span in the caller's text -> [first, offset, last, offset] in canonical tokens."""
+        hit = [i for i, (s, e) in enumerate(self.spans) if e > start and s < end]
+        if not hit:
+            return None
+        first, last = hit[0], hit[-1]
+        return [
+            first,
+            max(0, start - self.spans[first][0]),
+            last,
+            min(end, self.spans[last][1]) - self.spans[last][0],
+        ]
+
+    def text(self, first: int, first_offset: int, last: int, last_offset: int) -> str:
+        """The caller's text covered by a span returned from `locate` (on any sentence with this key)."""
+        return self.sentence[self.spans[first][0] + first_offset:self.spans[last][0] + last_offset]
@@ -1,10 +1,14 @@
-import json
 import logging
-from collections.abc import Mapping
-from typing import Any, Optional
+import secrets
+import time
+from typing import Any, Iterable, Optional, Sequence
 from os import getenv
 from redis.asyncio import from_url as redis_from_url
 
+from app.core.config import settings
+from app.utils.sentence_codec import decode_payload, encode_payload, sentence_digest
+from app.utils.ttl_cache import TTLCache
+
 logger = logging.getLogger(__name__)
 
 # Read REDIS_URL from environment; fall back to localhost for local dev
@@ -12,46 +16,291 @@ REDIS_URL = getenv("REDIS_URL", "redis://localhost:6379")
 
 # Create async Redis client from connection URL (works for redis:// or rediss://)
 redis = redis_from_url(REDIS_URL, decode_responses=True)
+# Binary-safe client for the compact sentence cache entries
+redis_bytes = redis_from_url(REDIS_URL)
+
+SENTENCE_CACHE_TTL = 2592000  # 30 days
+SENTENCE_KEY_PREFIX = b"sc3:"  # sc3: canonical token keys (sc2 entries used the old lossy normalization)
+SENTENCE_KEY_FORMAT = SENTENCE_KEY_PREFIX.decode().rstrip(":")
+
+# L1: per-worker LRU of decoded payloads in front of Redis (L2)
+_l1 = TTLCache(
+    max_entries=settings.SENTENCE_L1_MAX_ENTRIES,
+    default_ttl=settings.SENTENCE_L1_TTL_SECONDS,
+    max_bytes=settings.SENTENCE_L1_MAX_BYTES,
+)
+_l2_stats = {"hits": 0, "misses": 0, "errors": 0}
+
+
+def sentence_cache_stats() -> dict[str, Any]:
+    return {"l1": _l1.stats(), "l2": dict(_l2_stats)}
+
+
+def _l1_get(key: bytes):
+    if not settings.SENTENCE_L1_ENABLED:
+        return None
+    cached = _l1.get(key)
+    # Shallow copy: callers set "from_cache" on the returned dict
+    return dict(cached) if cached is not None else None
+
+
+def _l1_set(key: bytes, payload: dict[str, Any], size: int) -> None:
+    if settings.SENTENCE_L1_ENABLED:
+        _l1.set(key, dict(payload), size=size)
+
+
+def _cache_key(normalized: str, kc_id: Optional[int]) -> bytes:
+    """Fixed-size key; the sentence text lives only in the value."""
+    return SENTENCE_KEY_PREFIX + sentence_digest(normalized, kc_id)
+
+
+def _log_key(key: bytes) -> str:
+    return key[: len(SENTENCE_KEY_PREFIX)].decode() + key[len(SENTENCE_KEY_PREFIX):].hex()
+
+
+def _encode(normalized: str, payload: dict[str, Any]) -> Optional[bytes]:
+    try:
+        return encode_payload(normalized, payload, settings.SENTENCE_CACHE_COMPRESS_THRESHOLD)
+    except (TypeError, ValueError) as exc:
+        logger.error("Failed to serialise payload for '%s': %s", normalized, exc)
+        return None
 
-def _cache_key(normalized: str, kc_id: Optional[int]) -> str:
-    key = f"sentence_cache:{normalized}"
-    if kc_id is not None:
-        key = f"{key}:kc:{kc_id}"
-    return key
 
 async def get_sentence_cache(normalized: str, kc_id: Optional[int]):
     key = _cache_key(normalized, kc_id)
+    cached = _l1_get(key)
+    if cached is not None:
+        logger.debug("[L1 HIT] %s", _log_key(key))
+        return cached
+
     try:
-        data = await redis.get(key)
+        data = await redis_bytes.get(key)
     except Exception as e:
-        logger.error("Redis get failed for %s: %s", key, e)
+        _l2_stats["errors"] += 1
+        logger.error("Redis get failed for %s: %s", _log_key(key), e)
         return None
 
+    return _resolve(normalized, key, data)
+
+
+def _resolve(normalized: str, key: bytes, data: Optional[bytes]):
+    """Turn the raw L2 value for one sentence into a payload (or a miss)."""
     if data:
         try:
-            cached = json.loads(data)
-        except json.JSONDecodeError:
-            logger.warning("Failed to decode cached payload for %s", key)
+            stored_text, cached = decode_payload(data)
+        except Exception:
+            logger.warning("Failed to decode cached payload for %s", _log_key(key))
             return None
-        logger.info("[CACHE HIT] %s", key)
-        if isinstance(cached, Mapping):
-            cached.setdefault("feedback", [])
-            cached.setdefault("error_indices", [])
-            cached.setdefault("is_correct", False)
+        if stored_text != normalized:
+            # 128-bit digest collision: treat as a miss rather than serve another sentence's grade
+            logger.warning("Digest collision for %s", _log_key(key))
+            return None
+        _l2_stats["hits"] += 1
+        logger.info("[CACHE HIT] %s", _log_key(key))
+        _l1_set(key, cached, len(data))
         return cached
-    logger.info("[CACHE MISS] %s", key)
+
+    _l2_stats["misses"] += 1
+    logger.info("[CACHE MISS] %s", _log_key(key))
     return None
 
+
+async def get_sentence_cache_many(items: Sequence[tuple[str, Optional[int]]]) -> list[Optional[dict[str, Any]]]:
+    """Look up many (normalized, kc_id) pairs with one MGET; results keep input order."""
+    results: list[Optional[dict[str, Any]]] = [None] * len(items)
+    keys = [_cache_key(normalized, kc_id) for normalized, kc_id in items]
+    missing = []
+    for i, key in enumerate(keys):
+        cached = _l1_get(key)
+        if cached is not None:
+            results[i] = cached
+        else:
+            missing.append(i)
+    if not missing:
+        return results
+
+    try:
+        values = await redis_bytes.mget([keys[i] for i in missing])
+    except Exception as e:
+        _l2_stats["errors"] += 1
+        logger.error("Redis mget failed for %d keys: %s", len(missing), e)
+        return results
+
+    for i, data in zip(missing, values):
+        results[i] = _resolve(items[i][0], keys[i], data)
+    return results
+
+
 async def set_sentence_cache(normalized: str, kc_id: Optional[int], payload: dict[str, Any]):
     key = _cache_key(normalized, kc_id)
-    try:
-        value = json.dumps(payload)
-    except (TypeError, ValueError) as exc:
-        logger.error("Failed to serialise payload for %s: %s", key, exc)
+    value = _encode(normalized, payload)
+    if value is None:
         return
 
+    _l1_set(key, payload, len(value))
+    try:
+        await redis_bytes.set(key, value, ex=SENTENCE_CACHE_TTL)
+        logger.info("[CACHE SET] %s", _log_key(key))
+    except Exception as e:
+        logger.error("Redis set failed for %s: %s", _log_key(key), e)
+
+
+async def set_sentence_cache_many(
+    entries: Iterable[tuple[str, Optional[int], dict[str, Any]]],
+    fill_l1: bool = True,
+) -> int:
+    """Write many (normalized, kc_id, payload) entries in one pipeline. Returns the count written."""
+    encoded = []
+    for normalized, kc_id, payload in entries:
+        key = _cache_key(normalized, kc_id)
+        value = _encode(normalized, payload)
+        if value is None:
+            continue
+        if fill_l1:
+            _l1_set(key, payload, len(value))
+        encoded.append((key, value))
+    if not encoded:
+        return 0
+
+    try:
+        async with redis_bytes.pipeline(transaction=False) as pipe:
+            for key, value in encoded:
+                pipe.set(key, value, ex=SENTENCE_CACHE_TTL)
+            await pipe.execute()
+    except Exception as e:
+        logger.error("Redis pipelined set failed for %d keys: %s", len(encoded), e)
+        return 0
+    logger.info("[CACHE SET] %d keys (pipelined)", len(encoded))
+    return len(encoded)
+
+
+# -------------------------------
+# Negative cache (recent upstream failures)
+# -------------------------------
+# Kept apart from the sentence cache so a failure can never be read back as a grade
+def _negative_key(normalized: str, kc_id: Optional[int]) -> str:
+    return f"sentence_neg:{sentence_digest(normalized, kc_id).hex()}"
+
+
+async def get_negative_cache(normalized: str, kc_id: Optional[int]) -> Optional[str]:
+    """Return the recorded upstream error if this sentence failed recently."""
+    key = _negative_key(normalized, kc_id)
     try:
-        await redis.set(key, value, ex=2592000)  # 30 days TTL
-        logger.info("[CACHE SET] %s", key)
+        return await redis.get(key)
+    except Exception as e:
+        logger.error("Redis get failed for %s: %s", key, e)
+        return None
+
+
+async def get_negative_cache_many(items: Sequence[tuple[str, Optional[int]]]) -> list[Optional[str]]:
+    """Recorded upstream errors for many (normalized, kc_id) pairs with one MGET."""
+    if not items:
+        return []
+    try:
+        return await redis.mget([_negative_key(normalized, kc_id) for normalized, kc_id in items])
+    except Exception as e:
+        logger.error("Redis mget failed for %d negative keys: %s", len(items), e)
+        return [None] * len(items)
+
+
+async def set_negative_cache(normalized: str, kc_id: Optional[int], error: str) -> None:
+    key = _negative_key(normalized, kc_id)
+    try:
+        await redis.set(key, error, ex=settings.SENTENCE_NEGATIVE_TTL_SECONDS)
+        logger.info("[NEGATIVE SET] %s", key)
     except Exception as e:
         logger.error("Redis set failed for %s: %s", key, e)
+
+
+# -------------------------------
+# Cross-worker fill lock
+# -------------------------------
+# Delete the lock only if we still own it
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _lock_key(normalized: str, kc_id: Optional[int]) -> str:
+    return f"sentence_lock:{sentence_digest(normalized, kc_id).hex()}"
+
+
+async def acquire_sentence_lock(normalized: str, kc_id: Optional[int]) -> Optional[str]:
+    """Try to become the worker that fills this cache entry.
+
+    Returns an owner token on success and None if another worker holds the
+    lock. If Redis is unreachable we return a token anyway so callers proceed.
+    """
+    key = _lock_key(normalized, kc_id)
+    token = secrets.token_hex(8)
+    try:
+        acquired = await redis.set(key, token, nx=True, px=settings.SENTENCE_LOCK_TTL_MS)
+    except Exception as e:
+        logger.error("Redis lock failed for %s: %s", key, e)
+        return token
+    return token if acquired else None
+
+
+async def release_sentence_lock(normalized: str, kc_id: Optional[int], token: str) -> None:
+    key = _lock_key(normalized, kc_id)
+    try:
+        await redis.eval(_RELEASE_LOCK_SCRIPT, 1, key, token)
+    except Exception as e:
+        logger.error("Redis unlock failed for %s: %s", key, e)
+
+
+# -------------------------------
+# Shared Sapling limits
+# -------------------------------
+# KEYS[1] = zset of slot leases (token -> acquired at ms), KEYS[2] = per-second request counter
+# ARGV = now_ms, lease_ms, concurrency limit, rps limit, token
+# Returns 1 when admitted, 0 when all slots are taken, -1 when this second's budget is spent
+_ACQUIRE_SLOT_SCRIPT = """
+local now = tonumber(ARGV[1])
+redis.call('zremrangebyscore', KEYS[1], '-inf', now - tonumber(ARGV[2]))
+if redis.call('zcard', KEYS[1]) >= tonumber(ARGV[3]) then
+    return 0
+end
+local sent = redis.call('incr', KEYS[2])
+if sent == 1 then
+    redis.call('pexpire', KEYS[2], 2000)
+end
+if sent > tonumber(ARGV[4]) then
+    return -1
+end
+redis.call('zadd', KEYS[1], now, ARGV[5])
+return 1
+"""
+
+UPSTREAM_SLOTS_KEY = "sapling:{limits}:slots"
+
+
+def _rps_key(now_ms: int) -> str:
+    return f"sapling:{{limits}}:rps:{now_ms // 1000}"
+
+
+async def acquire_upstream_slot(token: str, concurrency: int, rps: int, lease_ms: int) -> Optional[int]:
+    """Try to take one of the Sapling slots shared by all workers.
+
+    Returns 1 (admitted), 0 (no free slot) or -1 (rate limited), and None if
+    Redis is unreachable, in which case callers fall back to local limits.
+    """
+    now_ms = int(time.time() * 1000)
+    try:
+        return int(await redis.eval(
+            _ACQUIRE_SLOT_SCRIPT, 2, UPSTREAM_SLOTS_KEY, _rps_key(now_ms),
+            now_ms, lease_ms, concurrency, rps, token,
+        ))
+    except Exception as e:
+        logger.error("Redis slot acquire failed: %s", e)
+        return None
+
+
+async def release_upstream_slot(token: str) -> None:
+    try:
+        await redis.zrem(UPSTREAM_SLOTS_KEY, token)
+    except Exception as e:
+        logger.error("Redis slot release failed: %s", e)
@@ -0,0 +1,67 @@
+import hashlib
+import zlib
+from typing import Any, Optional
+
+import msgpack
+
+# Value layout: [version byte][flags byte][msgpack record, optionally zlib'd]
+CODEC_VERSION = 2
+FLAG_ZLIB = 0x01
+
+_KNOWN_FIELDS = {"is_correct", "error_indices", "feedback", "scores", "candidates", "best_candidate", "from_cache"}
+
+
+def sentence_digest(normalized: str, kc_id: Optional[int]) -> bytes:
+    """Fixed 16-byte digest of the cache identity (normalized text + KC)."""
+    identity = f"{normalized}\x1f{'' if kc_id is None else kc_id}".encode("utf-8")
+    return hashlib.blake2b(identity, digest_size=16).digest()
+
+
+def encode_payload(normalized: str, payload: dict[str, Any], compress_threshold: int) -> bytes:
+    scores = payload.get("scores") or {}
+    if set(scores) <= {"sapling_edits"}:
+        scores = scores.get("sapling_edits", 0)  # the common case packs to a single int
+    extra = {k: v for k, v in payload.items() if k not in _KNOWN_FIELDS}
+    if payload.get("candidates"):
+        extra["candidates"] = payload["candidates"]
+
+    record = [
+        normalized,
+        bool(payload.get("is_correct")),
+        list(payload.get("error_indices", [])),
+        list(payload.get("feedback", [])),
+        scores,
+        payload.get("best_candidate"),
+        extra or None,
+    ]
+    body = msgpack.packb(record, use_bin_type=True)
+    flags = 0
+    if len(body) > compress_threshold:
+        compressed = zlib.compress(body, 6)
+        if len(compressed) < len(body):
+            body, flags = compressed, FLAG_ZLIB
+    return bytes([CODEC_VERSION, flags]) + body
+
+
+def decode_payload(data: bytes) -> tuple[str, dict[str, Any]]:
+    """Return (normalized text, payload). Raises ValueError on unknown formats."""
+    if len(data) < 2 or data[0] != CODEC_VERSION:
+        raise ValueError("Unknown sentence cache encoding")
+    body = data[2:]
+    if data[1] & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    normalized, is_correct, error_indices, feedback, scores, best_candidate, extra = msgpack.unpackb(
+        body, raw=False
+    )
+    payload: dict[str, Any] = {
+        "is_correct": is_correct,
+        "error_indices": error_indices,
+        "feedback": feedback,
+        "scores": {"sapling_edits": scores} if isinstance(scores, int) else scores,
+        "candidates": [],
+        "best_candidate": best_candidate,
+        "from_cache": False,
+    }
+    if extra:
+        payload.update(extra)
+    return normalized, payload
@@ -0,0 +1,72 @@
+import time
+from collections import deque
+from typing import Any, Awaitable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+class StageTimer:
+    """Wall-clock durations of the stages of one request.
+
+    Stages may overlap (e.g. run under asyncio.gather); each one is timed
+    on its own, and `total` covers the whole request.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    async def time(self, name: str, awaitable: Awaitable[T]) -> T:
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.stages[name] = time.perf_counter() - start
+
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """Value for the Server-Timing response header (durations in ms)."""
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={self.total() * 1000:.1f}")
+        return ", ".join(parts)
+
+
+class StageStats:
+    """Per-worker aggregate of StageTimer results (recent window for percentiles)."""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self.requests = 0
+        self._recent: Dict[str, deque] = {}
+        self._totals: Dict[str, float] = {}
+
+    def record(self, timer: StageTimer) -> None:
+        self.requests += 1
+        durations = dict(timer.stages)
+        durations["total"] = timer.total()
+        for name, seconds in durations.items():
+            recent = self._recent.get(name)
+            if recent is None:
+                recent = self._recent[name] = deque(maxlen=self.window)
+                self._totals[name] = 0.0
+            recent.append(seconds)
+            self._totals[name] += seconds
+
+    def as_dict(self) -> Dict[str, Any]:
+        stages = {}
+        for name, recent in self._recent.items():
+            ordered = sorted(recent)
+            stages[name] = {
+                "count": len(ordered),
+                "avg_ms": 1000 * sum(ordered) / len(ordered),
+                "p50_ms": 1000 * ordered[len(ordered) // 2],
+                "p95_ms": 1000 * ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max_ms": 1000 * ordered[-1],
+            }
+        return {"requests": self.requests, "stages": stages}
+
+
+# /gameplay/submit stage timings for /stats/submit
+submit_timings = StageStats()
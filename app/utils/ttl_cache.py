@@ -0,0 +1,88 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire individually.
+
+    Bounded by entry count and, optionally, by the total `size` reported by
+    callers on `set` (e.g. serialized byte length).
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        default_ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Hashable, tuple[float, Any, int]]" = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        deadline, value, _ = entry
+        if deadline <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, size: int = 0) -> None:
+        """Store `value` for `ttl` seconds (or the default TTL, or forever)."""
+        ttl = self.default_ttl if ttl is None else ttl
+        self._remove(key)
+        if ttl is not None and ttl <= 0:
+            return
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        deadline = time.monotonic() + ttl if ttl is not None else float("inf")
+        self._data[key] = (deadline, value, size)
+        self._bytes += size
+        while len(self._data) > self.max_entries or (
+            self.max_bytes is not None and self._bytes > self.max_bytes
+        ):
+            _, (_, _, evicted_size) = self._data.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._remove(key)
+        return default if entry is None else entry[1]
+
+    def _remove(self, key: Hashable):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+        return entry
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+from typing import Optional
+
+from pydantic import ValidationError
+
+from app.core.config import settings
+from app.schemas.user import UserOut
+from app.utils.redis_cache import redis
+from app.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_PREFIX = "user_identity:"
+USER_INVALIDATE_CHANNEL = "user_identity:invalidate"
+
+# L1: per-worker LRU of firebase_uid -> UserOut snapshot. Kept short-lived so a
+# missed invalidation message cannot serve stale identity for long.
+_local_users = TTLCache(
+    max_entries=settings.USER_CACHE_LOCAL_MAX_ENTRIES,
+    default_ttl=settings.USER_CACHE_LOCAL_TTL_SECONDS,
+)
+_listener_task: Optional[asyncio.Task] = None
+
+
+def _user_key(firebase_uid: str) -> str:
+    return f"{USER_CACHE_PREFIX}{firebase_uid}"
+
+
+async def get_cached_user(firebase_uid: str) -> Optional[UserOut]:
+    snapshot = _local_users.get(firebase_uid)
+    if snapshot is not None:
+        return snapshot
+
+    key = _user_key(firebase_uid)
+    try:
+        data = await redis.get(key)
+    except Exception as e:
+        logger.error("Redis get failed for %s: %s", key, e)
+        return None
+    if not data:
+        return None
+
+    try:
+        snapshot = UserOut.model_validate_json(data)
+    except ValidationError:
+        logger.warning("Failed to decode cached user for %s", key)
+        return None
+    _local_users.set(firebase_uid, snapshot)
+    return snapshot
+
+
+async def cache_user(user) -> UserOut:
+    """Store a snapshot of `user` in both tiers and return it."""
+    snapshot = UserOut.model_validate(user)
+    _local_users.set(snapshot.firebase_uid, snapshot)
+
+    key = _user_key(snapshot.firebase_uid)
+    try:
+        await redis.set(key, snapshot.model_dump_json(), ex=settings.USER_CACHE_TTL_SECONDS)
+    except Exception as e:
+        logger.error("Redis set failed for %s: %s", key, e)
+    return snapshot
+
+
+async def invalidate_user(firebase_uid: str) -> None:
+    """Drop the user from both tiers and tell the other workers to do the same."""
+    _local_users.pop(firebase_uid)
+    key = _user_key(firebase_uid)
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.delete(key)
+            pipe.publish(USER_INVALIDATE_CHANNEL, firebase_uid)
+            await pipe.execute()
+    except Exception as e:
+        logger.error("Redis invalidation failed for %s: %s", key, e)
+
+
+async def _listen_for_invalidations() -> None:
+    while True:
+        try:
+            pubsub = redis.pubsub()
+            await pubsub.subscribe(USER_INVALIDATE_CHANNEL)
+            try:
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        _local_users.pop(message["data"])
+            finally:
+                await pubsub.aclose()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Redis unavailable: the L1 TTL bounds staleness until we reconnect
+            logger.warning("User cache invalidation listener error: %s", e)
+            await asyncio.sleep(5)
+
+
+def start_user_cache_listener() -> None:
+    global _listener_task
+    if _listener_task is None:
+        _listener_task = asyncio.create_task(_listen_for_invalidations())
+
+
+async def stop_user_cache_listener() -> None:
+    global _listener_task
+    if _listener_task is not None:
+        _listener_task.cancel()
+        try:
+            await _listener_task
+        except asyncio.CancelledError:
+            pass
+        _listener_task = None
@@ -0,0 +1,140 @@
+import pytest
+
+from app.crud import knowledge as knowledge_crud
+from app.services import bkt_refit
+from app.services.bkt import update_bkt
+
+pytestmark = pytest.mark.anyio
+
+
+async def _row(db, user_id, kc_id):
+    db.expire_all()
+    return await knowledge_crud.get_knowledge_row(db, user_id, kc_id)
+
+
+@pytest.mark.parametrize("is_correct", [True, False])
+async def test_upsert_new_row_matches_update_bkt(db_sessionmaker, is_correct):
+    async with db_sessionmaker() as db:
+        p_know = await knowledge_crud.upsert_knowledge(db, 1, 10, is_correct)
+        await db.commit()
+        row = await _row(db, 1, 10)
+
+    expected = update_bkt(
+        knowledge_crud.DEFAULT_P_KNOW, is_correct,
+        knowledge_crud.DEFAULT_SLIP, knowledge_crud.DEFAULT_GUESS, knowledge_crud.DEFAULT_TRANSIT,
+    )
+    assert p_know == pytest.approx(expected, rel=1e-12, abs=1e-15)
+    assert row.p_know == p_know
+    assert (row.attempts, row.correct) == (1, 1 if is_correct else 0)
+    assert (row.slip, row.guess, row.transit) == (
+        knowledge_crud.DEFAULT_SLIP, knowledge_crud.DEFAULT_GUESS, knowledge_crud.DEFAULT_TRANSIT,
+    )
+
+
+@pytest.mark.parametrize("prior", [0.0, 0.05, 0.5, 0.93, 1.0])
+@pytest.mark.parametrize("is_correct", [True, False])
+async def test_upsert_existing_row_matches_update_bkt(db_sessionmaker, prior, is_correct):
+    slip, guess, transit = 0.07, 0.31, 0.22
+    async with db_sessionmaker() as db:
+        await knowledge_crud.upsert_knowledge_states(db, [{
+            "user_id": 1, "kc_id": 10, "attempts": 4, "correct": 2,
+            "p_know": prior, "slip": slip, "guess": guess, "transit": transit,
+        }])
+        await db.commit()
+
+        p_know = await knowledge_crud.upsert_knowledge(db, 1, 10, is_correct)
+        await db.commit()
+        row = await _row(db, 1, 10)
+
+    # The stored per-row slip/guess/transit are used, not the defaults
+    assert p_know == pytest.approx(update_bkt(prior, is_correct, slip, guess, transit), rel=1e-12, abs=1e-15)
+    assert row.p_know == p_know
+    assert (row.attempts, row.correct) == (5, 3 if is_correct else 2)
+
+
+async def test_upsert_sequence_matches_update_bkt(db_sessionmaker):
+    answers = [True, True, False, True, False, False, True, True, True, False]
+    expected = knowledge_crud.DEFAULT_P_KNOW
+    async with db_sessionmaker() as db:
+        for is_correct in answers:
+            p_know = await knowledge_crud.upsert_knowledge(db, 1, 10, is_correct)
+            await db.commit()
+            expected = update_bkt(
+                expected, is_correct,
+                knowledge_crud.DEFAULT_SLIP, knowledge_crud.DEFAULT_GUESS, knowledge_crud.DEFAULT_TRANSIT,
+            )
+            assert p_know == pytest.approx(expected, rel=1e-12, abs=1e-15)
+        row = await _row(db, 1, 10)
+    assert (row.attempts, row.correct) == (len(answers), sum(answers))
+
+
+# -------------------------------
+# Fitted per-KC parameters
+# -------------------------------
+FIT = {"L0": 0.4, "T": 0.31, "S": 0.07, "G": 0.26}
+
+
+async def test_refit_params_apply_to_existing_and_new_rows(db_sessionmaker):
+    async with db_sessionmaker() as db:
+        await knowledge_crud.upsert_knowledge(db, 1, 10, True)
+        await knowledge_crud.upsert_knowledge(db, 1, 11, True)
+        await db.commit()
+        assert await bkt_refit.write_params(db, {10: FIT}) == 1
+        await db.commit()
+
+        existing = await _row(db, 1, 10)
+        assert (existing.slip, existing.guess, existing.transit) == (FIT["S"], FIT["G"], FIT["T"])
+        other_kc = await _row(db, 1, 11)
+        assert other_kc.slip == knowledge_crud.DEFAULT_SLIP
+
+        assert await knowledge_crud.get_kc_params(db, 10) == (FIT["S"], FIT["G"], FIT["T"])
+        p_know = await knowledge_crud.upsert_knowledge(db, 2, 10, False)
+        await db.commit()
+        new = await _row(db, 2, 10)
+
+    assert (new.slip, new.guess, new.transit) == (FIT["S"], FIT["G"], FIT["T"])
+    expected = update_bkt(knowledge_crud.DEFAULT_P_KNOW, False, FIT["S"], FIT["G"], FIT["T"])
+    assert p_know == pytest.approx(expected, rel=1e-12, abs=1e-15)
+
+
+async def test_refit_replaces_stored_params(db_sessionmaker):
+    async with db_sessionmaker() as db:
+        await bkt_refit.write_params(db, {10: FIT})
+        await bkt_refit.write_params(db, {10: {**FIT, "S": 0.12}})
+        await db.commit()
+        assert await knowledge_crud.get_kc_params(db, 10) == (0.12, FIT["G"], FIT["T"])
+        assert await knowledge_crud.get_kc_params(db, 99) == (
+            knowledge_crud.DEFAULT_SLIP, knowledge_crud.DEFAULT_GUESS, knowledge_crud.DEFAULT_TRANSIT,
+        )
+
+
+async def test_state_flush_keeps_refit_params(db_sessionmaker):
+    state = {"user_id": 1, "kc_id": 10, "attempts": 1, "correct": 1, "p_know": 0.5,
+             "slip": knowledge_crud.DEFAULT_SLIP, "guess": knowledge_crud.DEFAULT_GUESS,
+             "transit": knowledge_crud.DEFAULT_TRANSIT}
+    async with db_sessionmaker() as db:
+        await knowledge_crud.upsert_knowledge_states(db, [state])
+        await bkt_refit.write_params(db, {10: FIT})
+        await db.commit()
+        # A Redis hash read before the refit still carries the old params
+        await knowledge_crud.upsert_knowledge_states(db, [{**state, "attempts": 2, "p_know": 0.6}])
+        await db.commit()
+        row = await _row(db, 1, 10)
+
+    assert (row.attempts, row.p_know) == (2, 0.6)
+    assert (row.slip, row.guess, row.transit) == (FIT["S"], FIT["G"], FIT["T"])
+
+
+async def test_refit_ignores_ungraded_submissions(db_sessionmaker):
+    from app.models import Submission
+
+    async with db_sessionmaker() as db:
+        db.add_all([
+            Submission(user_id=1, kc_id=10, sentence="a", is_correct=1, feedback={}),
+            Submission(user_id=1, kc_id=10, sentence="b", is_correct=None, feedback={"ungraded": True}),
+            Submission(user_id=1, kc_id=10, sentence="c", is_correct=0, feedback={}),
+        ])
+        await db.commit()
+        streamed = [(kc_id, {user: bytes(seq) for user, seq in seqs.items()})
+                    async for kc_id, seqs in bkt_refit.stream_kc_sequences(db)]
+    assert streamed == [(10, {1: bytes([1, 0])})]
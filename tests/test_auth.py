@@ -0,0 +1,240 @@
+import asyncio
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+
+from app.core import firebase, security, session
+from app.core.firebase import LocalTokenVerifier, StaticKeySource
+
+PROJECT_ID = "grammar-heroes-test"
+ISSUER = f"https://securetoken.google.com/{PROJECT_ID}"
+
+
+def _private_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+KEY_A = _private_key()
+KEY_B = _private_key()
+
+
+def _token(key=KEY_A, kid="a", **overrides) -> str:
+    now = int(time.time())
+    claims = {"aud": PROJECT_ID, "iss": ISSUER, "sub": "uid-1", "iat": now - 10, "exp": now + 3600}
+    claims.update(overrides)
+    return jwt.encode(claims, key, algorithm="RS256", headers={"kid": kid})
+
+
+def _verifier(keys=None, **kwargs) -> LocalTokenVerifier:
+    verifier = LocalTokenVerifier(PROJECT_ID, StaticKeySource(keys or {"a": KEY_A.public_key()}), **kwargs)
+    asyncio.run(verifier.refresh())
+    return verifier
+
+
+def _rejects(verifier: LocalTokenVerifier, token: str) -> None:
+    with pytest.raises(HTTPException) as exc:
+        verifier.verify(token)
+    assert exc.value.status_code == 401
+
+
+# -------------------------------
+# Local verifier
+# -------------------------------
+def test_local_verifier_accepts_valid_token():
+    decoded = _verifier().verify(_token())
+    assert decoded["uid"] == "uid-1"
+    assert decoded["aud"] == PROJECT_ID
+
+
+def test_local_verifier_rejects_wrong_audience():
+    _rejects(_verifier(), _token(aud="some-other-project"))
+
+
+def test_local_verifier_rejects_wrong_issuer():
+    _rejects(_verifier(), _token(iss="https://securetoken.google.com/some-other-project"))
+
+
+def test_local_verifier_rejects_expired_token():
+    now = int(time.time())
+    _rejects(_verifier(), _token(iat=now - 7200, exp=now - 3600))
+
+
+def test_local_verifier_rejects_bad_signature():
+    _rejects(_verifier(), _token(key=KEY_B, kid="a"))
+
+
+def test_unknown_kid_requests_refresh():
+    verifier = _verifier(min_refresh_seconds=0)
+    _rejects(verifier, _token(key=KEY_B, kid="b"))
+    assert verifier._wakeup.is_set()
+
+
+def test_unknown_kid_refresh_is_rate_limited():
+    verifier = _verifier(min_refresh_seconds=60)
+    _rejects(verifier, _token(key=KEY_B, kid="b"))
+    assert not verifier._wakeup.is_set()
+
+
+class RotatingKeySource:
+    """Serves key "a" first, then "a" and the rotated-in key "b"."""
+
+    def __init__(self):
+        self.fetches = 0
+
+    async def fetch(self):
+        self.fetches += 1
+        keys = {"a": KEY_A.public_key()}
+        if self.fetches > 1:
+            keys["b"] = KEY_B.public_key()
+        return keys, None
+
+
+def test_unknown_kid_is_accepted_after_background_refresh():
+    async def scenario():
+        source = RotatingKeySource()
+        verifier = LocalTokenVerifier(PROJECT_ID, source, min_refresh_seconds=0)
+        await verifier.start()
+        try:
+            token = _token(key=KEY_B, kid="b")
+            _rejects(verifier, token)
+            for _ in range(10):
+                await asyncio.sleep(0)
+                if source.fetches > 1:
+                    break
+            assert source.fetches == 2
+            assert verifier.verify(token)["uid"] == "uid-1"
+        finally:
+            await verifier.stop()
+
+    asyncio.run(scenario())
+
+
+# -------------------------------
+# Fallback to the Firebase Admin SDK
+# -------------------------------
+@pytest.fixture
+def sdk(monkeypatch):
+    calls = []
+
+    def verify(id_token):
+        calls.append(id_token)
+        if id_token == "bad":
+            raise ValueError("invalid token")
+        return {"uid": "sdk-uid", "exp": time.time() + 3600}
+
+    monkeypatch.setattr(firebase, "init_firebase", lambda: None)
+    monkeypatch.setattr(firebase.auth, "verify_id_token", verify)
+    return calls
+
+
+def test_falls_back_to_sdk_when_keys_not_ready(monkeypatch, sdk):
+    # Constructed but never refreshed: no keys in memory yet
+    monkeypatch.setattr(firebase, "_local_verifier", LocalTokenVerifier(PROJECT_ID, StaticKeySource({})))
+    assert firebase.verify_id_token("sdk-token")["uid"] == "sdk-uid"
+    assert sdk == ["sdk-token"]
+
+
+def test_falls_back_to_sdk_without_local_verifier(monkeypatch, sdk):
+    monkeypatch.setattr(firebase, "_local_verifier", None)
+    decoded = asyncio.run(firebase.verify_id_token_async("sdk-token-async"))
+    assert decoded["uid"] == "sdk-uid"
+    assert sdk == ["sdk-token-async"]
+
+
+def test_sdk_rejection_is_401(monkeypatch, sdk):
+    monkeypatch.setattr(firebase, "_local_verifier", None)
+    with pytest.raises(HTTPException) as exc:
+        firebase.verify_id_token("bad")
+    assert exc.value.status_code == 401
+
+
+def test_ready_local_verifier_skips_sdk(monkeypatch, sdk):
+    monkeypatch.setattr(firebase, "_local_verifier", _verifier())
+    assert firebase.verify_id_token(_token())["uid"] == "uid-1"
+    assert sdk == []
+
+
+def test_start_falls_back_when_keys_cannot_load(monkeypatch):
+    class FailingKeySource:
+        async def fetch(self):
+            raise OSError("certs endpoint unreachable")
+
+    monkeypatch.setattr(firebase.settings, "FIREBASE_LOCAL_VERIFY", True)
+    monkeypatch.setattr(firebase.settings, "FIREBASE_PROJECT_ID", PROJECT_ID)
+    monkeypatch.setattr(firebase, "_local_verifier", None)
+    asyncio.run(firebase.start_token_verifier(FailingKeySource()))
+    assert firebase._local_verifier is None
+
+
+# -------------------------------
+# Server-issued session tokens
+# -------------------------------
+@pytest.fixture
+def session_secret(monkeypatch):
+    monkeypatch.setattr(session.settings, "SESSION_SECRET", "test-secret")
+    monkeypatch.setattr(session.settings, "SESSION_TTL_SECONDS", 3600)
+
+
+def _split(token: str):
+    payload, signature = token[len(session.SESSION_TOKEN_PREFIX):].split(".", 1)
+    return payload, signature
+
+
+def test_session_token_round_trip(session_secret):
+    token, expires_at = session.issue_session_token(7, "uid-7")
+    claims = session.verify_session_token(token)
+    assert claims == {"sub": 7, "uid": "uid-7", "exp": expires_at}
+
+
+@pytest.mark.parametrize("token", [
+    "gh1.",
+    "gh1.no-signature",
+    "gh1..",
+    "gh1.é.x",
+    "gh1.abc.é",
+    "gh1.abc.def",
+    "gh1.!!!.???",
+])
+def test_malformed_session_token_is_rejected(session_secret, token):
+    assert session.verify_session_token(token) is None
+
+
+def test_tampered_session_payload_is_rejected(session_secret):
+    token, _ = session.issue_session_token(7, "uid-7")
+    _, signature = _split(token)
+    forged = session._b64encode(b'{"sub":1,"uid":"uid-1","exp":9999999999}')
+    assert session.verify_session_token(f"{session.SESSION_TOKEN_PREFIX}{forged}.{signature}") is None
+
+
+def test_tampered_session_signature_is_rejected(session_secret):
+    token, _ = session.issue_session_token(7, "uid-7")
+    payload, signature = _split(token)
+    flipped = ("A" if signature[0] != "A" else "B") + signature[1:]
+    assert session.verify_session_token(f"{session.SESSION_TOKEN_PREFIX}{payload}.{flipped}") is None
+
+
+def test_session_token_signed_with_other_secret_is_rejected(session_secret, monkeypatch):
+    token, _ = session.issue_session_token(7, "uid-7")
+    monkeypatch.setattr(session.settings, "SESSION_SECRET", "rotated-secret")
+    assert session.verify_session_token(token) is None
+
+
+def test_expired_session_token_is_rejected(session_secret, monkeypatch):
+    monkeypatch.setattr(session.settings, "SESSION_TTL_SECONDS", -1)
+    token, _ = session.issue_session_token(7, "uid-7")
+    assert session.verify_session_token(token) is None
+
+
+def test_session_tokens_disabled_without_secret(monkeypatch):
+    monkeypatch.setattr(session.settings, "SESSION_SECRET", None)
+    assert session.verify_session_token("gh1.abc.def") is None
+
+
+@pytest.mark.parametrize("token", ["gh1.é.x", "gh1.abc.é", "gh1.abc", "gh1.abc.def"])
+def test_bad_session_token_is_401(session_secret, token):
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(security.get_current_user(authorization=f"Bearer {token}", db=None))
+    assert exc.value.status_code == 401
@@ -0,0 +1,99 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from app.services import em, em_numpy
+
+
+def _ragged(seed: int, n_seq: int = 60, max_len: int = 40):
+    """Ragged 0/1 sequences including empty and length-1 ones, with a per-student skill."""
+    rng = random.Random(seed)
+    sequences = [[], [1], [0], []]
+    for _ in range(n_seq):
+        skill = rng.uniform(0.2, 0.9)
+        sequences.append([int(rng.random() < skill) for _ in range(rng.randint(0, max_len))])
+    rng.shuffle(sequences)
+    return sequences
+
+
+def _reference_log_likelihood(sequences, L0, T, S, G) -> float:
+    """log P(observations) from a plain per-sequence forward pass."""
+    total = 0.0
+    for seq in sequences:
+        p_u, p_k = 1 - L0, L0
+        for t, obs in enumerate(seq):
+            if t > 0:
+                p_u, p_k = p_u * (1 - T), p_u * T + p_k
+            a_u = p_u * (G if obs == 1 else 1 - G)
+            a_k = p_k * (1 - S if obs == 1 else S)
+            total += math.log(a_u + a_k)
+            p_u, p_k = a_u / (a_u + a_k), a_k / (a_u + a_k)
+    return total
+
+
+def _assert_same_fit(fit, expected):
+    for param in ("L0", "T", "S", "G"):
+        assert fit[param] == pytest.approx(expected[param], rel=1e-9, abs=1e-12), param
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_fit_matches_pure_python_em(seed):
+    sequences = _ragged(seed)
+    expected = em.em_fit_bkt(sequences, max_iters=50, tol=1e-8)
+    fit = em_numpy.em_fit_bkt(sequences, max_iters=50, tol=1e-8)
+    _assert_same_fit(fit, expected)
+
+    packed = em_numpy.PackedSequences(sequences)
+    reference = _reference_log_likelihood(sequences, *(expected[p] for p in ("L0", "T", "S", "G")))
+    ll = em_numpy.log_likelihood(packed, fit["L0"], fit["T"], fit["S"], fit["G"])
+    assert ll == pytest.approx(reference, rel=1e-9)
+
+
+def test_fit_from_arrays_matches_pure_python_em():
+    sequences = _ragged(3)
+    flat, lengths = em_numpy.flatten_sequences(sequences)
+    packed = em_numpy.PackedSequences.from_arrays(flat, lengths)
+    assert packed.n_seq == sum(1 for seq in sequences if seq)
+    assert packed.n_obs == sum(len(seq) for seq in sequences)
+
+    init = (0.4, 0.2, 0.1, 0.3)
+    expected = em.em_fit_bkt(sequences, max_iters=30, tol=1e-8, init_params=init)
+    _assert_same_fit(em_numpy.em_fit_bkt(packed, max_iters=30, tol=1e-8, init_params=init), expected)
+
+
+def test_forward_backward_matches_per_sequence():
+    sequences = _ragged(4, n_seq=20, max_len=12)
+    params = (0.3, 0.15, 0.12, 0.22)
+    packed = em_numpy.PackedSequences(sequences)
+    gamma_u, gamma_k, xi = em_numpy.forward_backward(packed, *params)
+
+    # Columns are the non-empty sequences, longest first (stable)
+    non_empty = sorted((seq for seq in sequences if seq), key=len, reverse=True)
+    assert len(non_empty) == packed.n_seq
+    for column, seq in enumerate(non_empty):
+        gamma, xi_seq = em.forward_backward(seq, *params)
+        n = len(seq)
+        np.testing.assert_allclose(gamma_u[:n, column], [g[0] for g in gamma], rtol=1e-12, atol=1e-15)
+        np.testing.assert_allclose(gamma_k[:n, column], [g[1] for g in gamma], rtol=1e-12, atol=1e-15)
+        np.testing.assert_allclose(xi[:n - 1, column], xi_seq, rtol=1e-12, atol=1e-15)
+        assert not gamma_k[n:, column].any()
+
+
+def test_single_length_one_sequence():
+    expected = em.em_fit_bkt([[1]], max_iters=20)
+    _assert_same_fit(em_numpy.em_fit_bkt([[1]], max_iters=20), expected)
+    packed = em_numpy.PackedSequences([[], [1], []])
+    assert (packed.n_seq, packed.max_len) == (1, 1)
+    assert em_numpy.log_likelihood(packed, 0.2, 0.1, 0.15, 0.25) == pytest.approx(
+        _reference_log_likelihood([[1]], 0.2, 0.1, 0.15, 0.25), rel=1e-12,
+    )
+
+
+@pytest.mark.parametrize("sequences", [[], [[]], [[], []]])
+def test_no_answers_is_an_error_in_both(sequences):
+    with pytest.raises(ValueError):
+        em.em_fit_bkt(sequences)
+    with pytest.raises(ValueError):
+        em_numpy.em_fit_bkt(sequences)
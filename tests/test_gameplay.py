@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException, Response
+
+from app.routers import gameplay
+from app.schemas.gameplay import SubmissionCreate
+from app.schemas.sentence_cache import BatchCheckRequest
+from app.services import grammar
+
+
+def test_check_batch_is_graded_at_live_priority(monkeypatch):
+    calls = []
+
+    async def check_sentences(items, deadline=None, priority=grammar.PRIORITY_BATCH):
+        calls.append((items, priority))
+        return [{"is_correct": True, "error_indices": [], "feedback": []} for _ in items]
+
+    monkeypatch.setattr(gameplay, "check_sentences", check_sentences)
+    payload = BatchCheckRequest(items=[{"sentence": "The dog runs.", "kc_id": 2}])
+    response = asyncio.run(gameplay.check_batch(payload, current_user=None, x_request_deadline_ms=None))
+
+    assert calls == [([("The dog runs.", 2)], grammar.PRIORITY_LIVE)]
+    assert response["results"][0]["kc_id"] == 2
+
+
+class FakeUser:
+    id = 7
+
+
+class FakeSession:
+    """Records pool checkouts made through AsyncSession.connection()."""
+
+    def __init__(self):
+        self.checkouts = 0
+
+    async def connection(self):
+        self.checkouts += 1
+
+
+@pytest.fixture
+def submit(monkeypatch):
+    """Run /gameplay/submit with grading and knowledge writes stubbed; returns (call, reads)."""
+    reads = []
+
+    async def get_p_know(db, user_id, kc_id):
+        reads.append((user_id, kc_id))
+        return 0.42
+
+    async def record_answer(db, user_id, kc_id, sentence, feedback):
+        return 0.6
+
+    async def record_ungraded(db, user_id, kc_id, sentence, feedback):
+        ungraded.append((user_id, kc_id, sentence, feedback))
+
+    ungraded = []
+    monkeypatch.setattr(gameplay.knowledge_state, "get_p_know", get_p_know)
+    monkeypatch.setattr(gameplay, "_record_answer", record_answer)
+    monkeypatch.setattr(gameplay, "_record_ungraded", record_ungraded)
+
+    db = FakeSession()
+
+    def call(feedback, backend="postgres"):
+        async def check_sentence(sentence, kc_id=None, deadline=None):
+            return dict(feedback)
+
+        monkeypatch.setattr(gameplay, "check_sentence", check_sentence)
+        monkeypatch.setattr(gameplay.knowledge_state.settings, "KNOWLEDGE_STATE_BACKEND", backend)
+        payload = SubmissionCreate(sentence="The dog runs.", kc_id=3)
+        response = Response()
+        result = asyncio.run(gameplay.submit_sentence(
+            payload, response, db=db, current_user=FakeUser(), x_request_deadline_ms=None,
+        ))
+        return result, response
+
+    call.db = db
+    call.ungraded = ungraded
+    return call, reads
+
+
+GRADED = {"is_correct": True, "error_indices": [], "feedback": []}
+UPSTREAM_BODY = "Sapling API error 500: <html>internal details</html>"
+UNGRADED = {"is_correct": False, "error_indices": [], "feedback": [UPSTREAM_BODY], "upstream_error": UPSTREAM_BODY}
+
+
+def test_submit_checks_out_connection_while_grading_in_postgres_mode(submit):
+    call, reads = submit
+    result, response = call(GRADED)
+    assert reads == []
+    assert call.db.checkouts == 1
+    assert result["p_know"] == 0.6
+    assert "prefetch" not in response.headers["Server-Timing"]
+    assert "connect;dur=" in response.headers["Server-Timing"]
+
+
+def test_degraded_submit_reads_prior_lazily(submit):
+    call, reads = submit
+    result, _ = call(UNGRADED)
+    assert reads == [(7, 3)]
+    assert result["degraded"] is True
+    assert result["p_know"] == 0.42
+
+
+def test_submit_prefetches_state_in_redis_mode(submit):
+    call, reads = submit
+    result, response = call(GRADED, backend="redis")
+    assert reads == [(7, 3)]
+    assert call.db.checkouts == 0
+    assert "prefetch;dur=" in response.headers["Server-Timing"]
+
+
+def test_submit_is_503_when_knowledge_state_is_unavailable(monkeypatch):
+    async def record_answer(db, user_id, kc_id, is_correct):
+        raise gameplay.knowledge_state.KnowledgeStateUnavailable("kstate:{7}:3")
+
+    async def check_sentence(sentence, kc_id=None, deadline=None):
+        return dict(GRADED)
+
+    monkeypatch.setattr(gameplay.knowledge_state, "record_answer", record_answer)
+    monkeypatch.setattr(gameplay, "check_sentence", check_sentence)
+    payload = SubmissionCreate(sentence="The dog runs.", kc_id=3)
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(gameplay.submit_sentence(
+            payload, Response(), db=FakeSession(), current_user=FakeUser(), x_request_deadline_ms=None,
+        ))
+    assert exc.value.status_code == 503
+
+
+def test_degraded_submit_is_recorded_as_ungraded(submit):
+    call, _ = submit
+    result, response = call(UNGRADED)
+    assert call.ungraded == [(7, 3, "The dog runs.", UNGRADED)]
+    assert result["feedback"] == gameplay.UNGRADED_FEEDBACK
+    assert UPSTREAM_BODY not in str(result)
+    assert "write;dur=" in response.headers["Server-Timing"]
+
+
+def test_check_batch_hides_upstream_errors(monkeypatch):
+    async def check_sentences(items, deadline=None, priority=grammar.PRIORITY_BATCH):
+        return [dict(UNGRADED, degraded=True), dict(GRADED)]
+
+    monkeypatch.setattr(gameplay, "check_sentences", check_sentences)
+    payload = BatchCheckRequest(items=[{"sentence": "The dog runs.", "kc_id": 2}, {"sentence": "Hi.", "kc_id": 2}])
+    results = asyncio.run(gameplay.check_batch(payload, current_user=None, x_request_deadline_ms=None))["results"]
+    assert results[0]["feedback"] == gameplay.UNGRADED_FEEDBACK
+    assert results[0]["is_correct"] is False
+    assert results[1]["feedback"] == []
+
+
+def test_ungraded_submission_row_has_no_verdict():
+    from app.crud.submission import submission_values
+
+    row = submission_values(7, 3, "The dog runs.", UNGRADED)
+    assert row["is_correct"] is None
+    assert row["feedback"]["ungraded"] is True
+    assert submission_values(7, 3, "The dog runs.", GRADED)["is_correct"] == 1
@@ -0,0 +1,302 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.scripts import build_answer_bank
+from app.services import grammar
+from app.services.answer_bank import AnswerBank
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.local_grammar import DATA_DIR, LocalGrammarEngine, RuleBasedEngine, load_rule_engine
+
+
+def _lexicon():
+    with open(DATA_DIR / "pos_lexicon.json", "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+# -------------------------------
+# Local engine
+# -------------------------------
+def test_local_engine_base_is_abstract():
+    with pytest.raises(TypeError):
+        LocalGrammarEngine()
+
+
+def test_unknown_rule_names_fail_loudly():
+    with pytest.raises(ValueError, match="determiner_agreement"):
+        RuleBasedEngine(_lexicon(), {"default": ["subject_verb_agreement"], "kcs": {"3": ["determiner_agreement"]}})
+
+
+def test_shipped_rule_sets_load():
+    load_rule_engine()
+
+
+def test_kc_rule_set_limits_what_the_engine_grades():
+    engine = RuleBasedEngine(_lexicon(), {
+        "default": ["subject_verb_agreement", "article_usage"],
+        "kcs": {"1": ["subject_verb_agreement"]},
+    })
+    # a/an is outside KC 1's rules: fall through to Sapling there, graded elsewhere
+    assert engine.check("A apple is red.", kc_id=1) is None
+    assert engine.check("A apple is red.", kc_id=2)["error_indices"] == [0]
+    assert engine.check("A apple is red.")["error_indices"] == [0]
+
+    verdict = engine.check("The dogs runs home.", kc_id=1)
+    assert verdict["is_correct"] is False
+    assert verdict["error_indices"] == [2]
+    assert verdict["feedback"] == ["Replace 'runs' with 'run'"]
+
+
+class RecordingEngine(LocalGrammarEngine):
+    def __init__(self):
+        self.calls = []
+
+    def check(self, sentence, kc_id=None):
+        self.calls.append((sentence, kc_id))
+        return {"is_correct": True, "error_indices": [], "feedback": [], "rules": []}
+
+
+@pytest.fixture
+def local_engine(monkeypatch):
+    async def no_cache(*args, **kwargs):
+        return None
+
+    async def no_cache_many(keys):
+        return [None] * len(keys)
+
+    engine = RecordingEngine()
+    monkeypatch.setattr(grammar, "get_sentence_cache", no_cache)
+    monkeypatch.setattr(grammar, "get_sentence_cache_many", no_cache_many)
+    monkeypatch.setattr(grammar, "_answer_bank_check", lambda sentence: None)
+    monkeypatch.setattr(grammar, "_local_engine_loaded", True)
+    monkeypatch.setattr(grammar, "_local_engine", engine)
+    return engine
+
+
+def test_check_sentence_passes_kc_to_local_engine(local_engine):
+    result = asyncio.run(grammar.check_sentence("The dog runs.", 4))
+    assert result["source"] == "local"
+    assert local_engine.calls == [("The dog runs.", 4)]
+
+
+def test_check_sentences_passes_kc_to_local_engine(local_engine):
+    asyncio.run(grammar.check_sentences([("The dog runs.", 4), ("The cat runs.", None)]))
+    assert local_engine.calls == [("The dog runs.", 4), ("The cat runs.", None)]
+
+
+# -------------------------------
+# Answer bank
+# -------------------------------
+def test_answer_bank_keeps_sapling_edit_count(tmp_path, monkeypatch):
+    path = tmp_path / "bank.bin"
+    # One Sapling edit spanning two tokens, and a locally graded verdict
+    AnswerBank.dump(str(path), [
+        ("The dog run across the street.", {
+            "is_correct": False, "error_indices": [2, 3], "feedback": ["Replace 'run across' with 'runs across'"],
+            "scores": {"sapling_edits": 1},
+        }),
+        ("The dog runs.", {"is_correct": True, "error_indices": [], "feedback": [], "scores": {"sapling_edits": 0}}),
+    ])
+    monkeypatch.setattr(grammar, "_answer_bank_loaded", True)
+    monkeypatch.setattr(grammar, "_answer_bank", AnswerBank.load(str(path)))
+
+    banked = grammar._answer_bank_check("The dog run across the street.")
+    assert banked["scores"] == {"sapling_edits": 1}
+    assert banked["error_indices"] == [2, 3]
+    assert "sapling_edits" not in banked
+    assert grammar._answer_bank_check("The dog runs.")["scores"] == {"sapling_edits": 0}
+
+
+def test_enumeration_grades_near_misses_first():
+    level = {
+        "tile_sets": [["Dog", "Across", "Street", "Run", "Runs", "The", "The"]],
+        "punctuation": ["."],
+        "sentences": ["The dog runs across the street."],
+    }
+    first = list(build_answer_bank._enumerate(level, min_words=3, max_per_set=20))
+    assert first[0] == "The dog runs across the street."
+    assert "The dog run across the street." in first
+    assert "Dog the runs across the street." in first
+    # Plain tile order (what enumeration used to start with) is many edits away
+    assert "Dog across street run runs the the." not in first
+    assert len(first) == 20
+
+
+# -------------------------------
+# Circuit breaker vs. caller deadlines
+# -------------------------------
+class SlowSapling:
+    """Stands in for the pooled httpx client: a healthy upstream that takes `delay` seconds."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def post(self, url, json):
+        await asyncio.sleep(self.delay)
+        return httpx.Response(200, json={"edits": []})
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker("sapling-test", window_size=10, min_calls=2, open_seconds=0)
+    monkeypatch.setattr(grammar, "_breaker", breaker)
+    return breaker
+
+
+def test_caller_deadline_does_not_trip_breaker(monkeypatch, breaker):
+    monkeypatch.setattr(grammar, "_get_http_client", lambda: SlowSapling(1.0))
+
+    async def impatient_callers():
+        for _ in range(4):
+            permit = breaker.allow()
+            assert permit is not None
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(grammar._send_sapling_request("Zorg blips home.", permit), 0.01)
+
+    asyncio.run(impatient_callers())
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.stats()["window_calls"] == 0
+
+
+def test_cancelled_half_open_probe_frees_its_slot(monkeypatch, breaker):
+    monkeypatch.setattr(grammar, "_get_http_client", lambda: SlowSapling(1.0))
+    breaker._trip()
+
+    async def probe():
+        permit = breaker.allow()
+        assert permit is not None
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(grammar._send_sapling_request("Zorg blips home.", permit), 0.01)
+
+    asyncio.run(probe())
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow() is not None
+
+
+def test_upstream_timeouts_still_trip_breaker(monkeypatch, breaker):
+    monkeypatch.setattr(grammar, "_get_http_client", lambda: SlowSapling(1.0))
+    monkeypatch.setattr(grammar.settings, "SAPLING_CALL_TIMEOUT", 0.01)
+
+    async def timeouts():
+        for _ in range(2):
+            permit = breaker.allow()
+            assert permit is not None
+            result = await grammar._send_sapling_request("Zorg blips home.", permit)
+            assert result == {"error": "Sapling API timed out"}
+
+    asyncio.run(timeouts())
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_call_admitted_while_closed_does_not_stand_in_for_a_probe(breaker):
+    straggler = breaker.allow()
+    breaker._trip()
+    probe = breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow() is None
+
+    # The pre-trip call finishes healthy mid-probe: it neither closes the
+    # circuit nor frees the probe slot
+    breaker.record(straggler, True, 0.0)
+    breaker.release(straggler)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow() is None
+
+    breaker.record(probe, True, 0.0)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_probe_from_an_earlier_half_open_period_is_ignored(breaker):
+    breaker._trip()
+    stale_probe = breaker.allow()
+    breaker._trip()  # e.g. another probe failed and re-opened the circuit
+    probe = breaker.allow()
+
+    breaker.record(stale_probe, False, 0.0)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    breaker.record(probe, True, 0.0)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+# -------------------------------
+# Canonical cache sharing
+# -------------------------------
+@pytest.fixture
+def fake_upstream(monkeypatch):
+    """In-memory sentence cache and a scripted Sapling keyed by exact text."""
+    cache = {}
+    responses = {}
+    sent = []
+
+    async def get_cache(key, kc_id):
+        payload = cache.get((key, kc_id))
+        return dict(payload) if payload is not None else None
+
+    async def set_cache(key, kc_id, payload):
+        cache[(key, kc_id)] = dict(payload)
+
+    async def nothing(*args, **kwargs):
+        return None
+
+    async def lock(*args, **kwargs):
+        return "token"
+
+    async def sapling(sentence, priority=grammar.PRIORITY_LIVE):
+        sent.append(sentence)
+        return {"edits": [{**edit, "sentence_start": 0} for edit in responses.get(sentence, [])]}
+
+    monkeypatch.setattr(grammar, "get_sentence_cache", get_cache)
+    monkeypatch.setattr(grammar, "set_sentence_cache", set_cache)
+    monkeypatch.setattr(grammar, "get_negative_cache", nothing)
+    monkeypatch.setattr(grammar, "set_negative_cache", nothing)
+    monkeypatch.setattr(grammar, "acquire_sentence_lock", lock)
+    monkeypatch.setattr(grammar, "release_sentence_lock", nothing)
+    monkeypatch.setattr(grammar, "_sapling_check", sapling)
+    monkeypatch.setattr(grammar, "_answer_bank_check", lambda sentence: None)
+    monkeypatch.setattr(grammar, "_local_engine_loaded", True)
+    monkeypatch.setattr(grammar, "_local_engine", None)
+    return responses, sent
+
+
+def test_whitespace_only_edit_is_not_an_error(fake_upstream):
+    responses, sent = fake_upstream
+    # Sapling asks to attach the detached full stop; the cache key ignores that
+    responses["Zorg blips home ."] = [{"start": 15, "end": 17, "replacement": "."}]
+
+    detached = asyncio.run(grammar.check_sentence("Zorg blips home ."))
+    attached = asyncio.run(grammar.check_sentence("Zorg blips home."))
+
+    assert sent == ["Zorg blips home ."]
+    assert attached["from_cache"] is True
+    for result in (detached, attached):
+        assert result["is_correct"] is True
+        assert result["error_indices"] == []
+        assert result["feedback"] == []
+
+
+def test_real_edit_is_shared_across_spellings(fake_upstream):
+    responses, sent = fake_upstream
+    responses["Zorg blip home ."] = [
+        {"start": 5, "end": 9, "replacement": "blips"},
+        {"start": 14, "end": 16, "replacement": "."},
+    ]
+
+    detached = asyncio.run(grammar.check_sentence("Zorg blip home ."))
+    attached = asyncio.run(grammar.check_sentence("Zorg  blip home."))
+
+    assert sent == ["Zorg blip home ."]
+    for result in (detached, attached):
+        assert result["is_correct"] is False
+        assert result["error_indices"] == [1]
+        assert result["feedback"] == ["Replace 'blip' with 'blips'"]
+        assert result["scores"]["sapling_edits"] == 1
+
+
+def test_missing_punctuation_insertion_still_fails(fake_upstream):
+    responses, _ = fake_upstream
+    responses["Zorg blips home"] = [{"start": 15, "end": 15, "replacement": "."}]
+    assert asyncio.run(grammar.check_sentence("Zorg blips home"))["is_correct"] is False
@@ -0,0 +1,153 @@
+import pytest
+
+from app.crud import knowledge as knowledge_crud
+from app.services import bkt_refit, knowledge_state
+from app.services.bkt import update_bkt
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def redis(monkeypatch, db_sessionmaker):
+    """Redis-mode knowledge state on fakeredis (with Lua) over the SQLite database."""
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(knowledge_state, "redis", redis)
+    monkeypatch.setattr(knowledge_state, "AsyncSessionLocal", db_sessionmaker)
+    monkeypatch.setattr(knowledge_state.settings, "KNOWLEDGE_STATE_BACKEND", "redis")
+    yield redis
+    await redis.aclose()
+
+
+async def _row(db_sessionmaker, user_id, kc_id):
+    async with db_sessionmaker() as db:
+        return await knowledge_crud.get_knowledge_row(db, user_id, kc_id)
+
+
+async def _answer(db_sessionmaker, user_id, kc_id, is_correct):
+    async with db_sessionmaker() as db:
+        return await knowledge_state.record_answer(db, user_id, kc_id, is_correct)
+
+
+# -------------------------------
+# Lua BKT step
+# -------------------------------
+@pytest.mark.parametrize("prior", [0.0, 1e-6, 0.2, 0.5, 0.93, 1.0])
+@pytest.mark.parametrize("params", [(0.1, 0.2, 0.15), (0.07, 0.31, 0.22), (0.3, 0.01, 0.5)])
+@pytest.mark.parametrize("is_correct", [True, False])
+async def test_lua_step_is_bit_identical_to_update_bkt(redis, prior, params, is_correct):
+    slip, guess, transit = params
+    key = knowledge_state._state_key(1, 10)
+    p_know = await redis.eval(
+        knowledge_state._UPDATE_BKT_SCRIPT, 3, key, knowledge_state._dirty_key(1), knowledge_state._index_key(1),
+        10, 1 if is_correct else 0, 60, repr(prior), 0, 0, repr(slip), repr(guess), repr(transit),
+    )
+    assert float(p_know) == update_bkt(prior, is_correct, slip, guess, transit)
+    assert float(await redis.hget(key, "p_know")) == float(p_know)
+
+
+async def test_answer_sequence_is_bit_identical_to_update_bkt(redis, db_sessionmaker):
+    answers = [True, False, True, True, False, False, True, True, True, False, True, True]
+    expected = knowledge_crud.DEFAULT_P_KNOW
+    for is_correct in answers:
+        expected = update_bkt(
+            expected, is_correct,
+            knowledge_crud.DEFAULT_SLIP, knowledge_crud.DEFAULT_GUESS, knowledge_crud.DEFAULT_TRANSIT,
+        )
+        assert await _answer(db_sessionmaker, 1, 10, is_correct) == expected
+
+    assert await knowledge_state.flush_dirty() == 1
+    row = await _row(db_sessionmaker, 1, 10)
+    assert row.p_know == expected
+    assert (row.attempts, row.correct) == (len(answers), sum(answers))
+
+
+# -------------------------------
+# Redis failures
+# -------------------------------
+async def test_answer_fails_closed_when_redis_is_down(redis, db_sessionmaker, monkeypatch):
+    await _answer(db_sessionmaker, 1, 10, True)
+
+    def down(*args, **kwargs):
+        raise ConnectionError("redis unavailable")
+
+    monkeypatch.setattr(redis, "pipeline", down)
+    with pytest.raises(knowledge_state.KnowledgeStateUnavailable):
+        await _answer(db_sessionmaker, 1, 10, False)
+    # Nothing went to Postgres behind the (unflushed) hash's back
+    assert await _row(db_sessionmaker, 1, 10) is None
+
+    monkeypatch.delattr(redis, "pipeline")
+    await knowledge_state.flush_dirty()
+    assert (await _row(db_sessionmaker, 1, 10)).attempts == 1
+
+
+async def test_failed_flush_keeps_dirty_markers(redis, db_sessionmaker, monkeypatch):
+    await _answer(db_sessionmaker, 1, 10, True)
+    await _answer(db_sessionmaker, 2, 10, False)
+    upsert = knowledge_crud.upsert_knowledge_states
+
+    async def db_down(db, rows):
+        raise ConnectionError("database unavailable")
+
+    monkeypatch.setattr(knowledge_crud, "upsert_knowledge_states", db_down)
+    with pytest.raises(ConnectionError):
+        await knowledge_state.flush_dirty()
+    assert await redis.smembers(knowledge_state.DIRTY_USERS_KEY) == {"1", "2"}
+    assert await redis.smembers(knowledge_state._dirty_key(1)) == {"10"}
+
+    monkeypatch.setattr(knowledge_crud, "upsert_knowledge_states", upsert)
+    assert await knowledge_state.flush_dirty() == 2
+    assert await redis.smembers(knowledge_state._dirty_key(1)) == set()
+
+
+async def test_flush_failing_before_the_write_keeps_dirty_markers(redis, db_sessionmaker):
+    await _answer(db_sessionmaker, 1, 10, True)
+    key = knowledge_state._state_key(1, 10)
+    p_know = await redis.hget(key, "p_know")
+    await redis.hset(key, "p_know", "not-a-number")
+
+    with pytest.raises(ValueError):
+        await knowledge_state.flush_dirty()
+    assert await redis.smembers(knowledge_state._dirty_key(1)) == {"10"}
+
+    await redis.hset(key, "p_know", p_know)
+    assert await knowledge_state.flush_dirty() == 1
+
+
+async def test_answer_during_flush_stays_dirty(redis, db_sessionmaker, monkeypatch):
+    await _answer(db_sessionmaker, 1, 10, True)
+    upsert = knowledge_crud.upsert_knowledge_states
+
+    async def answer_lands_mid_flush(db, rows):
+        monkeypatch.setattr(knowledge_crud, "upsert_knowledge_states", upsert)
+        await _answer(db_sessionmaker, 1, 10, True)
+        await upsert(db, rows)
+
+    monkeypatch.setattr(knowledge_crud, "upsert_knowledge_states", answer_lands_mid_flush)
+    assert await knowledge_state._flush_users([1]) == 1
+    assert (await _row(db_sessionmaker, 1, 10)).attempts == 1
+    assert await redis.smembers(knowledge_state._dirty_key(1)) == {"10"}
+
+    await knowledge_state.flush_dirty()
+    assert (await _row(db_sessionmaker, 1, 10)).attempts == 2
+    assert await redis.smembers(knowledge_state._dirty_key(1)) == set()
+
+
+# -------------------------------
+# Fitted per-KC parameters
+# -------------------------------
+async def test_new_state_hash_starts_from_fitted_params(redis, db_sessionmaker):
+    async with db_sessionmaker() as db:
+        await bkt_refit.write_params(db, {10: {"L0": 0.4, "T": 0.31, "S": 0.07, "G": 0.26}})
+        await db.commit()
+
+    p_know = await _answer(db_sessionmaker, 1, 10, True)
+    assert p_know == update_bkt(knowledge_crud.DEFAULT_P_KNOW, True, 0.07, 0.26, 0.31)
+    state = await redis.hgetall(knowledge_state._state_key(1, 10))
+    assert (float(state["slip"]), float(state["guess"]), float(state["transit"])) == (0.07, 0.26, 0.31)
+
+    await knowledge_state.flush_dirty()
+    row = await _row(db_sessionmaker, 1, 10)
+    assert (row.slip, row.guess, row.transit) == (0.07, 0.26, 0.31)
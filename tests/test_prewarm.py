@@ -0,0 +1,119 @@
+import pytest
+
+from app.services import prewarm
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def job(monkeypatch, db_sessionmaker):
+    """The startup prewarm job on fakeredis and an empty database; returns the runs it made."""
+    fakeredis = pytest.importorskip("fakeredis")
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    runs = []
+    run = prewarm.prewarm_sentence_cache
+
+    async def counted(*args, **kwargs):
+        runs.append(1)
+        return await run(*args, **kwargs)
+
+    monkeypatch.setattr(prewarm, "redis", redis)
+    monkeypatch.setattr(prewarm, "AsyncSessionLocal", db_sessionmaker)
+    monkeypatch.setattr(prewarm, "prewarm_sentence_cache", counted)
+    monkeypatch.setattr(prewarm.settings, "PREWARM_STARTUP_DELAY_SECONDS", 0)
+    monkeypatch.setattr(prewarm.settings, "PREWARM_ON_STARTUP", False)
+    monkeypatch.setattr(prewarm.settings, "PREWARM_ON_CACHE_FORMAT_CHANGE", True)
+    yield redis, runs
+    await redis.aclose()
+
+
+def test_done_marker_names_the_key_format():
+    assert prewarm.PREWARM_DONE_KEY == "prewarm:done:sc3"
+
+
+async def test_new_key_format_is_warmed_once(job):
+    redis, runs = job
+    await prewarm._run_prewarm_job()
+    assert runs == [1]
+    assert await redis.exists(prewarm.PREWARM_DONE_KEY)
+
+    # Next deploy of the same format, after the lock has expired
+    await redis.delete(prewarm.PREWARM_LOCK_KEY)
+    await prewarm._run_prewarm_job()
+    assert runs == [1]
+
+
+async def test_prewarm_on_startup_runs_every_time(job, monkeypatch):
+    redis, runs = job
+    monkeypatch.setattr(prewarm.settings, "PREWARM_ON_STARTUP", True)
+    await redis.set(prewarm.PREWARM_DONE_KEY, "earlier")
+    await prewarm._run_prewarm_job()
+    assert runs == [1]
+
+
+async def test_failed_run_leaves_the_format_unwarmed(job, monkeypatch):
+    redis, runs = job
+
+    async def broken(*args, **kwargs):
+        raise ConnectionError("database unavailable")
+
+    monkeypatch.setattr(prewarm, "scan_submissions", broken)
+    await prewarm._run_prewarm_job()
+    assert not await redis.exists(prewarm.PREWARM_DONE_KEY)
+
+
+# -------------------------------
+# Reusing stored verdicts
+# -------------------------------
+def _feedback(**overrides):
+    feedback = {"is_correct": False, "error_indices": [1], "feedback": ["Replace 'run' with 'runs'"]}
+    feedback.update(overrides)
+    return feedback
+
+
+def test_only_verdicts_stamped_with_the_current_key_format_are_reused():
+    from app.crud.submission import submission_values
+
+    stored = submission_values(1, 2, "The dog run.", {**_feedback(), "from_cache": True})["feedback"]
+    assert stored["cache_key_format"] == "sc3"
+    assert prewarm._reusable_payload(stored) == _feedback()
+
+    # Graded before the canonical key: possibly another spelling's verdict
+    assert prewarm._reusable_payload(_feedback()) is None
+    assert prewarm._reusable_payload(_feedback(cache_key_format="sc2")) is None
+
+
+async def test_old_verdicts_are_regraded_not_imported(db_sessionmaker, monkeypatch):
+    from app.models import Submission
+
+    async with db_sessionmaker() as db:
+        db.add_all([
+            Submission(user_id=1, kc_id=2, sentence="The dog run.", is_correct=0, feedback=_feedback()),
+            Submission(user_id=1, kc_id=2, sentence="The cat sit.", is_correct=0,
+                       feedback=_feedback(cache_key_format="sc3")),
+        ])
+        await db.commit()
+
+    written, graded = [], []
+
+    async def nothing_cached(items):
+        return [None] * len(items)
+
+    async def write(items, fill_l1=True):
+        written.extend(key for key, _, _ in items)
+        return len(items)
+
+    async def check_sentence(sentence, kc_id=None, priority=None):
+        graded.append(sentence)
+        return {"is_correct": True, "error_indices": [], "feedback": [], "source": "sapling"}
+
+    monkeypatch.setattr(prewarm, "AsyncSessionLocal", db_sessionmaker)
+    monkeypatch.setattr(prewarm, "get_sentence_cache_many", nothing_cached)
+    monkeypatch.setattr(prewarm, "set_sentence_cache_many", write)
+    monkeypatch.setattr(prewarm.grammar, "check_sentence", check_sentence)
+    monkeypatch.setattr(prewarm, "redis", pytest.importorskip("fakeredis").FakeAsyncRedis())
+
+    report = await prewarm.prewarm_sentence_cache(lookback_days=None)
+    assert graded == ["The dog run."]
+    assert len(written) == 1
+    assert (report["warmed_from_history"], report["warmed_from_upstream"]) == (1, 1)
@@ -0,0 +1,110 @@
+import pytest
+from sqlalchemy import func, select
+
+from app.models import Submission
+from app.services import submission_writer
+from app.services.submission_writer import SPOOL_STREAM_KEY, SubmissionWriter
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def spool(monkeypatch, db_sessionmaker):
+    """A fakeredis spool and the SQLite database behind the writer."""
+    fakeredis = pytest.importorskip("fakeredis")
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(submission_writer, "redis", redis)
+    monkeypatch.setattr(submission_writer, "AsyncSessionLocal", db_sessionmaker)
+    yield redis
+    await redis.aclose()
+
+
+async def _stored(db_sessionmaker) -> int:
+    async with db_sessionmaker() as db:
+        return await db.scalar(select(func.count()).select_from(Submission))
+
+
+def _feedback():
+    return {"is_correct": True, "error_indices": []}
+
+
+async def test_replay_of_rows_a_live_worker_still_holds_is_not_duplicated(spool, db_sessionmaker, monkeypatch):
+    writer = SubmissionWriter(flush_size=10, spool=True, recover_age=0)
+    for i in range(3):
+        await writer.enqueue(1, 1, f"Sentence {i}.", _feedback())
+
+    # The database is down for this worker longer than recover_age
+    write = writer._write
+
+    async def outage(rows):
+        raise ConnectionError("database unavailable")
+
+    monkeypatch.setattr(writer, "_write", outage)
+    await writer.flush(drain=True)
+    assert writer.stats()["pending"] == 3
+
+    # Another worker decides the rows are abandoned and replays them
+    assert await SubmissionWriter(spool=True, recover_age=0).recover() == 3
+    assert await spool.xlen(SPOOL_STREAM_KEY) == 0
+
+    # The original owner's retry succeeds afterwards
+    monkeypatch.setattr(writer, "_write", write)
+    await writer.flush(drain=True)
+    assert writer.stats()["pending"] == 0
+    assert await _stored(db_sessionmaker) == 3
+
+
+async def test_failed_unspool_replay_is_not_duplicated(spool, db_sessionmaker, monkeypatch):
+    writer = SubmissionWriter(flush_size=10, spool=True, recover_age=0)
+    for i in range(2):
+        await writer.enqueue(1, 1, f"Sentence {i}.", _feedback())
+
+    async def xdel_down(*args):
+        raise ConnectionError("redis unavailable")
+
+    monkeypatch.setattr(spool, "xdel", xdel_down)
+    await writer.flush(drain=True)
+    monkeypatch.delattr(spool, "xdel")
+    assert await spool.xlen(SPOOL_STREAM_KEY) == 2
+
+    assert await writer.recover() == 2
+    assert await spool.xlen(SPOOL_STREAM_KEY) == 0
+    assert await _stored(db_sessionmaker) == 2
+
+
+async def test_rows_without_a_key_are_still_inserted(db_sessionmaker):
+    from app.crud.submission import insert_submissions, submission_values
+
+    rows = [submission_values(1, 1, "Same sentence.", _feedback()) for _ in range(2)]
+    async with db_sessionmaker() as db:
+        await insert_submissions(db, rows)
+        await db.commit()
+    assert await _stored(db_sessionmaker) == 2
+
+
+async def test_rejected_row_does_not_block_the_batch(spool, db_sessionmaker):
+    writer = SubmissionWriter(flush_size=10, spool=True, recover_age=0)
+    for i in range(7):
+        # NOT NULL violation: the database refuses this row whatever the retry
+        await writer.enqueue(1, 1, None if i == 4 else f"Sentence {i}.", _feedback())
+
+    await writer.flush(drain=True)
+    stats = writer.stats()
+    assert (stats["pending"], stats["rejected"], stats["failed_flushes"]) == (0, 1, 0)
+    assert await _stored(db_sessionmaker) == 6
+    # Not left in the spool for recover() to replay
+    assert await spool.xlen(SPOOL_STREAM_KEY) == 0
+
+    await writer.enqueue(1, 1, "Later sentence.", _feedback())
+    await writer.flush(drain=True)
+    assert await _stored(db_sessionmaker) == 7
+
+
+async def test_recovery_skips_rejected_rows(spool, db_sessionmaker):
+    writer = SubmissionWriter(flush_size=10, spool=True, recover_age=0)
+    await writer.enqueue(1, 1, "Good sentence.", _feedback())
+    await writer.enqueue(1, 1, None, _feedback())
+    # The owning worker died before flushing
+    assert await SubmissionWriter(spool=True, recover_age=0).recover() == 2
+    assert await spool.xlen(SPOOL_STREAM_KEY) == 0
+    assert await _stored(db_sessionmaker) == 1
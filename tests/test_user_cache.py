@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from app.crud import user as crud_user
+from app.routers import users as users_router
+from app.schemas.user import UserUpdate
+from app.utils import user_cache
+from app.utils.ttl_cache import TTLCache
+from app.utils.user_cache import USER_INVALIDATE_CHANNEL
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def redis(monkeypatch):
+    """Fakeredis behind the cache and an empty L1 for this worker."""
+    fakeredis = pytest.importorskip("fakeredis")
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(user_cache, "redis", redis)
+    monkeypatch.setattr(user_cache, "_local_users", TTLCache(max_entries=16, default_ttl=60))
+    yield redis
+    await user_cache.stop_user_cache_listener()
+    await redis.aclose()
+
+
+async def _cached_user(db):
+    user, _ = await crud_user.get_or_create_from_firebase(db, "uid-1", "a@example.com", "Ada")
+    await user_cache.cache_user(user)
+    return user
+
+
+async def _assert_evicted(redis, firebase_uid):
+    assert user_cache._local_users.get(firebase_uid) is None
+    assert await redis.get(user_cache._user_key(firebase_uid)) is None
+    assert await user_cache.get_cached_user(firebase_uid) is None
+
+
+async def test_cache_user_fills_both_tiers(redis, db_sessionmaker):
+    async with db_sessionmaker() as db:
+        user = await _cached_user(db)
+
+    assert user_cache._local_users.get("uid-1").display_name == "Ada"
+    assert "Ada" in await redis.get(user_cache._user_key("uid-1"))
+
+
+async def test_redis_hit_repopulates_l1(redis, db_sessionmaker):
+    async with db_sessionmaker() as db:
+        await _cached_user(db)
+    user_cache._local_users.pop("uid-1")
+
+    snapshot = await user_cache.get_cached_user("uid-1")
+
+    assert snapshot.display_name == "Ada"
+    assert user_cache._local_users.get("uid-1") == snapshot
+
+
+async def test_update_user_evicts_both_tiers(redis, db_sessionmaker):
+    async with db_sessionmaker() as db:
+        user = await _cached_user(db)
+        await crud_user.update_user(db, user, UserUpdate(display_name="Grace", grade_level="5"))
+
+    await _assert_evicted(redis, "uid-1")
+
+
+async def test_update_display_name_evicts_both_tiers(redis, db_sessionmaker):
+    async with db_sessionmaker() as db:
+        user = await _cached_user(db)
+        result = await users_router.update_display_name(
+            users_router.DisplayNameUpdate(display_name="Grace"), db=db, current_user=user
+        )
+
+    assert result == {"display_name": "Grace"}
+    await _assert_evicted(redis, "uid-1")
+
+
+async def _wait_for(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not await condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+async def test_invalidation_from_another_worker_clears_l1(redis, db_sessionmaker):
+    async with db_sessionmaker() as db:
+        await _cached_user(db)
+
+    user_cache.start_user_cache_listener()
+
+    async def subscribed():
+        return dict(await redis.pubsub_numsub(USER_INVALIDATE_CHANNEL))[USER_INVALIDATE_CHANNEL] > 0
+
+    await _wait_for(subscribed)
+
+    # Another worker's invalidate_user: its own L1 and Redis are handled there,
+    # this worker only hears the message
+    await redis.publish(USER_INVALIDATE_CHANNEL, "uid-1")
+
+    async def evicted():
+        return user_cache._local_users.get("uid-1") is None
+
+    await _wait_for(evicted)
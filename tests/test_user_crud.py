@@ -0,0 +1,59 @@
+import pytest
+from sqlalchemy import func, select
+
+from app.crud import user as crud_user
+from app.models import User
+
+pytestmark = pytest.mark.anyio
+
+
+async def _users(db_sessionmaker) -> int:
+    async with db_sessionmaker() as db:
+        return await db.scalar(select(func.count()).select_from(User))
+
+
+async def test_first_login_creates_the_user(db_sessionmaker):
+    async with db_sessionmaker() as db:
+        user, is_new = await crud_user.get_or_create_from_firebase(db, "uid-1", "a@example.com", "Ada")
+
+    assert is_new
+    assert user.id is not None
+    assert user.display_name == "Ada"
+    assert await _users(db_sessionmaker) == 1
+
+
+async def test_returning_login_does_not_insert(db_sessionmaker):
+    async with db_sessionmaker() as db:
+        first, _ = await crud_user.get_or_create_from_firebase(db, "uid-1", "a@example.com", "Ada")
+    async with db_sessionmaker() as db:
+        again, is_new = await crud_user.get_or_create_from_firebase(db, "uid-1", "a@example.com", "Renamed")
+
+    assert not is_new
+    assert again.id == first.id
+    assert again.display_name == "Ada"
+    assert await _users(db_sessionmaker) == 1
+
+
+async def test_losing_the_insert_race_returns_the_winners_row(db_sessionmaker, monkeypatch):
+    async with db_sessionmaker() as db:
+        winner, _ = await crud_user.get_or_create_from_firebase(db, "uid-1", "a@example.com", "Ada")
+
+    # The concurrent login commits between this request's SELECT and INSERT
+    lookup = crud_user.get_by_firebase_uid
+    misses = []
+
+    async def stale_lookup(db, firebase_uid):
+        if not misses:
+            misses.append(firebase_uid)
+            return None
+        return await lookup(db, firebase_uid)
+
+    monkeypatch.setattr(crud_user, "get_by_firebase_uid", stale_lookup)
+
+    async with db_sessionmaker() as db:
+        user, is_new = await crud_user.get_or_create_from_firebase(db, "uid-1", "a@example.com", "Ada")
+
+    assert misses == ["uid-1"]
+    assert not is_new
+    assert user.id == winner.id
+    assert await _users(db_sessionmaker) == 1